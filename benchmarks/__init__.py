@@ -0,0 +1,4 @@
+'''
+benchmarks--tools to measure the performance of "PrivateChatRoom-App"
+               against a local stand-in for the 'PrivateChatRoom-Server'.
+'''
@@ -0,0 +1,110 @@
+#!/bin/env python3
+# -*- mode: python; coding: utf-8 -*-
+
+# Script by Thomas Pirchmoser (tommy_software@mailfence.com) 2024
+
+# This script was created for personal/educational purposes only and is not to
+#   be used for commercial or profit purposes.
+
+'''
+compare.py--compare two result files of benchmarks.load (or startup).
+
+               For every scenario found in both files the throughput, the
+               latency percentiles and the cpu time are printed side by side
+               with the change in percent.
+
+               usage: python -m benchmarks.compare BEFORE.json AFTER.json
+'''
+
+import argparse
+import json
+
+# (label, path in the scenario result, True if higher is better)
+METRICS = (("msg/s", ("msgs_per_sec",), True),
+           ("p50 ms", ("latency_ms", "p50"), False),
+           ("p95 ms", ("latency_ms", "p95"), False),
+           ("p99 ms", ("latency_ms", "p99"), False),
+           ("cpu s", ("cpu_seconds_total",), False),
+           ("wire in", ("wire_bytes_in",), False),
+           ("wire out", ("wire_bytes_out",), False),
+           ("start ms", ("cold_start_ms", "p50"), False),
+           ("rss MB", ("rss_end_mb",), False),
+           ("threads", ("threads",), False),
+           ("rss MB", ("rss_mb",), False))
+
+
+def load(path):
+    ''' Read a result file. '''
+
+    with open(path, encoding="utf-8") as infile:
+        return json.load(infile)
+
+
+def lookup(result, path):
+    ''' Return the value at path in a scenario result, None if missing. '''
+
+    for key in path:
+        if not isinstance(result, dict):
+            return None
+        result = result.get(key)
+
+    return result
+
+
+def change(before, after, higher_is_better):
+    ''' Return the change in percent as text, marked if it got worse. '''
+
+    if before is None or after is None or before == 0:
+        return "-"
+
+    percent = (after - before) / before * 100
+    worse = percent < 0 if higher_is_better else percent > 0
+
+    return f"{percent:+.1f}%{' !' if worse and abs(percent) >= 5 else ''}"
+
+
+def compare(before, after):
+    ''' Return the lines of the comparison of two reports. '''
+
+    lines = [f"before: {before.get('commit')} ({before.get('time')})",
+             f"after:  {after.get('commit')} ({after.get('time')})"]
+
+    for scenario, old in before["scenarios"].items():
+        new = after["scenarios"].get(scenario)
+        if new is None:
+            continue
+
+        lines.append("")
+        lines.append(f"{scenario}:")
+
+        for label, path, higher_is_better in METRICS:
+            old_value = lookup(old, path)
+            new_value = lookup(new, path)
+
+            # Not measured by this benchmark.
+            if old_value is None and new_value is None:
+                continue
+
+            lines.append(f"  {label:>8}: {str(old_value):>10} ->"
+                         f" {str(new_value):>10}"
+                         f"  {change(old_value, new_value, higher_is_better)}")
+
+    return lines
+
+
+def main(argv=None):
+    ''' Print the comparison of two result files. '''
+
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.compare",
+                                     description="compare two load "
+                                                 "benchmark results")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args(argv)
+
+    for line in compare(load(args.before), load(args.after)):
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
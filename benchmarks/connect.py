@@ -0,0 +1,103 @@
+#!/bin/env python3
+# -*- mode: python; coding: utf-8 -*-
+
+# Script by Thomas Pirchmoser (tommy_software@mailfence.com) 2024
+
+# This script was created for personal/educational purposes only and is not to
+#   be used for commercial or profit purposes.
+
+'''
+connect.py--compare the time to connect with plain TCP, a full TLS handshake
+               and a resumed TLS session.
+
+               A plain and a TLS stand-in server (self-signed certificate)
+               run on loopback. Every connect is timed until the alias
+               request of the server has arrived, the p50/p95 and mean are
+               reported in milliseconds.
+
+               usage: python -m benchmarks.connect [--connects N]
+'''
+
+import argparse
+import tempfile
+import time
+from pcr_app_utils import app_server_connection
+from pcr_app_utils import app_tls
+from benchmarks import stand_in_server
+from benchmarks.load import percentile
+
+HOST = "127.0.0.1"
+
+
+def connect_once(port, settings=None):
+    ''' Return the milliseconds until the server asks for the alias. '''
+
+    start = time.perf_counter()
+
+    sock = app_server_connection.open_connection(HOST, port)
+    if settings is not None:
+        sock = app_tls.wrap(sock, HOST, port, settings)
+
+    try:
+        sock.recv(1024)
+        took = (time.perf_counter() - start) * 1000
+
+        # Keep the ticket that arrived with the data.
+        if settings is not None:
+            app_tls.remember(HOST, port, sock)
+    finally:
+        sock.close()
+
+    return took
+
+
+def run_mode(mode, port, settings, connects):
+    ''' Time connects in one mode, returns a dictionary with the results. '''
+
+    times = []
+
+    for _ in range(connects):
+        if mode == "tls_full":
+            app_tls.forget(HOST, port)
+        times.append(connect_once(port, settings))
+
+    return {"mode": mode,
+            "connects": connects,
+            "p50_ms": round(percentile(times, 50), 3),
+            "p95_ms": round(percentile(times, 95), 3),
+            "mean_ms": round(sum(times) / len(times), 3)}
+
+
+def main():
+    ''' Run the benchmark for every mode and print the results. '''
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--connects", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        cert, _, _ = stand_in_server.make_certificate(directory)
+        plain, plain_port = stand_in_server.start_in_process()
+        tls, tls_port = stand_in_server.start_in_process(tls=directory)
+        settings = {"ca": cert, "pin": None}
+
+        try:
+            # One connect first, so the resumed mode has a session.
+            connect_once(tls_port, settings)
+
+            for mode, port, mode_settings in (
+                    ("plain", plain_port, None),
+                    ("tls_full", tls_port, settings),
+                    ("tls_resumed", tls_port, settings)):
+                result = run_mode(mode, port, mode_settings, args.connects)
+                print(f"{result['mode']:>11}: p50 {result['p50_ms']:.3f} ms"
+                      f"  p95 {result['p95_ms']:.3f} ms"
+                      f"  mean {result['mean_ms']:.3f} ms"
+                      f"  ({result['connects']} connects)")
+        finally:
+            plain.terminate()
+            tls.terminate()
+
+
+if __name__ == "__main__":
+    main()
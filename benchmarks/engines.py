@@ -0,0 +1,129 @@
+#!/bin/env python3
+# -*- mode: python; coding: utf-8 -*-
+
+# Script by Thomas Pirchmoser (tommy_software@mailfence.com) 2024
+
+# This script was created for personal/educational purposes only and is not to
+#   be used for commercial or profit purposes.
+
+'''
+engines.py--compare the network engines (threaded, asyncio, selector).
+
+               A sender pushes chat messages through the stand-in server to
+               a receiver, both using the engine under test. The messages per
+               second and the cpu time of the client process are reported.
+
+               usage: python -m benchmarks.engines [--messages N]
+'''
+
+import argparse
+import threading
+import time
+from pcr_app_utils import app_framing
+from pcr_app_utils import app_transport
+from benchmarks import stand_in_server
+
+
+class BenchClient():
+    ''' Minimal client answering the alias request and counting messages. '''
+
+    def __init__(self, port, alias, engine):
+        self.alias = alias
+        self.codec = app_framing.FrameCodec()
+        self.received = 0
+        self.expected = None
+        self.done = threading.Event()
+        self.ready = threading.Event()
+
+        connected = app_transport.connect("127.0.0.1", port, engine)
+        if not connected["conn"]:
+            raise ConnectionError("could not connect to the stand-in server")
+
+        self.transport = app_transport.create_transport(connected,
+                                                        self.receive,
+                                                        self.closed)
+        self.transport.start()
+
+    def receive(self, data):
+        ''' Count the chat messages received. '''
+
+        for frame in self.codec.feed(data):
+            if frame.kind == app_framing.FRAME_ALIAS:
+                self.send(app_framing.FRAME_ALIAS, self.alias)
+            elif frame.kind == app_framing.FRAME_ROSTER:
+                self.ready.set()
+            elif frame.kind == app_framing.FRAME_CHAT:
+                self.received += 1
+                if self.received == self.expected:
+                    self.done.set()
+
+    def closed(self, reason):
+        ''' Stop waiting if the connection is lost. '''
+
+        print(f"{self.alias} disconnected: {reason}")
+        self.done.set()
+
+    def send(self, kind, text):
+        ''' Send a message, waiting while the send queue is full. '''
+
+        data = self.codec.encode(kind, text)
+
+        while not self.transport.send(data):
+            time.sleep(0.001)
+
+
+def run_engine(port, engine, messages):
+    ''' Measure one engine, returns a dictionary with the results. '''
+
+    receiver = BenchClient(port, "receiver", engine)
+    sender = BenchClient(port, "sender", engine)
+    sender.ready.wait(5)
+    receiver.ready.wait(5)
+
+    # The sender also receives its own messages from the server.
+    receiver.expected = messages
+    text = "sender: " + "x" * 60 + "\n"
+
+    wall = time.perf_counter()
+    cpu = time.process_time()
+
+    for _ in range(messages):
+        sender.send(app_framing.FRAME_CHAT, text)
+
+    receiver.done.wait(60)
+
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+
+    sender.transport.close()
+    receiver.transport.close()
+
+    return {"engine": engine,
+            "messages": receiver.received,
+            "seconds": round(wall, 3),
+            "msgs_per_sec": round(receiver.received / wall),
+            "cpu_seconds": round(cpu, 3)}
+
+
+def main():
+    ''' Run the benchmark for every engine and print the results. '''
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=20000)
+    args = parser.parse_args()
+
+    process, port = stand_in_server.start_in_process()
+
+    try:
+        for engine in app_transport.ENGINES:
+            result = run_engine(port, engine, args.messages)
+            print(f"{result['engine']:>9}: {result['msgs_per_sec']:>7} msg/s"
+                  f"  cpu {result['cpu_seconds']:.3f}s"
+                  f"  ({result['messages']} messages"
+                  f" in {result['seconds']:.3f}s)")
+    finally:
+        process.terminate()
+
+
+if __name__ == "__main__":
+    main()
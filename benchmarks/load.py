@@ -0,0 +1,553 @@
+#!/bin/env python3
+# -*- mode: python; coding: utf-8 -*-
+
+# Script by Thomas Pirchmoser (tommy_software@mailfence.com) 2024
+
+# This script was created for personal/educational purposes only and is not to
+#   be used for commercial or profit purposes.
+
+'''
+load.py--load generation and latency benchmark for "PrivateChatRoom-App".
+
+               A stand-in server is started on loopback and N simulated
+               clients, each in its own process, go through the same alias
+               handshake and "alias: msg" format as the app (ClientCore).
+               Every message carries its send time, so the receivers can
+               measure the end-to-end latency.
+
+               Scenarios:
+                   fan_in       -- every client sends bursts to everyone.
+                   large_paste  -- every client sends a few large messages.
+                   roster_churn -- half of the clients keep sending while the
+                                   other half join and leave over and over.
+                   many_sessions -- --sessions clients (500) in one process,
+                                   one of them sends to all; reports the
+                                   threads and the rss of that process, e.g.
+                                   to compare --engine threaded/selector.
+
+               The results (messages per second, p50/p95/p99 latency, bytes
+               on the wire, cpu and rss per client) are printed and saved as
+               json, so runs of different commits can be compared with
+               benchmarks.compare. With --compression both every scenario
+               runs without and with zlib compression ("<scenario>+zlib").
+
+               usage: python -m benchmarks.load [--scenario all] [--clients N]
+'''
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from pcr_app_utils import app_client_core
+from pcr_app_utils import app_metrics
+from pcr_app_utils import app_transport
+from benchmarks import stand_in_server
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+SCENARIOS = ("fan_in", "large_paste", "roster_churn", "many_sessions")
+
+# Seconds a client waits for the last messages before giving up.
+IDLE_TIMEOUT = 10
+
+# Directory the results are saved to.
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+# Words for the log-like text of the large pastes.
+LOG_WORDS = ("INFO", "DEBUG", "WARNING", "worker", "request", "handled",
+             "connection", "timeout", "retry", "File", "line", "in", "user",
+             "session", "queue", "bytes", "ms", "Traceback", "self", "None")
+
+
+def paste_text(size, seed):
+    ''' Return about size characters of text that looks like a log. '''
+
+    rand = random.Random(seed)
+    lines = []
+    length = 0
+
+    while length < size:
+        line = f"2024-05-{rand.randint(1, 28):02d} " \
+               f"{rand.randint(0, 23):02d}:{rand.randint(0, 59):02d} " + \
+               " ".join(rand.choice(LOG_WORDS)
+                        for _ in range(rand.randint(4, 12))) + \
+               f" id={rand.getrandbits(32):08x}"
+        lines.append(line)
+        length += len(line) + 1
+
+    return "\n".join(lines)[:size]
+
+
+def percentile(values, pct):
+    ''' Return the pct percentile of a sorted list (nearest rank). '''
+
+    if not values:
+        return None
+
+    rank = max(0, min(len(values) - 1, round(pct / 100 * len(values)) - 1))
+
+    return values[rank]
+
+
+def usage():
+    ''' Return (cpu seconds, max rss in KiB) of the calling process. '''
+
+    if resource is None:
+        return time.process_time(), None
+
+    rusage = resource.getrusage(resource.RUSAGE_SELF)
+
+    return rusage.ru_utime + rusage.ru_stime, rusage.ru_maxrss
+
+
+class SimClient():
+    ''' A simulated user on top of ClientCore. '''
+
+    def __init__(self, port, alias, engine, compress=False):
+        self.alias = alias
+        self.latencies = []
+        self.received = 0
+        self.other = 0
+        self.bytes_in = 0
+        self.rosters = 0
+        self.rejoins = 0
+        self.last = time.monotonic()
+        self.changed = threading.Condition()
+        self.joined = threading.Event()
+        self.core = app_client_core.ClientCore(
+                        "127.0.0.1", port, alias, engine,
+                        on_message=self.on_message,
+                        on_roster=self.on_roster,
+                        reconnect=False,
+                        compress=compress)
+
+    def start(self, timeout=10):
+        '''
+        Connect and wait until the server has taken the alias, which it
+        confirms with a roster update.
+        '''
+
+        self.core.start()
+        if not self.joined.wait(timeout):
+            raise ConnectionError(f"{self.alias} could not join the chat")
+
+    def on_roster(self, _text, _room):
+        self.rosters += 1
+        self.joined.set()
+
+    def on_message(self, message):
+        now = time.time_ns()
+        parts = message.text.split(" ", 4)
+
+        with self.changed:
+            self.bytes_in += len(message.text)
+            self.last = time.monotonic()
+
+            # "alias: bench <send time> <seq> <padding>"
+            if len(parts) >= 4 and parts[1] == "bench":
+                self.latencies.append((now - int(parts[2])) / 1e6)
+                self.received += 1
+                self.changed.notify_all()
+            else:
+                self.other += 1
+
+    def send(self, seq, size=60, padding=None):
+        ''' Send a timestamped message, waiting while the queue is full. '''
+
+        text = f"bench {time.time_ns()} {seq} " + (padding or "x" * size)
+
+        while not self.core.send(text):
+            time.sleep(0.001)
+
+    def wait_for(self, count):
+        ''' Wait until count messages have arrived or nothing arrives. '''
+
+        with self.changed:
+            while self.received < count:
+                if time.monotonic() - self.last > IDLE_TIMEOUT:
+                    return False
+                self.changed.wait(0.5)
+
+        return True
+
+
+def run_fan_in(client, index, params):
+    ''' Send bursts of messages, everyone receives everything. '''
+
+    burst = params["burst"]
+
+    for seq in range(params["messages"]):
+        client.send(seq)
+
+        # Short pause between the bursts.
+        if (seq + 1) % burst == 0:
+            time.sleep(params["pause"])
+
+    return params["clients"] * params["messages"]
+
+
+def run_large_paste(client, index, params):
+    ''' Send a few large messages. '''
+
+    for seq in range(params["pastes"]):
+        client.send(seq, padding=paste_text(params["paste_size"],
+                                            seed=index * 1000 + seq))
+
+    return params["clients"] * params["pastes"]
+
+
+def run_roster_churn(client, index, params):
+    '''
+    The first half of the clients send at a steady rate, the others keep
+    joining and leaving the chat.
+    '''
+
+    stable = params["clients"] - params["clients"] // 2
+
+    if index < stable:
+        for seq in range(params["messages"]):
+            client.send(seq)
+            time.sleep(params["duration"] / params["messages"])
+
+        return stable * params["messages"]
+
+    # Leave and rejoin until the time is up.
+    end = time.monotonic() + params["duration"]
+
+    while time.monotonic() < end:
+        client.core.close()
+        client.joined.clear()
+        client.core = app_client_core.ClientCore(
+                            "127.0.0.1", client.core.connected["port"],
+                            client.alias, client.core.connected["engine"],
+                            on_message=client.on_message,
+                            on_roster=client.on_roster,
+                            reconnect=False,
+                            compress=client.core.compress)
+        client.start()
+        client.rejoins += 1
+
+    return 0
+
+
+def sessions_worker(params, port, ready, go, results):
+    '''
+    Process running all the sessions of many_sessions, the first one sends
+    the messages. Puts the rows of the sessions and (threads, rss).
+    '''
+
+    logging.disable(logging.INFO)
+
+    clients = [SimClient(port, f"session{index}", params["engine"],
+                         params["compress"])
+               for index in range(params["sessions"])]
+
+    # Connect them all at once, then wait for each.
+    for client in clients:
+        client.core.start()
+    for client in clients:
+        if not client.joined.wait(30):
+            raise ConnectionError(f"{client.alias} could not join the chat")
+
+    threads = threading.active_count()
+    ready.put(0)
+    go.wait()
+
+    cpu_start, _ = usage()
+    wall = time.perf_counter()
+
+    sender = clients[0]
+    for seq in range(params["messages"]):
+        sender.send(seq)
+        if (seq + 1) % params["burst"] == 0:
+            time.sleep(params["pause"])
+
+    complete = all([client.wait_for(params["messages"])
+                    for client in clients])
+
+    wall = time.perf_counter() - wall
+    cpu, rss = usage()
+    wire = app_metrics.REGISTRY.snapshot()["counters"]
+
+    rows = [{"client": index,
+             "complete": complete,
+             "received": client.received,
+             "expected": params["messages"],
+             "other_messages": client.other,
+             "bytes_in": client.bytes_in,
+             "wire_bytes_in": 0,
+             "wire_bytes_out": 0,
+             "roster_updates": client.rosters,
+             "rejoins": 0,
+             "seconds": wall,
+             "msgs_per_sec": client.received / wall if wall else 0,
+             "cpu_seconds": 0,
+             "max_rss_kib": None,
+             "latencies": client.latencies}
+            for index, client in enumerate(clients)]
+
+    # The sessions share the process, its totals go on the first row.
+    rows[0].update(wire_bytes_in=wire.get("bytes_in", 0),
+                   wire_bytes_out=wire.get("bytes_out", 0),
+                   cpu_seconds=cpu - cpu_start, max_rss_kib=rss)
+
+    for client in clients:
+        client.core.close()
+
+    results.put((rows, threads, rss))
+
+
+def run_many_sessions(params, port):
+    ''' Run many_sessions in one process, returns its summary. '''
+
+    ready = multiprocessing.Queue()
+    results = multiprocessing.Queue()
+    go = multiprocessing.Event()
+
+    process = multiprocessing.Process(target=sessions_worker,
+                                      args=(params, port, ready, go, results),
+                                      daemon=True)
+    try:
+        process.start()
+        ready.get(timeout=60)
+        go.set()
+
+        wall = time.perf_counter()
+        rows, threads, rss = results.get(timeout=params["timeout"])
+        wall = time.perf_counter() - wall
+    finally:
+        process.join(10)
+
+    result = summarize(rows, wall)
+    result.update(sessions=params["sessions"], threads=threads,
+                  rss_mb=round(rss / 1024, 1) if rss else None)
+
+    return result
+
+
+RUNNERS = {"fan_in": run_fan_in,
+           "large_paste": run_large_paste,
+           "roster_churn": run_roster_churn}
+
+
+def worker(index, scenario, params, port, ready, go, results):
+    ''' Process running one simulated client. '''
+
+    # Keep writing the client log out of the measurement.
+    logging.disable(logging.INFO)
+
+    client = SimClient(port, f"client{index}", params["engine"],
+                       params["compress"])
+    client.start()
+
+    ready.put(index)
+    go.wait()
+
+    cpu_start, _ = usage()
+    wire_start = app_metrics.REGISTRY.snapshot()["counters"]
+    wall = time.perf_counter()
+
+    expected = RUNNERS[scenario](client, index, params)
+    complete = client.wait_for(expected)
+
+    wall = time.perf_counter() - wall
+    cpu, rss = usage()
+    wire = app_metrics.REGISTRY.snapshot()["counters"]
+
+    client.core.close()
+
+    results.put({"client": index,
+                 "complete": complete,
+                 "received": client.received,
+                 "expected": expected,
+                 "other_messages": client.other,
+                 "bytes_in": client.bytes_in,
+                 "wire_bytes_in": wire.get("bytes_in", 0) -
+                                  wire_start.get("bytes_in", 0),
+                 "wire_bytes_out": wire.get("bytes_out", 0) -
+                                   wire_start.get("bytes_out", 0),
+                 "roster_updates": client.rosters,
+                 "rejoins": client.rejoins,
+                 "seconds": wall,
+                 "msgs_per_sec": client.received / wall if wall else 0,
+                 "cpu_seconds": cpu - cpu_start,
+                 "max_rss_kib": rss,
+                 "latencies": client.latencies})
+
+
+def summarize(rows, wall):
+    ''' Combine the results of all clients. '''
+
+    latencies = sorted(round(lat, 3)
+                       for row in rows for lat in row.pop("latencies"))
+    received = sum(row["received"] for row in rows)
+
+    for row in rows:
+        row["seconds"] = round(row["seconds"], 3)
+        row["msgs_per_sec"] = round(row["msgs_per_sec"], 1)
+        row["cpu_seconds"] = round(row["cpu_seconds"], 3)
+
+    return {"messages_received": received,
+            "msgs_per_sec": round(received / wall, 1) if wall else 0,
+            "latency_ms": {"p50": percentile(latencies, 50),
+                           "p95": percentile(latencies, 95),
+                           "p99": percentile(latencies, 99),
+                           "max": latencies[-1] if latencies else None,
+                           "samples": len(latencies)},
+            "cpu_seconds_total": round(sum(row["cpu_seconds"]
+                                           for row in rows), 3),
+            "wire_bytes_in": sum(row["wire_bytes_in"] for row in rows),
+            "wire_bytes_out": sum(row["wire_bytes_out"] for row in rows),
+            "complete": all(row["complete"] for row in rows),
+            "clients": sorted(rows, key=lambda row: row["client"])}
+
+
+def run_scenario(scenario, params):
+    ''' Run one scenario against a fresh stand-in server. '''
+
+    server, port = stand_in_server.start_in_process()
+
+    if scenario == "many_sessions":
+        try:
+            return run_many_sessions(params, port)
+        finally:
+            server.terminate()
+
+    ready = multiprocessing.Queue()
+    results = multiprocessing.Queue()
+    go = multiprocessing.Event()
+
+    processes = [multiprocessing.Process(target=worker,
+                                         args=(index, scenario, params, port,
+                                               ready, go, results),
+                                         daemon=True)
+                 for index in range(params["clients"])]
+
+    try:
+        for process in processes:
+            process.start()
+
+        # Start all clients at once when everyone is connected.
+        for _ in processes:
+            ready.get(timeout=30)
+        go.set()
+
+        wall = time.perf_counter()
+        rows = [results.get(timeout=params["timeout"]) for _ in processes]
+        wall = time.perf_counter() - wall
+
+    finally:
+        for process in processes:
+            process.join(5)
+        server.terminate()
+
+    return summarize(rows, wall)
+
+
+def commit():
+    ''' Return the git commit of the tree, if available. '''
+
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(__file__)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv=None):
+    ''' Parse the command line arguments. '''
+
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load",
+                                     description="PrivateChatRoom-App "
+                                                 "load benchmark")
+    parser.add_argument("--scenario", choices=SCENARIOS + ("all",),
+                        default="all")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--sessions", type=int, default=500,
+                        help="sessions of the many_sessions scenario")
+    parser.add_argument("--messages", type=int, default=200,
+                        help="messages per client")
+    parser.add_argument("--burst", type=int, default=50)
+    parser.add_argument("--pause", type=float, default=0.05,
+                        help="seconds between bursts")
+    parser.add_argument("--pastes", type=int, default=5)
+    parser.add_argument("--paste-size", type=int, default=200_000)
+    parser.add_argument("--duration", type=float, default=5,
+                        help="seconds of roster churn")
+    parser.add_argument("--engine", choices=app_transport.ENGINES,
+                        default=app_transport.DEFAULT_ENGINE)
+    parser.add_argument("--compression", choices=("off", "on", "both"),
+                        default="off",
+                        help="run without/with zlib compression or both")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--output",
+                        help="json file for the results (default: "
+                             "benchmarks/results/<commit>-<time>.json)")
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    ''' Run the selected scenarios and save the results. '''
+
+    args = parse_args(argv)
+    params = {key: value for key, value in vars(args).items()
+              if key not in ("scenario", "output", "compression")}
+    settings = {"off": (False,), "on": (True,),
+                "both": (False, True)}[args.compression]
+
+    scenarios = SCENARIOS if args.scenario == "all" else (args.scenario,)
+
+    report = {"commit": commit(),
+              "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "python": sys.version.split()[0],
+              "platform": platform.platform(),
+              "params": dict(params, compression=args.compression),
+              "scenarios": {}}
+
+    for scenario in scenarios:
+        for compress in settings:
+            name = f"{scenario}+zlib" if compress else scenario
+            result = run_scenario(scenario, dict(params, compress=compress))
+            report["scenarios"][name] = result
+
+            latency = result["latency_ms"]
+            print(f"{name:>18}: {result['msgs_per_sec']:>9} msg/s"
+                  f"  p50 {latency['p50'] or 0:7.2f}ms"
+                  f"  p95 {latency['p95'] or 0:7.2f}ms"
+                  f"  p99 {latency['p99'] or 0:7.2f}ms"
+                  f"  cpu {result['cpu_seconds_total']:.2f}s"
+                  f"  wire {result['wire_bytes_in'] / 1e6:.2f}MB in"
+                  f" {result['wire_bytes_out'] / 1e6:.2f}MB out"
+                  f"{'' if result['complete'] else '  (incomplete)'}")
+
+            if "threads" in result:
+                print(f"{'':>18}  {result['sessions']} sessions:"
+                      f" {result['threads']} threads,"
+                      f" rss {result['rss_mb']} MB")
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        name = f"{report['commit'] or 'tree'}-{time.strftime('%Y%m%d%H%M%S')}"
+        output = os.path.join(RESULTS_DIR, f"{name}.json")
+
+    with open(output, "w", encoding="utf-8") as outfile:
+        json.dump(report, outfile, indent=2)
+
+    print(f"results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/bin/env python3
+# -*- mode: python; coding: utf-8 -*-
+
+# Script by Thomas Pirchmoser (tommy_software@mailfence.com) 2024
+
+# This script was created for personal/educational purposes only and is not to
+#   be used for commercial or profit purposes.
+
+'''
+receive.py--cost of the receive path of "PrivateChatRoom-App" for several
+               read sizes.
+
+               A stream of chat frames with umlauts, emoji and CJK is copied
+               into a preallocated buffer one read at a time (as recv_into
+               does) and fed to the frame codec, the legacy text format is
+               fed the same way. Reports messages per second and, in a second
+               run (tracemalloc slows it down), the peak of the memory
+               allocated meanwhile.
+
+               usage: python -m benchmarks.receive [--messages N]
+'''
+
+import argparse
+import time
+import tracemalloc
+from pcr_app_utils import app_framing
+
+# Read sizes compared, the default of app_transport among them.
+READ_SIZES = (1024, 4096, 16384, 65536)
+
+# Text of the messages, multibyte characters end up split between reads.
+TEXT = "tommy: grüß dich 😀 你好 "
+
+
+def make_stream(messages, framed):
+    ''' Return the bytes the server would send for the messages. '''
+
+    chunks = []
+
+    for number in range(messages):
+        payload = f"{TEXT}{number}\n".encode(app_framing.FORMAT)
+        if framed:
+            payload = app_framing.encode_frame(app_framing.FRAME_CHAT,
+                                               payload)
+        chunks.append(payload)
+
+    return b"".join(chunks)
+
+
+def run(stream, read_size, mode, trace=False):
+    '''
+    Feed the stream through a codec in reads of read_size, returns
+    (frames, seconds, peak KB or None without trace).
+    '''
+
+    codec = app_framing.FrameCodec(mode)
+    buffer = bytearray(read_size)
+    view = memoryview(buffer)
+    source = memoryview(stream)
+    frames = 0
+
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+
+    for offset in range(0, len(stream), read_size):
+        size = len(source[offset:offset + read_size])
+        view[:size] = source[offset:offset + size]
+        frames += len(codec.feed(view[:size]))
+
+    seconds = time.perf_counter() - start
+
+    if not trace:
+        return frames, seconds, None
+
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return frames, seconds, peak / 1024
+
+
+def main():
+    ''' Run the benchmark for every read size and print the results. '''
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=50000)
+    args = parser.parse_args()
+
+    for mode in (app_framing.MODE_FRAMED, app_framing.MODE_LEGACY):
+        stream = make_stream(args.messages,
+                             mode == app_framing.MODE_FRAMED)
+
+        for read_size in READ_SIZES:
+            frames, seconds, _ = run(stream, read_size, mode)
+            peak_kb = run(stream, read_size, mode, trace=True)[2]
+            print(f"{mode:>6} {read_size:>6} B reads: "
+                  f"{args.messages / seconds:>10.0f} msg/s"
+                  f"  {frames:>6} frames  peak {peak_kb:.1f} KB")
+
+
+if __name__ == "__main__":
+    main()
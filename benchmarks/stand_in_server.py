@@ -0,0 +1,407 @@
+#!/bin/env python3
+# -*- mode: python; coding: utf-8 -*-
+
+# Script by Thomas Pirchmoser (tommy_software@mailfence.com) 2024
+
+# This script was created for personal/educational purposes only and is not to
+#   be used for commercial or profit purposes.
+
+'''
+stand_in_server.py--a local stand-in for the 'PrivateChatRoom-Server' used
+               by the benchmarks.
+
+               It asks every new client for its alias, broadcasts the number
+               of users online and relays every chat message to all clients.
+               By default it speaks the framed protocol and offers zlib
+               compression, file transfers, pings, rooms (every room has
+               its own roster and messages) and the members of the rooms
+               (full list on join, then the changes; a second alias frame
+               renames the client), with legacy=True it
+               sends plain text like the original server. With tls (a
+               directory) it speaks TLS with a self-signed certificate for
+               127.0.0.1/localhost, created there on first use.
+'''
+
+import argparse
+import hashlib
+import multiprocessing
+import os
+import select
+import socket
+import socketserver
+import ssl
+import subprocess
+import threading
+from pcr_app_utils import app_framing
+from pcr_app_utils import app_roster
+
+# Certificate and key of the TLS stand-in, in the tls directory.
+CERT_FILE = "stand_in_cert.pem"
+KEY_FILE = "stand_in_key.pem"
+
+
+def make_certificate(directory):
+    '''
+    Create a self-signed certificate for 127.0.0.1 and localhost with the
+    openssl command, unless there is one. Returns (cert, key, sha256 of
+    the certificate).
+    '''
+
+    cert = os.path.join(directory, CERT_FILE)
+    key = os.path.join(directory, KEY_FILE)
+
+    if not os.path.exists(cert):
+        os.makedirs(directory, exist_ok=True)
+        subprocess.run(["openssl", "req", "-x509", "-newkey", "ec",
+                        "-pkeyopt", "ec_paramgen_curve:prime256v1",
+                        "-nodes", "-days", "30", "-subj", "/CN=localhost",
+                        "-addext",
+                        "subjectAltName=IP:127.0.0.1,DNS:localhost",
+                        "-keyout", key, "-out", cert],
+                       check=True, capture_output=True)
+
+    with open(cert, "r", encoding="ascii") as infile:
+        der = ssl.PEM_cert_to_DER_cert(infile.read())
+
+    return cert, key, hashlib.sha256(der).hexdigest()
+
+
+class ChatHandler(socketserver.BaseRequestHandler):
+    ''' Handles one client connection. '''
+
+    def setup(self):
+        if self.server.tls_context is not None:
+            self.request = self.server.tls_context.wrap_socket(
+                                            self.request, server_side=True)
+
+        self.lock = threading.Lock()
+        self.codec = app_framing.FrameCodec(self.server.mode)
+
+        # True once the client has asked for compression.
+        self.compression = False
+
+        # Rooms the client has joined, besides the main room.
+        self.rooms = set()
+
+        # Alias of the client, None until it has sent it.
+        self.alias = None
+
+        # True once the client has asked for the members of its rooms.
+        self.members = False
+
+    def send(self, kind, payload, encoded=None):
+        '''
+        Send a message to this client. A broadcast passes a dictionary in
+        encoded, so every variant of the frame is only built once.
+        '''
+
+        if self.server.mode == app_framing.MODE_FRAMED:
+            compress = self.compression and \
+                len(payload) >= app_framing.COMPRESS_THRESHOLD
+            encoded = {} if encoded is None else encoded
+            if compress not in encoded:
+                encoded[compress] = app_framing.encode_frame(
+                                            kind, payload, compress=compress)
+            data = encoded[compress]
+        else:
+            data = payload
+
+        with self.lock:
+            self.request.sendall(data)
+
+    def receive(self):
+        ''' Return the next data of the client. '''
+
+        if self.server.tls_context is None:
+            return self.request.recv(65536)
+
+        # A TLS socket may not be read while a broadcast writes to it.
+        if not self.request.pending():
+            select.select([self.request], [], [])
+        with self.lock:
+            return self.request.recv(65536)
+
+    def handle(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        # Ask for the alias, listing the features offered.
+        if self.server.mode == app_framing.MODE_FRAMED:
+            self.send(app_framing.FRAME_ALIAS,
+                      ",".join(sorted(self.server.features)).encode())
+        else:
+            self.send(app_framing.FRAME_ALIAS, b"ALIAS")
+
+        while True:
+            try:
+                data = self.receive()
+            except (OSError, ValueError):
+                break
+
+            if not data:
+                break
+
+            try:
+                frames = self.codec.feed(data)
+            except app_framing.FrameError:
+                # Drop clients sending invalid data, like the real server.
+                break
+
+            for frame in frames:
+                if self.alias is None:
+                    # The first message of a client is its alias.
+                    self.alias = alias_text(frame)
+                    self.server.join(self)
+                    continue
+
+                if frame.kind == app_framing.FRAME_FEATURES:
+                    # The features the client wants of those offered.
+                    wanted = app_framing.parse_features(frame.payload) & \
+                        self.server.features
+                    self.compression = app_framing.FEATURE_ZLIB in wanted
+
+                    # The features come after the alias, so the members
+                    #   are sent now.
+                    if app_framing.FEATURE_MEMBERS in wanted and \
+                            not self.members:
+                        self.members = True
+                        for room in [None] + sorted(self.rooms):
+                            self.server.send_members(self, room)
+                    continue
+
+                if frame.kind == app_framing.FRAME_ALIAS and self.members:
+                    # Another alias renames the client.
+                    old, self.alias = self.alias, alias_text(frame)
+                    self.server.rename(self, old)
+                    continue
+
+                if frame.kind == app_framing.FRAME_PING:
+                    # Only the client that pinged gets the answer.
+                    self.send(app_framing.FRAME_PONG, frame.payload)
+                    continue
+
+                if frame.kind in (app_framing.FRAME_JOIN,
+                                  app_framing.FRAME_LEAVE):
+                    room = app_framing.frame_text(frame)
+                    if frame.kind == app_framing.FRAME_JOIN:
+                        if room not in self.rooms:
+                            self.rooms.add(room)
+                            self.server.roster(app_roster.MemberChange(
+                                app_roster.JOIN, self.alias), room, self)
+                    elif room in self.rooms:
+                        self.rooms.discard(room)
+                        self.server.roster(app_roster.MemberChange(
+                            app_roster.LEAVE, self.alias), room)
+                    continue
+
+                if frame.kind == app_framing.FRAME_ROOM:
+                    try:
+                        room, _ = app_framing.split_room(frame.payload)
+                    except app_framing.FrameError:
+                        break
+                    if room in self.rooms:
+                        self.server.broadcast(frame.kind, frame.payload,
+                                              room)
+                    continue
+
+                self.server.broadcast(frame.kind, frame.payload)
+
+        self.server.leave(self)
+
+
+class StandInServer(socketserver.ThreadingTCPServer):
+    ''' Broadcast server with the same behaviour as the real one. '''
+
+    daemon_threads = True
+
+    # Hundreds of sessions may connect at the same time (many_sessions).
+    request_queue_size = 512
+    allow_reuse_address = True
+
+    def __init__(self, address, legacy=False, compression=True, tls=None):
+        super().__init__(address, ChatHandler)
+        self.tls_context = None
+        if tls is not None:
+            cert, key, _ = make_certificate(tls)
+            self.tls_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            self.tls_context.load_cert_chain(cert, key)
+        self.mode = app_framing.MODE_LEGACY if legacy \
+            else app_framing.MODE_FRAMED
+        self.features = {app_framing.FEATURE_FILES, app_framing.FEATURE_PING,
+                         app_framing.FEATURE_ROOMS,
+                         app_framing.FEATURE_MEMBERS}
+        if compression:
+            self.features.add(app_framing.FEATURE_ZLIB)
+        self.clients = set()
+        self.clients_lock = threading.Lock()
+
+    def join(self, handler):
+        ''' Add a client and tell everyone about it. '''
+
+        with self.clients_lock:
+            self.clients.add(handler)
+
+        self.roster(app_roster.MemberChange(app_roster.JOIN, handler.alias),
+                    joined=handler)
+
+    def leave(self, handler):
+        ''' Remove a client and tell everyone (in its rooms) about it. '''
+
+        with self.clients_lock:
+            if handler not in self.clients:
+                return
+            self.clients.discard(handler)
+
+        change = app_roster.MemberChange(app_roster.LEAVE, handler.alias)
+        self.roster(change)
+
+        for room in handler.rooms:
+            self.roster(change, room)
+
+    def rename(self, handler, old):
+        ''' Tell everyone (in its rooms) the new alias of a client. '''
+
+        change = app_roster.MemberChange(app_roster.RENAME, old,
+                                         handler.alias)
+
+        for room in [None] + sorted(handler.rooms):
+            self.roster(change, room)
+
+    def in_room(self, room):
+        ''' Return the clients in a room, all of them for the main room. '''
+
+        with self.clients_lock:
+            return [client for client in self.clients
+                    if room is None or room in client.rooms]
+
+    def send_members(self, handler, room=None):
+        ''' Send the full list of members of a room to one client. '''
+
+        aliases = sorted(client.alias for client in self.in_room(room))
+        kind, payload = wrap(room, app_framing.FRAME_MEMBERS,
+                             app_roster.encode_full(aliases))
+
+        try:
+            handler.send(kind, payload)
+        except OSError:
+            pass
+
+    def roster(self, change, room=None, joined=None):
+        '''
+        Tell the clients (of a room) about a change of its members: the
+        clients that asked for the members get the change, the client that
+        joined gets the full list, the others the number of users.
+        '''
+
+        clients = self.in_room(room)
+        count = app_roster.count_text(len(clients)).encode()
+        delta = app_roster.encode_delta([change])
+
+        # Every variant of the frame is only built once.
+        variants = {"count": wrap(room, app_framing.FRAME_ROSTER, count),
+                    "delta": wrap(room, app_framing.FRAME_MEMBERS_DELTA,
+                                  delta)}
+        encoded = {variant: {} for variant in variants}
+
+        for client in clients:
+            if client is joined and client.members:
+                self.send_members(client, room)
+                continue
+
+            if client.members:
+                variant = "delta"
+            elif change.kind == app_roster.RENAME:
+                continue  # The number of users is the same.
+            else:
+                variant = "count"
+
+            try:
+                client.send(*variants[variant], encoded[variant])
+            except OSError:
+                pass
+
+    def broadcast(self, kind, payload, room=None):
+        ''' Send a message to every client, or every member of a room. '''
+
+        clients = self.in_room(room)
+        encoded = {}
+
+        for client in clients:
+            try:
+                client.send(kind, payload, encoded)
+            except OSError:
+                pass
+
+
+def alias_text(frame):
+    ''' Return the alias sent in a frame, as it is listed to the others. '''
+
+    text = frame.payload.decode(app_framing.FORMAT, "replace")
+
+    # A list of members has one alias per line.
+    return text.replace("\n", " ").replace("\t", " ").strip()
+
+
+def wrap(room, kind, payload):
+    ''' Return (kind, payload) of a frame, in a room frame for a room. '''
+
+    if room is None:
+        return kind, payload
+
+    return app_framing.FRAME_ROOM, app_framing.encode_room(room, kind,
+                                                           payload)
+
+
+def serve(port, legacy, ready, compression=True, tls=None):
+    ''' Run the server until the process is terminated. '''
+
+    with StandInServer(("127.0.0.1", port), legacy, compression,
+                       tls) as server:
+        ready.put(server.server_address[1])
+        server.serve_forever()
+
+
+def start_in_process(port=0, legacy=False, compression=True, tls=None):
+    '''
+    Start the server in a separate process, so its cpu time is not
+    counted for the clients. Returns (process, port).
+    '''
+
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=serve,
+                                      args=(port, legacy, ready,
+                                            compression, tls),
+                                      daemon=True)
+    process.start()
+
+    return process, ready.get(timeout=10)
+
+
+def main():
+    ''' Run the stand-in server in the foreground. '''
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=5050)
+    parser.add_argument("--legacy", action="store_true",
+                        help="send plain text instead of frames")
+    parser.add_argument("--no-compression", action="store_true",
+                        help="do not offer zlib compression")
+    parser.add_argument("--tls", metavar="DIR",
+                        help="speak TLS, with a self-signed certificate "
+                             "kept in DIR")
+    args = parser.parse_args()
+
+    with StandInServer(("127.0.0.1", args.port), args.legacy,
+                       not args.no_compression, args.tls) as server:
+        print(f"stand-in server listening on 127.0.0.1:{args.port}")
+
+        if args.tls:
+            print("certificate sha256:", make_certificate(args.tls)[2])
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("stand-in server stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+#!/bin/env python3
+# -*- mode: python; coding: utf-8 -*-
+
+# Script by Thomas Pirchmoser (tommy_software@mailfence.com) 2024
+
+# This script was created for personal/educational purposes only and is not to
+#   be used for commercial or profit purposes.
+
+'''
+startup.py--cold start time and memory of the GUI of "PrivateChatRoom-App".
+
+               The GUI (gui_client.py) is started in a new process against a
+               stand-in server, the time from starting the process until
+               the window is shown is the cold start time. One more run then
+               changes the ip address and the port over and over (the
+               message boxes are answered by the benchmark) and reports the
+               rss after the start and after the changes.
+
+               Needs a display (e.g. xvfb-run on a server). The results are
+               saved as json like those of benchmarks.load, so they can be
+               compared with benchmarks.compare.
+
+               usage: python -m benchmarks.startup [--runs N] [--changes N]
+'''
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks import stand_in_server
+from benchmarks.load import RESULTS_DIR, commit, percentile
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Directory of gui_client.py.
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Milliseconds between two changes, lets the reconnect go through.
+CHANGE_DELAY = 100
+
+
+def rss_mb():
+    ''' Return the resident memory of this process in MB. '''
+
+    try:
+        with open("/proc/self/statm", encoding="ascii") as statm:
+            pages = int(statm.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / 1e6, 2)
+    except OSError:
+        pass
+
+    # Peak instead of current, in KB on Linux and bytes on macOS.
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (1e6 if sys.platform == "darwin" else 1e3), 2)
+
+    return None
+
+
+def emit(**event):
+    ''' Tell the benchmark process about an event of the GUI process. '''
+
+    print(json.dumps(event), flush=True)
+
+
+def run_gui(port, changes):
+    ''' The GUI process: start the window, then change the ip/port. '''
+
+    # pylint: disable=import-outside-toplevel
+    import gui_client
+    from pcr_app_utils import app_dialogs
+
+    client = gui_client.Client("127.0.0.1", port, alias="startup")
+    win = app_dialogs.root()
+
+    def answer(text):
+        ''' Type the text into the message box once it is open. '''
+
+        box = app_dialogs.current()
+        if box is None or not box.win.winfo_viewable():
+            win.after(10, answer, text)
+            return
+
+        box.entry.insert(0, text)
+        box.ok()
+
+    def change(number):
+        ''' Change the port (even numbers) or the ip address (odd ones). '''
+
+        if number == changes:
+            emit(event="done", rss_mb=rss_mb())
+            client.stop()  # Exits the process.
+
+        win.after(10, answer, str(port) if number % 2 == 0 else "127.0.0.1")
+
+        if number % 2 == 0:
+            client.change_port()
+        else:
+            client.change_ip()
+
+        win.after(CHANGE_DELAY, change, number + 1)
+
+    def shown():
+        ''' The window is on the screen. '''
+
+        win.update_idletasks()
+        emit(event="shown", rss_mb=rss_mb())
+        win.after(CHANGE_DELAY, change, 0)
+
+    win.after(1, shown)
+    client.gui_loop()
+
+
+def start_gui(port, changes):
+    '''
+    Start the GUI process in a temporary directory (its config and log
+    files stay there). Returns the events it reported with the seconds
+    since the start.
+    '''
+
+    events = []
+    env = dict(os.environ, PYTHONPATH=ROOT_DIR)
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        with subprocess.Popen([sys.executable, "-m", "benchmarks.startup",
+                               "--gui", str(port), "--changes", str(changes)],
+                              cwd=directory, env=env, text=True,
+                              stdout=subprocess.PIPE) as process:
+            for line in process.stdout:
+                if line.startswith("{"):
+                    event = json.loads(line)
+                    event["seconds"] = time.perf_counter() - start
+                    events.append(event)
+
+    return events
+
+
+def parse_args(argv=None):
+    ''' Parse the command line arguments. '''
+
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.startup",
+                                     description="PrivateChatRoom-App "
+                                                 "startup benchmark")
+    parser.add_argument("--runs", type=int, default=5,
+                        help="cold starts to time")
+    parser.add_argument("--changes", type=int, default=50,
+                        help="ip/port changes before the rss is measured")
+    parser.add_argument("--output",
+                        help="json file for the results (default: "
+                             "benchmarks/results/startup-<commit>-<time>"
+                             ".json)")
+    parser.add_argument("--gui", type=int, metavar="PORT",
+                        help=argparse.SUPPRESS)
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    ''' Run the benchmark and save the results. '''
+
+    args = parse_args(argv)
+
+    if args.gui is not None:
+        run_gui(args.gui, args.changes)
+        return
+
+    server, port = stand_in_server.start_in_process()
+
+    try:
+        starts = []
+        for _ in range(args.runs):
+            events = start_gui(port, 0)
+            starts.extend(event["seconds"] * 1000 for event in events
+                          if event["event"] == "shown")
+
+        events = {event["event"]: event
+                  for event in start_gui(port, args.changes)}
+    finally:
+        server.terminate()
+
+    if not starts or "done" not in events:
+        sys.exit("the gui did not start, is there a display?")
+
+    starts.sort()
+    result = {"runs": len(starts),
+              "changes": args.changes,
+              "cold_start_ms": {"p50": round(percentile(starts, 50), 1),
+                                "p95": round(percentile(starts, 95), 1)},
+              "rss_start_mb": events["shown"]["rss_mb"],
+              "rss_end_mb": events["done"]["rss_mb"]}
+
+    print(f"cold start: p50 {result['cold_start_ms']['p50']:.1f} ms"
+          f"  p95 {result['cold_start_ms']['p95']:.1f} ms"
+          f"  ({result['runs']} runs)")
+    print(f"       rss: {result['rss_start_mb']} MB after the start,"
+          f" {result['rss_end_mb']} MB after {args.changes} ip/port changes")
+
+    report = {"commit": commit(),
+              "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "python": sys.version.split()[0],
+              "platform": platform.platform(),
+              "params": {"runs": args.runs, "changes": args.changes},
+              "scenarios": {"startup": result}}
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        name = f"{report['commit'] or 'tree'}-{time.strftime('%Y%m%d%H%M%S')}"
+        output = os.path.join(RESULTS_DIR, f"startup-{name}.json")
+
+    with open(output, "w", encoding="utf-8") as outfile:
+        json.dump(report, outfile, indent=2)
+
+    print(f"results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
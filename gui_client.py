@@ -10,32 +10,69 @@
 client.py--a GUI client app to be used with the 'PrivateChatRoom-Server'.
 '''
 
-import threading
-import time
+import argparse
 import tkinter
 import tkinter.scrolledtext
-from tkinter import simpledialog
+from tkinter import filedialog
+from tkinter import ttk
 import os
 import sys
+import time
 from pcr_app_utils import app_server_connection
-from pcr_app_utils.app_dialogs import dialog
+from pcr_app_utils import app_client_core
+from pcr_app_utils import app_file_transfer
+from pcr_app_utils import app_framing
+from pcr_app_utils import app_history
+from pcr_app_utils import app_metrics
+from pcr_app_utils import app_profiling
+from pcr_app_utils import app_rooms
+from pcr_app_utils import app_transport
+from pcr_app_utils import app_ui_queue
+from pcr_app_utils.app_scrollback import Scrollback
+from pcr_app_utils.app_typewriter import Typewriter
+from pcr_app_utils import app_dialogs
+from pcr_app_utils import app_logging
 from pcr_app_utils.app_logging import app_log
 
 logger = app_log(__name__)
 
-# Format in which we will encode/decode the data
-FORMAT = "utf-8"
+# Milliseconds between two drains of the ui queue.
+PUMP_INTERVAL = 50
 
+# Milliseconds between two updates of the stats panel.
+STATS_INTERVAL = 1000
 
-class Client():
-    ''' The client GUI class. '''
+# Milliseconds after the last key press before the search runs.
+SEARCH_DELAY = 150
+
+# Lines of the chat display, fewer while the search results are shown.
+TEXT_HEIGHT = 24
+SEARCH_TEXT_HEIGHT = 17
 
-    win = None
-    gui_done = False
+# Room of the servers without rooms, always open.
+MAIN_ROOM = app_client_core.DEFAULT_ROOM
 
-    def __init__(self, connected, alias=None):
-        self.connected = connected
-        self.widget = {"ip_label": None,
+# Background colors for the state of the connection.
+GREEN = "lightgreen"
+RED = "#FF6347"
+YELLOW = "#FFD966"
+COLORS = {"green": GREEN, "red": RED, "yellow": YELLOW}
+
+
+class Client():
+    ''' The client GUI class, a window on top of a ClientCore session. '''
+
+    def __init__(self, host, port, alias=None,
+                 engine=app_transport.DEFAULT_ENGINE, show_stats=False,
+                 servers=None, history=None, rooms=(),
+                 receive_files=app_file_transfer.RECEIVE_FILES):
+        self.win = None
+
+        # Latest state of the connection (app_client_core.STATUS_*).
+        self.state = app_client_core.STATUS_CONNECTING
+        self.show_stats = show_stats
+        self.widget = {"frame": None,
+                       "ip_label": None,
                        "port_label": None,
                        "ipv4_button": None,
                        "port_button": None,
@@ -44,29 +81,95 @@ class Client():
                        "msg_label": None,
                        "input_area": None,
                        "send_button": None,
+                       "typewriter_check": None,
+                       "older_button": None,
+                       "stats_check": None,
+                       "stats_label": None,
+                       "attach_button": None,
+                       "transfer_label": None,
+                       "search_label": None,
+                       "search_entry": None,
+                       "search_results": None,
+                       "room_tabs": None,
+                       "join_button": None,
+                       "leave_button": None,
+                       "member_list": None,
                        "copy_label": None}
 
+        # Queue of updates from the network threads for the GUI thread.
+        self.ui_queue = app_ui_queue.UiQueue()
+
+        # True while the send queue is full.
+        self.sending_blocked = False
+
+        # Retry state shown next to the port, empty while connected.
+        self.retry_text = ""
+
+        # Round-trip time shown next to the port, empty until measured.
+        self.rtt_text = ""
+
+        # Snapshot of the metrics at the last update of the stats panel.
+        self.last_stats = None
+
+        # Files being sent or received, by transfer id.
+        self.transfers = {}
+
+        # Sequence numbers of the search results shown and the pending
+        #   search, every room has its own search index.
+        self.search_hits = []
+        self.search_job = None
+
+        # Saved messages (app_history.HistoryStore), None if not kept.
+        self.history = history
+
+        # Messages received from now on are in the scrollback, the older
+        #   ones are read from the history.
+        self.started = time.time()
+
+        # The rooms of the window (app_rooms.Rooms) and the tab of each
+        #   room, created with the widgets.
+        self.rooms = None
+        self.tabs = {}
+
         if alias is None:
             # Get alias from the user.
             self.alias = Client.alias_win()
         else:
             self.alias = alias
 
-        # Start the gui thread.
-        self.start_threads()
+        # The chat session, its callbacks hand everything to the GUI thread.
+        self.core = app_client_core.ClientCore(
+                    host, port, self.alias, engine,
+                    on_message=lambda message: self.ui_queue.post(
+                                        app_ui_queue.EVENT_CHAT,
+                                        (message.room, message.text)),
+                    on_roster=lambda text, room: self.ui_queue.post(
+                                        app_ui_queue.EVENT_ROSTER,
+                                        (room, text)),
+                    on_status=lambda state, info: self.ui_queue.call(
+                                        self.status_changed, state, info),
+                    on_transfer=lambda transfer: self.ui_queue.call(
+                                        self.show_transfer, transfer),
+                    on_rtt=lambda rtt_ms: self.ui_queue.call(
+                                        self.show_rtt, rtt_ms),
+                    on_members=lambda changes, room: self.ui_queue.call(
+                                        self.show_members, changes, room),
+                    servers=servers, history=history, rooms=rooms,
+                    receive_files=receive_files)
+
+        # Connect to the server in the background, so the window does not
+        #   have to wait for it.
+        self.core.start()
 
     @staticmethod
     def alias_win():
         ''' Methode to create the alias window. '''
 
-        msg_win = dialog()
-
         logger.debug(" alias is being requested.")
 
         # Getting user's name
-        alias = simpledialog.askstring("PrivateChatRoom",
-                                       "\t\tPlease enter your alias\t\t",
-                                       parent=msg_win)
+        alias = app_dialogs.ask_string("PrivateChatRoom",
+                                       "\t\tPlease enter your alias\t\t")
 
         # If the user canceled or closed the window, exit the program.
         if alias is None:
@@ -77,44 +180,119 @@ class Client():
 
         return alias
 
-    def start_threads(self):
-        ''' Initiate a thread for the main GUI. '''
+    def status_changed(self, state, info):
+        ''' Method called on the GUI thread when the connection changes. '''
+
+        self.state = state
+
+        # Measured again on the next connection.
+        self.rtt_text = ""
+
+        if state == app_client_core.STATUS_CONNECTED:
+            self.retry_text = ""
+            self.notice(self.status_message())
+
+        elif state == app_client_core.STATUS_RETRY:
+            self.retry_text = f"  (retry {info['attempt']} in " \
+                              f"{info['delay']:.0f}s)"
+
+            # Only explain the problem once, not on every retry.
+            if info["attempt"] == 1:
+                self.notice(self.status_message())
+
+        elif state == app_client_core.STATUS_DISCONNECTED:
+            # Let the user know the the server is disconnected.
+            msg = "\t\tdisconnected from the server...\n"
+            self.notice(msg)
+
+        self.show_status()
+
+    def notice(self, text):
+        ''' Show a message of the app in the room that is shown. '''
+
+        self.ui_queue.post(app_ui_queue.EVENT_CHAT, (self.rooms.visible, text))
+
+    @property
+    def scrollback(self):
+        ''' The scrollback of the room shown in the chat display. '''
+
+        return self.rooms.current().scrollback
 
-        # Creating a thread for GUI part.
-        gui_thread = threading.Thread(target=self.gui_loop)
+    def status_color(self):
+        ''' Return the background color for the state of the connection. '''
 
-        # Creating another thread for receiving messages from server.
-        receive_thread = threading.Thread(target=self.receive)
+        return COLORS[app_client_core.STATUS_COLORS[self.state]]
 
-        # Starting the threads.
-        gui_thread.start()
-        receive_thread.start()
+    def status_message(self):
+        ''' Return the text telling the user the state of the connection. '''
 
-        logger.debug(" gui and receive threads have started.")
+        # Let the user know that the app is connected to the server.
+        if self.core.is_connected():
+            return "\tconnected to the server...\n"
+
+        # If there is no internet connection, display a message.
+        if not self.core.connected["inet"]:
+            msg = "\n\n\n\n\n\tcould not connect to the server...\n\n"
+            msg1 = "\tPlease verify that you are connected to the internet!\n"
+            return msg + msg1
+
+        # Otherwise display a message to check server, ip/port.
+        msg = "\n\n\n\n\n\tcould not connect to the server...\n\n"
+        msg1 = "\tPlease verify that the server is running and that the"
+        msg2 = " ip/port are correct!\n"
+        return msg + msg1 + msg2
+
+    def show_status(self):
+        ''' Color the window for the state of the connection. '''
+
+        status_color = self.status_color()
+
+        self.win.config(bg=status_color)
+
+        for name in ("frame", "ip_label", "port_label", "msg_label",
+                     "transfer_label", "search_label", "copy_label"):
+            self.widget[name].config(bg=status_color)
+
+        # Update the labels with the address in use and the retry state.
+        connected = self.core.connected
+        self.widget["ip_label"].config(text=f"ip: {connected['host']} ")
+        self.show_port()
+
+    def show_port(self):
+        ''' Show the port with the retry state and the round-trip time. '''
+
+        self.widget["port_label"].config(
+                    text=f"port: {self.core.connected['port']}"
+                         f"{self.retry_text}{self.rtt_text}")
+
+    def show_rtt(self, rtt_ms):
+        ''' Show the round-trip time of the latest heartbeat ping. '''
+
+        if not self.core.is_connected():
+            return
+
+        self.rtt_text = f"  ({rtt_ms:.1f} ms)"
+        self.show_port()
 
     def gui_loop(self):
-        '''Method to create the main GUI'''
+        '''
+        Method to create the main GUI and run it, must be called from the
+        main thread.
+        '''
 
-        # Creating the main window.
-        Client.win = tkinter.Tk()
-        Client.win.title("PrivateChatRoom-App v1.1.2")
-        Client.win.geometry("685x780")
+        # The main window is the Tk root the message boxes use as well.
+        self.win = app_dialogs.root()
+        self.win.title("PrivateChatRoom-App v1.2.0")
+        self.win.geometry("815x845")
 
         # Create a frame.
-        frame = tkinter.Frame(Client.win)
-
-        # Set color variables for the background.
-        green = "lightgreen"
-        red = "#FF6347"
+        frame = tkinter.Frame(self.win)
+        self.widget["frame"] = frame
 
-        if not self.connected["conn"]:
-            Client.win.config(bg=red)
-            frame.config(bg=red)
-            status_color = red
-        else:
-            Client.win.config(bg=green)
-            frame.config(bg=green)
-            status_color = green
+        # Set the background color for the state of the connection.
+        status_color = self.status_color()
+        self.win.config(bg=status_color)
+        frame.config(bg=status_color)
 
         # Call the gui_texts method which contains the text
         #   widgets for the GUI.
@@ -132,15 +310,21 @@ class Client():
         # Pack the frame
         frame.pack(expand=1)
 
-        # Setting flag to true indicating GUI has been set up.
-        Client.gui_done = True
-
         # Function to be called when user tries to close the window.
-        Client.win.protocol("WM_DELETE_WINDOW", self.stop)
+        self.win.protocol("WM_DELETE_WINDOW", self.stop)
+
+        # Show the root, it is hidden while only message boxes use it.
+        self.win.deiconify()
 
         logger.debug(" gui has been created.")
 
-        Client.win.mainloop()
+        # Start draining the ui queue.
+        self.pump()
+
+        if self.show_stats:
+            self.update_stats()
+
+        self.win.mainloop()
 
     def gui_texts(self, frame):
         ''' Text boxes for the GUI. '''
@@ -158,32 +342,68 @@ class Client():
         self.widget["text_area"] = tkinter.scrolledtext.ScrolledText(
                                                            frame,
                                                            bg="#f5f5f5",
+                                                           height=TEXT_HEIGHT,
                                                            font=("italic",
                                                                  10))
 
-        # Let the user know that the app is connected to the server.
-        if self.connected["conn"]:
-            msg = "\tconnected to the server...\n"
-            self.widget["text_area"].insert("end", chars=msg)
-
-        # If there is no internet connection, display a message.
-        elif not self.connected["inet"]:
-            msg = "\n\n\n\n\n\tcould not connect to the server...\n\n"
-            msg1 = "\tPlease verify that you are connected to the internet!\n"
-            self.widget["text_area"].insert("end", chars=msg)
-            self.widget["text_area"].insert("end", chars=msg1)
-
-        # Otherwise display a message to check server, ip/port.
-        elif self.connected["inet"]:
-            msg = "\n\n\n\n\n\tcould not connect to the server...\n\n"
-            msg1 = "\tPlease verify that the server is running and that the"
-            msg2 = " ip/port are correct!\n"
-            self.widget["text_area"].insert("end", chars=msg)
-            self.widget["text_area"].insert("end", chars=msg1+msg2)
+        # Let the user know that the app is connecting to the server.
+        msg = "\tconnecting to the server...\n"
+        self.widget["text_area"].insert("end", chars=msg)
 
         # Disabling the widget as we don't need to type here.
         self.widget["text_area"].config(state="disabled")
 
+        # Displays the received messages as if typed.
+        self.typewriter = Typewriter(self.widget["text_area"])
+
+        # Every room keeps its messages in a scrollback, the one of the
+        #   room shown limits the lines in the chat display and loads older
+        #   pages when the user scrolls to the top.
+        self.rooms = app_rooms.Rooms(self.make_scrollback)
+        self.rooms.open(MAIN_ROOM)
+
+        # Show the last messages of the earlier sessions.
+        if self.history is not None and self.scrollback.load_older():
+            self.widget["text_area"].see("end")
+
+        self.scrollback.load_on_scroll()
+
+        # Tabs of the rooms, they select the room shown in the chat display.
+        self.widget["room_tabs"] = ttk.Notebook(frame)
+        self.widget["room_tabs"].bind("<<NotebookTabChanged>>",
+                                      self.select_room)
+
+        for name in [MAIN_ROOM] + sorted(self.core.rooms - {MAIN_ROOM}):
+            self.add_tab(self.rooms.open(name))
+
+        # Search bar, searches while the user types.
+        self.widget["search_entry"] = tkinter.Entry(frame,
+                                                    width=45,
+                                                    font=("italic", 10))
+
+        self.widget["search_entry"].bind("<KeyRelease>", self.schedule_search)
+        self.widget["search_entry"].bind("<Escape>", self.clear_search)
+
+        # Results of the search, only shown while there is a query.
+        self.widget["search_results"] = tkinter.Listbox(frame,
+                                                        height=6,
+                                                        width=80,
+                                                        bg="#f5f5f5",
+                                                        font=("italic", 9))
+
+        self.widget["search_results"].bind("<<ListboxSelect>>",
+                                           self.jump_to_result)
+
+        # Color of the message a search result jumped to.
+        self.widget["text_area"].tag_config("search_hit", background=YELLOW)
+
+        # Members of the room shown, only filled by servers sending them.
+        self.widget["member_list"] = tkinter.Listbox(frame,
+                                                     width=16,
+                                                     bg="#f5f5f5",
+                                                     activestyle="none",
+                                                     font=("italic", 9))
+
         # Text area where users can type messages.
         self.widget["input_area"] = tkinter.Text(frame,
                                                  height=2,
@@ -194,8 +414,8 @@ class Client():
     def gui_labels(self, frame, status_color):
         ''' Contains labels for the GUI. '''
 
-        ip_addr = f"ip: {self.connected['host']} "
-        port = f"port: {self.connected['port']}"
+        ip_addr = f"ip: {self.core.connected['host']} "
+        port = f"port: {self.core.connected['port']}"
 
         # Add a label for displaying ip_v4 in use.
         self.widget["ip_label"] = tkinter.Label(frame,
@@ -226,6 +446,28 @@ class Client():
 
         self.widget["copy_label"].config(font=("Times", 9))
 
+        # Label for the stats panel, only shown when turned on.
+        self.widget["stats_label"] = tkinter.Label(frame,
+                                                   text="",
+                                                   justify="left",
+                                                   bg="#f5f5f5")
+
+        self.widget["stats_label"].config(font=("Courier", 9))
+
+        # Label showing the progress of the files sent/received.
+        self.widget["transfer_label"] = tkinter.Label(frame,
+                                                      text="",
+                                                      bg=status_color)
+
+        self.widget["transfer_label"].config(font=("Times", 10))
+
+        # Label in front of the search bar with the number of results.
+        self.widget["search_label"] = tkinter.Label(frame,
+                                                    text="Search:",
+                                                    bg=status_color)
+
+        self.widget["search_label"].config(font=("Times", 10))
+
         logger.debug(" gui label widgets have been set-up.")
 
     def gui_buttons(self, frame):
@@ -267,6 +509,74 @@ class Client():
 
         self.widget["port_button"].config(font=("Times", 12), width=20)
 
+        # Checkbutton to turn the typewriter effect on/off.
+        self.typewriter_var = tkinter.BooleanVar(value=True)
+        self.widget["typewriter_check"] = tkinter.Checkbutton(
+                                            frame,
+                                            text="typewriter effect",
+                                            variable=self.typewriter_var,
+                                            command=self.toggle_typewriter)
+
+        self.widget["typewriter_check"].config(font=("Times", 10))
+
+        # Button to show messages that have been trimmed from the display.
+        self.widget["older_button"] = tkinter.Button(
+                                            frame,
+                                            text="load older",
+                                            activebackground="lightblue",
+                                            activeforeground="black",
+                                            bd=2,
+                                            relief="raised",
+                                            command=self.load_older)
+
+        self.widget["older_button"].config(font=("Times", 10))
+
+        # Checkbutton to show/hide the stats panel.
+        self.stats_var = tkinter.BooleanVar(value=self.show_stats)
+        self.widget["stats_check"] = tkinter.Checkbutton(
+                                            frame,
+                                            text="stats",
+                                            variable=self.stats_var,
+                                            command=self.toggle_stats)
+
+        self.widget["stats_check"].config(font=("Times", 10))
+
+        # Button to send a file to the other users.
+        self.widget["attach_button"] = tkinter.Button(
+                                            frame,
+                                            text="attach file",
+                                            activebackground="lightblue",
+                                            activeforeground="black",
+                                            bd=2,
+                                            relief="raised",
+                                            command=self.attach_file)
+
+        self.widget["attach_button"].config(font=("Times", 10))
+
+        # Buttons to join another room and to leave the one shown.
+        self.widget["join_button"] = tkinter.Button(
+                                            frame,
+                                            text="join room",
+                                            activebackground="lightblue",
+                                            activeforeground="black",
+                                            bd=2,
+                                            relief="raised",
+                                            command=self.join_room)
+
+        self.widget["join_button"].config(font=("Times", 10))
+
+        self.widget["leave_button"] = tkinter.Button(
+                                            frame,
+                                            text="leave room",
+                                            activebackground="lightblue",
+                                            activeforeground="black",
+                                            bd=2,
+                                            relief="raised",
+                                            state="disabled",
+                                            command=self.leave_room)
+
+        self.widget["leave_button"].config(font=("Times", 10))
+
         logger.debug(" gui button widgets have been set-up.")
 
     def gui_layout(self):
@@ -300,136 +610,571 @@ class Client():
                                              column=0,
                                              pady=10)
 
-        self.widget["text_area"].grid(row=4,
+        self.widget["older_button"].grid(row=3,
+                                         column=0,
+                                         padx=10,
+                                         sticky="w")
+
+        self.widget["typewriter_check"].grid(row=3,
+                                             column=0,
+                                             padx=10,
+                                             sticky="e")
+
+        self.widget["stats_check"].grid(row=3,
+                                        column=0)
+
+        self.widget["stats_label"].grid(row=4,
+                                        column=0,
+                                        padx=10,
+                                        sticky="we")
+
+        # Hidden until the user turns the stats panel on.
+        if not self.show_stats:
+            self.widget["stats_label"].grid_remove()
+
+        self.widget["search_label"].grid(row=5,
+                                         column=0,
+                                         padx=10,
+                                         sticky="w")
+
+        self.widget["search_entry"].grid(row=5,
+                                         column=0)
+
+        self.widget["search_results"].grid(row=6,
+                                           column=0,
+                                           padx=10,
+                                           pady=5)
+
+        # Hidden until the user searches.
+        self.widget["search_results"].grid_remove()
+
+        self.widget["room_tabs"].grid(row=7,
+                                      column=0,
+                                      padx=10,
+                                      sticky="w")
+
+        self.widget["join_button"].grid(row=7,
+                                        column=0,
+                                        padx=100,
+                                        sticky="e")
+
+        self.widget["leave_button"].grid(row=7,
+                                         column=0,
+                                         padx=10,
+                                         sticky="e")
+
+        self.widget["text_area"].grid(row=8,
                                       column=0,
                                       padx=10,
                                       pady=5)
 
-        self.widget["msg_label"].grid(row=5,
+        self.widget["member_list"].grid(row=8,
+                                        column=1,
+                                        padx=(0, 10),
+                                        pady=5,
+                                        sticky="ns")
+
+        self.widget["msg_label"].grid(row=9,
                                       column=0)
 
-        self.widget["input_area"].grid(row=6,
+        self.widget["transfer_label"].grid(row=9,
+                                           column=0,
+                                           padx=20,
+                                           sticky="w")
+
+        self.widget["attach_button"].grid(row=9,
+                                          column=0,
+                                          padx=20,
+                                          sticky="e")
+
+        self.widget["input_area"].grid(row=10,
                                        column=0,
                                        padx=20,
                                        pady=10)
 
-        self.widget["send_button"].grid(row=7,
+        self.widget["send_button"].grid(row=11,
                                         column=0,
                                         pady=5)
 
-        self.widget["copy_label"].grid(row=8)
+        self.widget["copy_label"].grid(row=12)
 
         logger.debug(" gui layout has been set-up.")
 
     def send(self):
         ''' Method to send a message to the server'''
 
-        try:
-            # Constructing the message with user's alias and content.
-            msg = self.widget['input_area'].get('1.0', 'end')
-            msg = msg.strip()
-            message = f"{self.alias}: {msg}\n"
-
-            if self.connected["conn"]:
-                # Sending it to server.
-                self.connected["sock"].send(message.encode(FORMAT))
+        # Constructing the message content.
+        msg = self.widget['input_area'].get('1.0', 'end')
+        msg = msg.strip()
+        room = self.rooms.visible
 
-            # Clearing the input area.
-            self.widget["input_area"].delete("1.0", "end")
+        try:
+            # Very large messages are sent in chunks, as a text file (the
+            #   files go to the main room).
+            if len(msg) >= app_file_transfer.LARGE_MESSAGE and \
+                    room == MAIN_ROOM and self.core.files_supported():
+                self.core.send_large(msg)
+
+            # Queue it for sending to the server.
+            elif not self.core.send(msg, room=room):
+                # Too many messages are waiting, keep the text so the
+                #   user can send it again.
+                self.show_backpressure(True)
+                return
+
+        except app_framing.FrameError:
+            # Too large for one message and the server takes no files.
+            msg = "\t\tthe message is too large to be sent...\n"
+            self.notice(msg)
+            return
+
+        except ConnectionError as error:
+            if self.core.is_connected():
+                # Connected, but the server has no rooms.
+                self.notice(f"\t\tthe message can not be sent ({error})"
+                            f"...\n")
+                return
 
-        except OSError:
             logger.error("disconnected from the server...")
 
             # Let the user know the the server is disconnected.
-            self.widget["text_area"].config(state="normal")
             msg = "\t\tdisconnected from the server...\n"
-            self.widget["text_area"].insert("end", chars=msg)
-            self.widget["text_area"].yview("end")
-            self.widget["text_area"].config(state="disabled")
+            self.notice(msg)
+
+        # Clearing the input area.
+        self.widget["input_area"].delete("1.0", "end")
+
+    def show_backpressure(self, waiting):
+        ''' Let the user know if the messages can not be sent fast enough. '''
+
+        self.sending_blocked = waiting
+
+        if waiting:
+            logger.warning(" send queue is full.")
+            self.widget["msg_label"].config(text="Message: (busy, please wait)",
+                                            fg="#b22222")
+        else:
+            self.widget["msg_label"].config(text="Message: ", fg="black")
 
     def stop(self):
         ''' Method to be called when user wants to quit '''
 
-        # Send a message to the server that the alias has left the chat.
-        try:
-            if self.connected["conn"]:
-                msg = f"\t{self.alias} has left the chat...\n"
-                self.connected["sock"].send(msg.encode(FORMAT))
-        except BrokenPipeError:
-            logger.info(" sever is offline...")
+        # Tell the server that the alias has left the chat and close the
+        #   connection.
+        self.core.close()
+
+        # Write the last metrics record, os._exit skips the atexit hooks.
+        app_metrics.stop()
 
-        # Setting the socket connection to false, so the receive loop will end.
-        self.connected["conn"] = False
+        # Write the profile, if profiling (for the same reason).
+        app_profiling.stop()
 
-        Client.win.destroy()  # Closing the window.
+        # Write the messages still queued for the history.
+        if self.history is not None:
+            self.history.close()
 
-        if self.connected["sock"]:
-            self.connected["sock"].close()  # Closing the socket connection.
-            logger.info(" disconnected from the server by the user.")
+        # Close an open message box, then the window.
+        app_dialogs.close_all()
+        self.win.destroy()  # Closing the window.
 
         logger.info("[STOP]: program closed by the user...")
 
+        # Write the queued log records, os._exit skips the atexit hooks.
+        app_logging.shutdown()
+
         os._exit(0)  # Exiting program.
 
-    def receive(self):
-        ''' Method to receive a message from the server '''
-        while self.connected["conn"]:
-            try:
-                # Receiving a message from the server.
-                message = self.connected["sock"].recv(1024).decode(FORMAT)
-                if message == "ALIAS":
-                    # If server asks for alias, send it.
-                    self.connected["sock"].send(self.alias.encode(FORMAT))
-
-                connections_display = message[:1].isdigit() or \
-                    message.endswith(" online...")
-
-                if Client.gui_done and connections_display:
-                    # Updating connections display.
-                    # Enabling the text area to add message.
-                    if self.widget["connections_text"]:
-                        self.widget["connections_text"].config(state="normal")
-
-                        # Clear the previous message.
-                        self.widget["connections_text"].delete(1.0,
-                                                               tkinter.END)
-
-                        # Adding the newly received message.
-                        self.widget["connections_text"].insert(1.0,
-                                                               message)
-
-                        # Disabling text area again as it's not for
-                        #   user input.
-                        self.widget["connections_text"].config(
-                                                            state="disabled")
-
-                if Client.gui_done and not connections_display:
-                    # Updating chat display.
-                    if self.widget["text_area"]:
-                        self.widget["text_area"].config(state="normal")
-
-                        # Insert the message as if typed.
-                        for letter in message:
-                            # Adding the newly received message.
-                            self.widget["text_area"].insert("end",
-                                                            letter)
-                            time.sleep(0.07)
-
-                            # Auto scroll down to see new messages.
-                            self.widget["text_area"].yview("end")
-
-                        self.widget["text_area"].config(state="disabled")
-
-            except ConnectionAbortedError:
-                # Log error message if connection is aborted.
-                logger.error(" connection has been aborted!")
-                break
-
-            except IndexError:
-                # Close the socket and log message.
-                self.connected["sock"].close()
-                logger.error(" disconnected from the server!")
-                sys.exit()
+    def pump(self):
+        ''' Method to apply the queued updates to the widgets. '''
+
+        metrics = self.core.metrics
+
+        # Number of events that piled up since the last drain.
+        metrics.gauge("ui_queue_depth", self.ui_queue.depth())
+
+        batch = self.ui_queue.drain()
+        render_start = time.perf_counter()
+
+        with app_profiling.span("render"):
+            self.render(batch)
+
+        # Time spent updating the widgets.
+        if batch.chat or batch.roster:
+            metrics.observe("render_ms",
+                            (time.perf_counter() - render_start) * 1000)
+
+        # Let the user send again once the send queue has room.
+        if self.sending_blocked and \
+                self.core.pending() < app_transport.MAX_PENDING // 2:
+            self.show_backpressure(False)
+
+        # Run the calls other threads have scheduled for the GUI thread.
+        with app_profiling.span("ui_calls"):
+            for _, (func, args) in batch.other:
+                func(*args)
+
+        self.win.after(PUMP_INTERVAL, self.pump)
+
+    def render(self, batch):
+        ''' Show the roster and chat updates of a drained batch. '''
+
+        for name, text in batch.roster.items():
+            room = self.rooms.get(name)
+            if room is not None:
+                room.roster = text
+
+            # Updating connections display with the latest count only.
+            if name == self.rooms.visible:
+                self.show_roster(text)
+
+        if batch.chat:
+            shown = []
+            unread = set()
+
+            # Keep a record of the messages in the scrollback of their room,
+            #   only those of the room shown go to the chat display.
+            for name, message in batch.chat:
+                room, _ = self.rooms.add(name, message)
+                if room is None:
+                    continue
+                if room.name == self.rooms.visible:
+                    shown.append(message)
+                else:
+                    unread.add(room)
+
+            # Updating chat display, the messages are typed by the
+            #   typewriter or inserted all at once if it is turned off.
+            self.typewriter.write_many(shown)
+
+            # Delete the oldest lines if the display holds too many.
+            self.scrollback.trim()
+
+            # Count the new messages on the tabs of the other rooms.
+            for room in unread:
+                self.update_tab(room)
+
+    def attach_file(self):
+        ''' Let the user pick a file and send it to the other users. '''
+
+        path = filedialog.askopenfilename(parent=self.win,
+                                          title="Send a file")
+        if not path:
+            return
+
+        try:
+            self.core.send_file(path)
+
+        except ConnectionError as error:
+            msg = f"\t\tthe file can not be sent ({error})...\n"
+            self.notice(msg)
+
+        except OSError as error:
+            logger.error(" could not open %s: %s", path, error)
+            msg = f"\t\tcould not open {os.path.basename(path)}...\n"
+            self.notice(msg)
+
+    def show_transfer(self, transfer):
+        ''' Show the progress of a file sent or received. '''
+
+        if transfer.state == app_file_transfer.ACTIVE:
+            self.transfers[transfer.id] = transfer
+        else:
+            self.transfers.pop(transfer.id, None)
+
+            # Let the user know how the transfer has ended.
+            if transfer.direction == app_file_transfer.RECEIVING:
+                if transfer.state == app_file_transfer.DONE:
+                    msg = f"\t{transfer.sender} has sent {transfer.name}, " \
+                          f"saved to {transfer.path}\n"
+                else:
+                    msg = f"\t{transfer.name} from {transfer.sender}: " \
+                          f"{transfer.state}...\n"
+            elif transfer.state == app_file_transfer.DONE:
+                msg = f"\t{transfer.name} has been sent.\n"
+            else:
+                msg = f"\tsending {transfer.name}: {transfer.state}...\n"
+
+            self.notice(msg)
+
+        # Arrow up (sending) or down with the percentage of the transfers.
+        progress = []
+        for item in list(self.transfers.values())[:3]:
+            arrow = "\u2191" if item.direction == app_file_transfer.SENDING \
+                else "\u2193"
+            progress.append(f"{arrow} {item.name[:20]} {item.progress:.0%}")
+
+        self.widget["transfer_label"].config(text="  ".join(progress))
+
+    def toggle_typewriter(self):
+        ''' Turn the typewriter effect on/off. '''
+
+        self.typewriter.set_enabled(self.typewriter_var.get())
+
+    def toggle_stats(self):
+        ''' Show/hide the stats panel. '''
+
+        self.show_stats = self.stats_var.get()
+
+        if self.show_stats:
+            self.widget["stats_label"].grid()
+            self.last_stats = None
+            self.update_stats()
+        else:
+            self.widget["stats_label"].grid_remove()
+
+    def update_stats(self):
+        ''' Refresh the stats panel while it is shown. '''
+
+        if not self.show_stats:
+            return
+
+        metrics = self.core.metrics
+        metrics.gauge("send_queue_depth", self.core.pending())
+
+        snapshot = metrics.snapshot()
+        self.widget["stats_label"].config(
+                        text=self.stats_text(self.last_stats, snapshot))
+        self.last_stats = snapshot
+
+        self.win.after(STATS_INTERVAL, self.update_stats)
+
+    @staticmethod
+    def stats_text(previous, snapshot):
+        ''' Return the text of the stats panel for a metrics snapshot. '''
+
+        rate = app_metrics.rates(previous, snapshot) if previous else {}
+        counters = snapshot["counters"]
+        gauges = snapshot["gauges"]
+        histograms = snapshot["histograms"]
+
+        def timing(name, key):
+            value = histograms.get(name, {}).get(key)
+            return "-" if value is None else f"{value:.1f}"
+
+        line1 = f"in {rate.get('messages_in', 0):.1f} msg/s " \
+                f"{rate.get('bytes_in', 0) / 1024:.1f} KiB/s   " \
+                f"out {rate.get('messages_out', 0):.1f} msg/s " \
+                f"{rate.get('bytes_out', 0) / 1024:.1f} KiB/s   " \
+                f"decode errors {counters.get('decode_errors', 0)}"
+        line2 = f"rtt p50 {timing('rtt_ms', 'p50')} " \
+                f"p95 {timing('rtt_ms', 'p95')} ms   " \
+                f"render p50 {timing('render_ms', 'p50')} " \
+                f"p95 {timing('render_ms', 'p95')} ms   " \
+                f"connect {timing('connect_ms', 'max')} ms"
+        line3 = f"ui queue {gauges.get('ui_queue_depth', 0)}   " \
+                f"send queue {gauges.get('send_queue_depth', 0)}   " \
+                f"reconnects {counters.get('reconnects', 0)}"
+
+        return "\n".join((line1, line2, line3))
+
+    def schedule_search(self, event):
+        ''' Search once the user stops typing for a moment. '''
+
+        if event.keysym == "Escape":
+            return
+
+        if self.search_job is not None:
+            self.win.after_cancel(self.search_job)
+
+        self.search_job = self.win.after(SEARCH_DELAY, self.search)
+
+    def search(self):
+        ''' Show the messages matching the search bar. '''
+
+        self.search_job = None
+        query = self.widget["search_entry"].get().strip()
+
+        if not query:
+            self.clear_search()
+            return
+
+        with self.core.metrics.timer("search_ms"):
+            hits = self.rooms.current().search_index.search(query)
+
+        # Only the messages still in the scrollback can be shown.
+        records = [self.scrollback.record(seq) for seq in hits]
+        records = [record for record in records if record is not None]
+        self.search_hits = [record.seq for record in records]
+
+        results = self.widget["search_results"]
+        results.delete(0, "end")
+
+        for record in records:
+            when = time.strftime("%H:%M:%S", time.localtime(record.time))
+            first_line = record.text.strip().split("\n", 1)[0]
+            results.insert("end", f"{when}  {first_line[:100]}")
+
+        self.widget["search_label"].config(
+                                text=f"Search: ({len(self.search_hits)})")
+
+        # Make room for the results.
+        results.grid()
+        self.widget["text_area"].config(height=SEARCH_TEXT_HEIGHT)
+
+    def clear_search(self, _event=None):
+        ''' Empty the search bar and hide the results. '''
+
+        self.widget["search_entry"].delete(0, "end")
+        self.widget["search_results"].delete(0, "end")
+        self.widget["search_results"].grid_remove()
+        self.widget["search_label"].config(text="Search:")
+        self.widget["text_area"].tag_remove("search_hit", "1.0", "end")
+        self.widget["text_area"].config(height=TEXT_HEIGHT)
+        self.search_hits = []
+
+    def jump_to_result(self, _event):
+        ''' Scroll to the message of the selected result and mark it. '''
+
+        selection = self.widget["search_results"].curselection()
+        if not selection:
+            return
+
+        position = self.scrollback.reveal(self.search_hits[selection[0]])
+
+        if position is None:
+            self.widget["search_label"].config(text="Search: (trimmed)")
+            return
+
+        line, lines = position
+        text_area = self.widget["text_area"]
+        text_area.tag_remove("search_hit", "1.0", "end")
+        text_area.tag_add("search_hit", f"{line}.0", f"{line + lines}.0")
+        text_area.see(f"{line}.0")
+
+    def load_older(self):
+        ''' Show messages that have been trimmed from the chat display. '''
+
+        if not self.scrollback.load_older(keep_position=True):
+            logger.debug(" no older messages to load.")
+
+    def make_scrollback(self, name):
+        ''' Return the scrollback of a room, backed by the chat display. '''
+
+        pager = None
+        if self.history is not None:
+            pager = app_history.HistoryPager(self.history, name, self.started)
+
+        return Scrollback(self.widget["text_area"], history=pager)
+
+    def add_tab(self, room):
+        ''' Add the tab of a room, an empty frame selects it. '''
+
+        tab = tkinter.Frame(self.widget["room_tabs"], height=0)
+        self.widget["room_tabs"].add(tab, text=room.label())
+        self.tabs[room.name] = tab
+
+    def update_tab(self, room):
+        ''' Show the number of unread messages on the tab of a room. '''
+
+        tab = self.tabs.get(room.name)
+        if tab is not None:
+            self.widget["room_tabs"].tab(tab, text=room.label())
+
+    def show_roster(self, text):
+        ''' Show the roster of the room in the connections display. '''
+
+        self.widget["connections_text"].config(state="normal")
+        self.widget["connections_text"].delete(1.0, tkinter.END)
+        self.widget["connections_text"].insert(1.0, text or "")
+        self.widget["connections_text"].config(state="disabled")
+
+    def show_members(self, changes, name):
+        '''
+        Apply changes of the members of a room, only the aliases that
+        changed are inserted into/deleted from the member list.
+        '''
+
+        room = self.rooms.get(name)
+        if room is None:
+            return
+
+        edits = room.apply_members(changes)
+
+        if name != self.rooms.visible:
+            return
+
+        member_list = self.widget["member_list"]
+        for edit, index, alias in edits:
+            if edit == app_rooms.EDIT_INSERT:
+                member_list.insert(index, alias)
+            else:
+                member_list.delete(index)
+
+    def fill_members(self, room):
+        ''' Show the members of a room in the member list. '''
+
+        self.widget["member_list"].delete(0, tkinter.END)
+        if room.members:
+            self.widget["member_list"].insert(0, *room.members)
+
+    def select_room(self, _event=None):
+        ''' Show the room of the selected tab in the chat display. '''
+
+        selected = self.widget["room_tabs"].select()
+        name = next((name for name, tab in self.tabs.items()
+                     if str(tab) == selected), None)
+
+        if name is None or name not in self.rooms:
+            return
+
+        # The letters still to be typed belong to the room shown before,
+        #   they are in its scrollback.
+        if name != self.rooms.visible:
+            self.typewriter.clear()
+
+        room = self.rooms.show(name)
+        self.update_tab(room)
+        self.show_roster(room.roster)
+        self.fill_members(room)
+
+        # The main room can not be left.
+        self.widget["leave_button"].config(
+                    state="disabled" if name == MAIN_ROOM else "normal")
+
+        # Search the room now shown.
+        if self.widget["search_entry"].get().strip():
+            self.search()
+
+    def join_room(self):
+        ''' Let the user join a room, its tab is selected. '''
+
+        name = app_dialogs.ask_string("PrivateChatRoom",
+                                      "\tPlease enter the name of the "
+                                      "room\t\t")
+        if name is None:
+            return
+
+        name = name.strip()
+
+        try:
+            self.core.join(name)
+        except ValueError:
+            self.notice(f"\t\t{name!r} is not a valid room name...\n")
+            return
+        except ConnectionError as error:
+            self.notice(f"\t\tthe room can not be joined ({error})...\n")
+            return
+
+        room = self.rooms.get(name)
+        if room is None:
+            room = self.rooms.open(name)
+            self.add_tab(room)
+
+        self.widget["room_tabs"].select(self.tabs[name])
+
+    def leave_room(self):
+        ''' Leave the room shown, the main room is shown instead. '''
+
+        name = self.rooms.visible
+        if name == MAIN_ROOM:
+            return
+
+        self.core.leave(name)
+
+        # Its letters still to be typed go with it.
+        self.typewriter.clear()
+        self.rooms.close(name)
+        self.widget["room_tabs"].forget(self.tabs.pop(name))
 
     def change_ip(self):
         ''' The user can set the server's ipv4 address. '''
@@ -446,16 +1191,8 @@ class Client():
 
         ip_addr, port = app_server_connection.set_ip()
 
-        # Close socket connection.
-        self.connected["conn"] = False
-        if self.connected["sock"]:
-            self.connected["sock"].close()
-            logger.debug(" socket has been closed.")
-
-        # Pass the updated IPv4 address, port and alias to the main().
-        main(ip_addr, int(port), self.alias)
-
-        Client.gui_done = False
+        # Connect to the updated IPv4 address and port.
+        self.switch_server(ip_addr, port)
 
     def change_port(self):
         ''' the user can set the server's port number. '''
@@ -472,35 +1209,70 @@ class Client():
 
         ip_addr, port = app_server_connection.set_port()
 
-        # Close socket connection.
-        self.connected["conn"] = False
-        if self.connected["sock"]:
-            self.connected["sock"].close()
-            logger.debug(" socket has been closed.")
+        # Connect to the updated port and IPv4 address.
+        self.switch_server(ip_addr, port)
+
+    def switch_server(self, host, port):
+        '''
+        Replace the connection with one to the given server, the window,
+        the chat history and the alias are kept.
+        '''
 
-        # Pass the updated port, IPv4 address and alias to the main().
-        main(ip_addr, int(port), self.alias)
+        self.retry_text = ""
+        self.core.switch_server(host, port)
 
-        Client.gui_done = False
+        # Enable the buttons again.
+        for name in ("ipv4_button", "port_button"):
+            self.widget[name].config(state="normal", relief="raised")
 
 
-def main(host, port, alias=None):
+def main(host, port, engine=app_transport.DEFAULT_ENGINE, show_stats=False,
+         servers=None, history=None, rooms=(),
+         receive_files=app_file_transfer.RECEIVE_FILES):
     ''' Main entry point. '''
 
-    # On start-up of the App, an alias is not kown yet.
-    if alias is None:
-        connect = app_server_connection.connect_to_server(host, port)
-        Client(connect)
-    else:
-        Client.win.destroy()
-        logger.debug(" gui window has been destroyed.")
+    client = Client(host, port, engine=engine, show_stats=show_stats,
+                    servers=servers, history=history, rooms=rooms,
+                    receive_files=receive_files)
 
-        connect = app_server_connection.connect_to_server(host, port)
-        Client(connect, alias=alias)
+    # The window runs on the main thread, until the user closes it.
+    client.gui_loop()
+
+
+def parse_args():
+    ''' Parse the command line arguments. '''
+
+    parser = argparse.ArgumentParser(description="PrivateChatRoom-App")
+    parser.add_argument("--engine",
+                        choices=app_transport.ENGINES,
+                        default=app_transport.DEFAULT_ENGINE,
+                        help="network engine (default: %(default)s)")
+    parser.add_argument("--stats", action="store_true",
+                        help="show the stats panel")
+    app_rooms.add_arguments(parser)
+    app_file_transfer.add_arguments(parser)
+    app_metrics.add_arguments(parser)
+    app_history.add_arguments(parser)
+    app_logging.add_arguments(parser)
+    app_profiling.add_arguments(parser)
+
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
+    ARGS = parse_args()
+    app_logging.configure_from_args(ARGS)
+
+    # Before the client, so its threads are profiled as well.
+    app_profiling.start_from_args(ARGS)
+
     logger.info("[START]: program started by the user...")
 
+    app_metrics.start(ARGS)
     HOST, PORT = app_server_connection.get_ip_port()
-    main(HOST, int(PORT))
+
+    # Connect to the fastest of the server profiles.
+    main(HOST, PORT, engine=ARGS.engine, show_stats=ARGS.stats,
+         servers=app_server_connection.get_servers(),
+         history=app_history.from_args(ARGS), rooms=ARGS.rooms,
+         receive_files=ARGS.receive_files)
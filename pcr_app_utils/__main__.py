@@ -0,0 +1,15 @@
+#!/bin/env python3
+# -*- mode: python; coding: utf-8 -*-
+
+# Script by Thomas Pirchmoser (tommy_software@mailfence.com) 2024
+
+# This script was created for personal/educational purposes only and is not to
+#   be used for commercial or profit purposes.
+
+'''
+__main__.py--run the command line client with 'python -m pcr_app_utils'.
+'''
+
+from pcr_app_utils.app_cli import main
+
+main()
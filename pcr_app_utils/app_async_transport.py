@@ -0,0 +1,340 @@
+#!/bin/env python3
+# -*- mode: python; coding: utf-8 -*-
+
+# Script by Thomas Pirchmoser (tommy_software@mailfence.com) 2024
+
+# This script was created for personal/educational purposes only and is not to
+#   be used for commercial or profit purposes.
+
+'''
+app_async_transport.py--module for "PrivateChatRoom-App" to talk to the
+               'PrivateChatRoom-Server' with asyncio streams.
+
+               All connections share one event loop running in a background
+               thread. Connect, read, write, keepalive and shutdown are
+               coroutines on that loop; the methods of AsyncTransport may be
+               called from any thread (e.g. the Tk thread). TLS is supported,
+               but every connect is a full handshake (asyncio can not resume
+               a TLS session).
+'''
+
+import asyncio
+import ssl
+import threading
+from pcr_app_utils import app_tls
+from pcr_app_utils.app_server_connection import ATTEMPT_DELAY
+from pcr_app_utils.app_server_connection import tune_keepalive
+from pcr_app_utils.app_transport import BATCH_BYTES, MAX_PENDING, READ_SIZE
+from pcr_app_utils.app_logging import app_log
+
+logger = app_log(__name__)
+
+# Seconds to wait for the connection to be established.
+CONNECT_TIMEOUT = 2
+
+# Seconds to wait for the data to be flushed when closing.
+CLOSE_TIMEOUT = 2
+
+# Seconds between two checks of the connection by the keepalive.
+KEEPALIVE_INTERVAL = 15
+
+_LOOP = {"loop": None}
+_LOOP_LOCK = threading.Lock()
+
+
+def get_loop():
+    ''' Return the shared event loop, starting its thread on first use. '''
+
+    with _LOOP_LOCK:
+        if _LOOP["loop"] is None:
+            loop = asyncio.new_event_loop()
+            loop_thread = threading.Thread(target=loop.run_forever,
+                                           name="pcr-asyncio",
+                                           daemon=True)
+            loop_thread.start()
+            _LOOP["loop"] = loop
+
+            logger.debug(" asyncio event loop has started.")
+
+    return _LOOP["loop"]
+
+
+def run(coro, timeout=None):
+    ''' Run a coroutine on the shared loop and wait for its result. '''
+
+    future = asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+    return future.result(timeout)
+
+
+async def open_streams(host, port):
+    ''' Coroutine connecting to the server, returns (reader, writer). '''
+
+    logger.info(" trying to connect to the server...")
+
+    # Encrypt the connection if the server profile asks for it.
+    tls = app_tls.settings_for(host, port)
+    options = {}
+    if tls is not None:
+        options = {"ssl": app_tls.context(tls),
+                   "server_hostname": host,
+                   "ssl_handshake_timeout": app_tls.HANDSHAKE_TIMEOUT}
+
+    # Try all addresses of the host, staggered like app_server_connection.
+    reader, writer = await asyncio.wait_for(
+                                asyncio.open_connection(
+                                    host, port,
+                                    happy_eyeballs_delay=ATTEMPT_DELAY,
+                                    interleave=1,
+                                    **options),
+                                CONNECT_TIMEOUT + (app_tls.HANDSHAKE_TIMEOUT
+                                                   if tls else 0))
+
+    if tls is not None:
+        try:
+            app_tls.check_pin(tls, writer.get_extra_info(
+                                "ssl_object").getpeercert(binary_form=True))
+        except ssl.SSLError:
+            writer.close()
+            raise
+
+    # Let the os detect dead connections.
+    sock = writer.get_extra_info("socket")
+    if sock is not None:
+        tune_keepalive(sock)
+
+    logger.info(" connected to %s:%s", host, port)
+
+    return reader, writer
+
+
+def connect_to_server(host, port):
+    '''
+    Function to connect to the server, returns a dictionary like
+    app_server_connection.connect_to_server with the streams instead of
+    a socket.
+    '''
+
+    connected = {"conn": False,
+                 "sock": None,
+                 "streams": None,
+                 "host": host,
+                 "port": port,
+                 "inet": True}
+
+    try:
+        connected["streams"] = run(open_streams(host, port))
+        connected["conn"] = True
+        connected["tls"] = connected["streams"][1].get_extra_info(
+                                                "ssl_object") is not None
+
+    except ConnectionRefusedError:
+        # Error message if server is not running.
+        logger.warning(" could not connect to the server!")
+        msg = "verify that the server is running and ip/port are correct!"
+        logger.error(" %s", msg)
+
+    except ssl.SSLError as error:
+        # The server does not speak TLS or its certificate is not trusted.
+        logger.warning(" could not connect to the server!")
+        logger.error(" TLS with the server failed: %s", error)
+
+    except (OSError, asyncio.TimeoutError):
+        # Error message if there is no internet connection.
+        logger.warning(" could not connect to the server!")
+        error_msg = "are you connected to the internet?"
+        logger.error(" %s", error_msg)
+        connected["inet"] = False
+
+    return connected
+
+
+def discard(connected):
+    ''' Close the streams of a connection that is not going to be used. '''
+
+    _, writer = connected["streams"]
+    get_loop().call_soon_threadsafe(writer.close)
+
+
+class AsyncTransport():
+    ''' A connection to the server driven by the shared event loop. '''
+
+    def __init__(self, connected, on_data, on_closed, read_size=READ_SIZE):
+        self.reader, self.writer = connected["streams"]
+        self.on_data = on_data
+        self.on_closed = on_closed
+        self.read_size = read_size
+        self.loop = get_loop()
+        self.max_pending = MAX_PENDING
+        self._outbound = asyncio.Queue()
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self._writer_task = None
+        self._closed = False
+        self._abort_reason = None
+
+    def start(self):
+        ''' Start reading from the server. '''
+
+        asyncio.run_coroutine_threadsafe(self._run(), self.loop)
+
+    def send(self, data, force=False):
+        '''
+        Queue data to be sent to the server, can be called from any thread.
+        Returns False if too many messages are waiting already (unless
+        force is set).
+        '''
+
+        with self._pending_lock:
+            if self._closed:
+                return False
+
+            if self._pending >= self.max_pending and not force:
+                return False
+
+            self._pending += 1
+
+        self.loop.call_soon_threadsafe(self._outbound.put_nowait, data)
+
+        return True
+
+    def pending(self):
+        ''' Return the number of messages waiting to be sent. '''
+
+        return self._pending
+
+    def close(self):
+        ''' Flush the pending data and close the connection. '''
+
+        with self._pending_lock:
+            if self._closed:
+                return
+
+            self._closed = True
+
+        # Called from a callback on the loop itself, waiting would block it.
+        try:
+            if asyncio.get_running_loop() is self.loop:
+                self.loop.create_task(self._shutdown())
+                return
+        except RuntimeError:
+            pass
+
+        try:
+            run(self._shutdown(), CLOSE_TIMEOUT)
+        except Exception as error:  # pylint: disable=broad-except
+            logger.warning(" connection not closed cleanly: %s", error)
+
+    def abort(self, reason):
+        '''
+        Drop a connection that has gone silent without sending the waiting
+        data, it is reported with on_closed(reason).
+        '''
+
+        self._abort_reason = reason
+        self.loop.call_soon_threadsafe(self.writer.transport.abort)
+
+    async def _run(self):
+        ''' Coroutine reading from the server with a keepalive alongside. '''
+
+        keepalive = asyncio.create_task(self._keepalive())
+        self._writer_task = asyncio.create_task(self._write())
+
+        # Reported even if the reader ends with an error it did not expect.
+        reason = "connection lost"
+
+        try:
+            reason = await self._read()
+        finally:
+            keepalive.cancel()
+
+            # Only report connections that were not closed by the app.
+            if not self._closed:
+                self._closed = True
+                self._writer_task.cancel()
+                self.writer.close()
+                self.on_closed(self._abort_reason or reason)
+
+    async def _read(self):
+        ''' Coroutine passing the received data on until the stream ends. '''
+
+        while not self._closed:
+            try:
+                data = await self.reader.read(self.read_size)
+            except OSError as error:  # Timeouts and TLS errors included.
+                return str(error)
+
+            # An empty read means the server closed the connection.
+            if not data:
+                return "closed by the server"
+
+            self.on_data(data)
+
+        return "closed by the app"
+
+    async def _write(self):
+        '''
+        Coroutine writing the queued messages to the server, messages
+        queued back-to-back go out in one write. Ends at a None message.
+        '''
+
+        while True:
+            data = await self._outbound.get()
+            if data is None:
+                return
+
+            batch = [data]
+            size = len(data)
+
+            # Add the messages sent back-to-back to the same write.
+            while not self._outbound.empty() and size < BATCH_BYTES:
+                data = self._outbound.get_nowait()
+                if data is None:
+                    self._outbound.put_nowait(None)
+                    break
+
+                batch.append(data)
+                size += len(data)
+
+            with self._pending_lock:
+                self._pending -= len(batch)
+
+            try:
+                self.writer.write(b"".join(batch))
+                await self.writer.drain()
+            except OSError as error:
+                logger.error(" could not send to the server: %s", error)
+                return
+
+    async def _keepalive(self):
+        ''' Coroutine ending the reader once the stream has been closed. '''
+
+        while True:
+            await asyncio.sleep(KEEPALIVE_INTERVAL)
+
+            if self.writer.is_closing():
+                logger.warning(" connection lost, detected by keepalive.")
+                self.reader.feed_eof()
+                return
+
+    async def _shutdown(self):
+        ''' Coroutine flushing the pending data and closing the stream. '''
+
+        # Let the writer send what is queued, then stop it.
+        self._outbound.put_nowait(None)
+        if self._writer_task is not None:
+            await self._writer_task
+
+        try:
+            await self.writer.drain()
+        except OSError:
+            pass
+
+        self.writer.close()
+
+        try:
+            await self.writer.wait_closed()
+        except OSError:
+            pass
+
+        logger.debug(" stream has been closed.")
@@ -0,0 +1,202 @@
+#!/bin/env python3
+# -*- mode: python; coding: utf-8 -*-
+
+# Script by Thomas Pirchmoser (tommy_software@mailfence.com) 2024
+
+# This script was created for personal/educational purposes only and is not to
+#   be used for commercial or profit purposes.
+
+'''
+app_cli.py--a command line client for the 'PrivateChatRoom-Server' that
+               runs without a display.
+
+               Received messages are written to stdout, every line read from
+               stdin is sent as a message, "/file PATH" sends a file. End the
+               session with Ctrl-D.
+
+               Messages of other rooms than the main one start with
+               "[room] ". "/join ROOM" joins a room and sends the next lines
+               to it, "/room ROOM" picks the room to send to and "/leave
+               ROOM" leaves one. "/members" lists the members of the room
+               sent to and "/nick NAME" changes the alias (if the server
+               sends the members).
+
+               usage: python -m pcr_app_utils --alias NAME [--host H] [--port P]
+'''
+
+import argparse
+import sys
+import threading
+from pcr_app_utils import app_client_core
+from pcr_app_utils import app_config
+from pcr_app_utils import app_file_transfer
+from pcr_app_utils import app_history
+from pcr_app_utils import app_logging
+from pcr_app_utils import app_metrics
+from pcr_app_utils import app_rooms
+from pcr_app_utils import app_server_connection
+from pcr_app_utils import app_transport
+from pcr_app_utils.app_logging import app_log
+
+logger = app_log(__name__)
+
+
+def parse_args(argv=None):
+    ''' Parse the command line arguments. '''
+
+    parser = argparse.ArgumentParser(prog="python -m pcr_app_utils",
+                                     description="PrivateChatRoom-App "
+                                                 "command line client")
+    parser.add_argument("--alias", required=True,
+                        help="name shown to the other users")
+    parser.add_argument("--host",
+                        help="server address (default: the fastest of the "
+                             "server profiles)")
+    parser.add_argument("--port", type=int,
+                        help="server port (default: the port of the profile)")
+    parser.add_argument("--profile",
+                        help="only use this server profile")
+    parser.add_argument("--engine",
+                        choices=app_transport.ENGINES,
+                        default=app_transport.DEFAULT_ENGINE,
+                        help="network engine (default: %(default)s)")
+    parser.add_argument("--quiet", action="store_true",
+                        help="do not print the connection state")
+    app_rooms.add_arguments(parser)
+    app_file_transfer.add_arguments(parser)
+    app_metrics.add_arguments(parser)
+    app_history.add_arguments(parser)
+    app_logging.add_arguments(parser)
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    ''' Run a chat session on the terminal. '''
+
+    args = parse_args(argv)
+    app_logging.configure_from_args(args)
+
+    # An address or profile given by the user is used as it is, otherwise
+    #   the fastest of the server profiles.
+    servers = None
+    if args.profile:
+        try:
+            profile = app_config.get_store().profile(args.profile)
+        except KeyError:
+            sys.exit(f"unknown profile {args.profile}")
+        host, port = profile.host, profile.port
+    else:
+        host, port = app_server_connection.get_ip_port()
+        if args.host is None and args.port is None:
+            servers = app_server_connection.get_servers()
+
+    host = args.host or host
+    port = args.port or port
+    output_lock = threading.Lock()
+
+    def write(text):
+        with output_lock:
+            sys.stdout.write(text)
+            sys.stdout.flush()
+
+    def transfer_done(transfer):
+        if transfer.state == app_file_transfer.ACTIVE:
+            return
+        if transfer.direction == app_file_transfer.RECEIVING and \
+                transfer.state == app_file_transfer.DONE:
+            write(f"*** {transfer.sender} has sent {transfer.name}, "
+                  f"saved to {transfer.path}\n")
+        else:
+            write(f"*** {transfer.direction} {transfer.name}: "
+                  f"{transfer.state}\n")
+
+    def message(message):
+        if message.room == app_client_core.DEFAULT_ROOM:
+            write(message.text)
+        else:
+            write(f"[{message.room}] {message.text}")
+
+    def roster(text, room):
+        if room == app_client_core.DEFAULT_ROOM:
+            write(f"*** {text}\n")
+        else:
+            write(f"*** [{room}] {text}\n")
+
+    def status(state, info):
+        if not args.quiet:
+            details = "".join(f" {key}={value}" for key, value in info.items())
+            write(f"*** {state}{details}\n")
+
+    core = app_client_core.ClientCore(
+                host, port, args.alias, args.engine,
+                on_message=message,
+                on_roster=roster,
+                on_status=status,
+                on_transfer=transfer_done,
+                servers=servers,
+                history=app_history.from_args(args),
+                rooms=args.rooms,
+                receive_files=args.receive_files)
+
+    # Room the lines typed are sent to.
+    room = app_client_core.DEFAULT_ROOM
+
+    logger.info("[START]: command line client started by the user...")
+    app_metrics.start(args)
+    core.start()
+
+    try:
+        for line in sys.stdin:
+            line = line.strip()
+            if not line:
+                continue
+
+            command, _, name = line.partition(" ")
+            name = name.strip()
+
+            try:
+                if command == "/file":
+                    core.send_file(name)
+                elif command == "/join":
+                    core.join(name)
+                    room = name
+                elif command == "/room":
+                    if name not in core.rooms:
+                        write(f"*** not in room {name}\n")
+                    else:
+                        room = name
+                elif command == "/leave":
+                    core.leave(name)
+                    if name == room:
+                        room = app_client_core.DEFAULT_ROOM
+                elif command == "/members":
+                    members = core.members.get(room)
+                    if members is None:
+                        write("*** the server does not list the members\n")
+                    else:
+                        write(f"*** {', '.join(sorted(members.members))}\n")
+                elif command == "/nick":
+                    core.rename(name)
+                elif not core.send(line, room=room):
+                    write("*** busy, message not sent\n")
+            except ConnectionError as error:
+                write(f"*** not sent: {error}\n")
+            except ValueError as error:
+                write(f"*** {error}\n")
+            except OSError as error:
+                write(f"*** could not open the file: {error}\n")
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        core.close()
+        if core.history is not None:
+            core.history.close()
+        app_metrics.stop()
+        logger.info("[STOP]: command line client closed by the user...")
+
+
+if __name__ == "__main__":
+    main()
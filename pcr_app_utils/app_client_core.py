@@ -0,0 +1,786 @@
+#!/bin/env python3
+# -*- mode: python; coding: utf-8 -*-
+
+# Script by Thomas Pirchmoser (tommy_software@mailfence.com) 2024
+
+# This script was created for personal/educational purposes only and is not to
+#   be used for commercial or profit purposes.
+
+'''
+app_client_core.py--module for "PrivateChatRoom-App" with the chat client
+               itself, independent of any user interface.
+
+               ClientCore connects (and reconnects) to the server, answers the
+               alias request, sends messages and reports the messages and
+               roster updates it receives. The GUI (gui_client.py) and the
+               command line client (app_cli.py) are built on top of it, and
+               several instances can run in one process.
+
+               Servers offering rooms carry any number of rooms over the one
+               connection, every message is reported with its room. The
+               main room is the one of servers without rooms.
+
+               Servers offering the members of the rooms send the full list
+               once and then only the changes, the session keeps the
+               members of every room (app_roster) and reports the changes.
+'''
+
+import queue
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from pcr_app_utils import app_framing
+from pcr_app_utils import app_metrics
+from pcr_app_utils import app_profiling
+from pcr_app_utils import app_roster
+from pcr_app_utils.app_file_transfer import FileReceiver, FileSender
+from pcr_app_utils.app_file_transfer import RECEIVE_FILES
+from pcr_app_utils import app_heartbeat
+from pcr_app_utils import app_server_connection
+from pcr_app_utils import app_transport
+from pcr_app_utils.app_reconnect import Reconnector
+from pcr_app_utils.app_logging import app_log
+
+logger = app_log(__name__)
+
+# States reported to on_status(state, info).
+STATUS_CONNECTING = "connecting"
+STATUS_CONNECTED = "connected"
+STATUS_RETRY = "retry"
+STATUS_DISCONNECTED = "disconnected"
+STATUS_CLOSED = "closed"
+
+# Color the app shows in each state: yellow while connecting, red while not
+#   connected (the waits between the retries too), green once connected.
+STATUS_COLORS = {STATUS_CONNECTING: "yellow",
+                 STATUS_CONNECTED: "green",
+                 STATUS_RETRY: "red",
+                 STATUS_DISCONNECTED: "red",
+                 STATUS_CLOSED: "red"}
+
+# Room of the servers without rooms, every session is in it.
+DEFAULT_ROOM = "main"
+
+# A message received from the server, kind is one of the frame types.
+Message = namedtuple("Message", ["kind", "text", "room"],
+                     defaults=(DEFAULT_ROOM,))
+
+# Most sent messages waiting for their echo to measure the round-trip time.
+ECHO_LIMIT = 64
+
+
+class ClientCore():
+    '''
+    A chat session with the server.
+
+    The callbacks are called from the network threads:
+        on_message(message) -- a chat or system message (Message).
+        on_roster(text, room) -- the users online in a room have changed.
+        on_members(changes, room) -- members of a room joined, left or
+                                     were renamed (app_roster.MemberChange
+                                     list), only with servers offering it.
+        on_status(state, info) -- the connection changed state, info is a
+                                  dictionary with details (e.g. attempt).
+        on_transfer(transfer) -- progress or end of a file sent or
+                                 received (app_file_transfer.Transfer).
+        on_rtt(ms)          -- round-trip time of a heartbeat ping.
+    Without on_message the messages can be read with messages().
+    Counters and timings are recorded in metrics (app_metrics).
+
+    With a list of (host, port) servers, every (re)connect goes to the
+    one that answers fastest, host and port are used if none answers.
+
+    With compress, large messages are compressed if the server offers it.
+
+    With heartbeat, servers offering pings are pinged every few seconds
+    and the connection is dropped (and re-established) once the server has
+    been silent for too long (app_heartbeat).
+
+    With a history (app_history.HistoryStore), the chat and system
+    messages are saved for their room, the writing happens in the
+    background.
+
+    Other rooms than the main one are entered with join() (or the rooms
+    list) and left with leave(), they are joined again after a reconnect.
+    '''
+
+    def __init__(self, host, port, alias, engine=app_transport.DEFAULT_ENGINE,
+                 on_message=None, on_roster=None, on_status=None,
+                 reconnect=True, metrics=app_metrics.REGISTRY, servers=None,
+                 compress=app_framing.COMPRESSION, on_transfer=None,
+                 download_dir=None, history=None,
+                 heartbeat=app_heartbeat.HEARTBEAT, on_rtt=None, rooms=(),
+                 on_members=None, receive_files=RECEIVE_FILES):
+        self.alias = alias
+        self.connected = {"conn": False,
+                          "sock": None,
+                          "host": host,
+                          "port": port,
+                          "inet": True,
+                          "engine": engine}
+        self.on_message = on_message
+        self.on_roster = on_roster
+        self.on_status = on_status
+        self.auto_reconnect = reconnect
+        self.metrics = metrics
+        self.servers = servers
+        self.compress = compress
+        self.on_transfer = on_transfer
+        self.history = history
+        self.heartbeat = heartbeat
+        self.on_rtt = on_rtt
+        self.on_members = on_members
+
+        # Pings the server of the current connection, if it supports it.
+        self._heartbeat = None
+        self.heartbeat_interval = app_heartbeat.HEARTBEAT_INTERVAL
+
+        # Latest round-trip time of a ping in milliseconds.
+        self.rtt_ms = None
+
+        # Rooms the session takes part in, the main one always.
+        self.rooms = {DEFAULT_ROOM}
+        for room in rooms:
+            self.join(room)
+
+        # Features the server has offered in its alias request.
+        self.server_features = set()
+
+        # Reassembles the files sent by the other users.
+        self.receiver = FileReceiver(on_transfer, download_dir, receive_files)
+
+        # Codec that splits the received data into complete frames.
+        self.codec = app_framing.FrameCodec()
+
+        # Moves the data to/from the server, created once connected.
+        self.transport = None
+
+        # Latest roster text received from the server, by room.
+        self.rosters = {}
+
+        # Members of the rooms (app_roster.Roster) by room, kept over a
+        #   reconnect so the new full list only reports what changed.
+        self.members = {}
+
+        self.reconnector = Reconnector(self._connection_made,
+                                       self._connection_failed,
+                                       connect=self._connect)
+        self._inbox = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._closed = False
+
+        # Send times of the recent messages by their text, the server
+        #   echoes them back to the sender.
+        self._echoes = OrderedDict()
+        self._echoes_lock = threading.Lock()
+
+        # When the current connection attempts started and whether the
+        #   session has been connected before.
+        self._connect_started = None
+        self._was_connected = False
+
+    def start(self):
+        ''' Connect to the server in the background. '''
+
+        self._status(STATUS_CONNECTING)
+        self._reconnect()
+
+    def _reconnect(self):
+        '''
+        Connect in the background without reporting STATUS_CONNECTING, the
+        state stays as it is until an attempt succeeds or fails.
+        '''
+
+        self._connect_started = time.monotonic()
+        self.reconnector.start(self.connected["host"],
+                               self.connected["port"],
+                               self.connected["engine"])
+
+    def is_connected(self):
+        ''' True while there is a connection to the server. '''
+
+        return self.connected["conn"]
+
+    def send(self, text, room=DEFAULT_ROOM):
+        '''
+        Send a chat message from this alias to a room. Returns False if it
+        can not be queued because too many messages are waiting.
+        Raises ConnectionError when not connected.
+        '''
+
+        line = f"{self.alias}: {text}\n"
+        started = time.perf_counter()
+
+        sent = self.send_frame(app_framing.FRAME_CHAT, line, room=room)
+
+        # Remember when it was sent, for the round-trip time.
+        if sent:
+            with self._echoes_lock:
+                self._echoes[(room, line)] = started
+                if len(self._echoes) > ECHO_LIMIT:
+                    self._echoes.popitem(last=False)
+
+        return sent
+
+    def rooms_supported(self):
+        ''' True if the server carries several rooms on one connection. '''
+
+        return app_framing.FEATURE_ROOMS in self.server_features
+
+    def join(self, room):
+        '''
+        Take part in a room, right away if connected, otherwise once
+        connected. Raises ValueError for an invalid name and
+        ConnectionError if the server has no rooms.
+        '''
+
+        if not app_framing.valid_room(room):
+            raise ValueError(f"invalid room name {room!r}")
+
+        if room in self.rooms:
+            return
+
+        # Until the server has asked for the alias, it is not known
+        #   whether it has rooms.
+        negotiated = self.is_connected() and \
+            self.codec.mode != app_framing.MODE_AUTO
+        if negotiated and not self.rooms_supported():
+            raise ConnectionError("the server has no rooms")
+
+        self.rooms.add(room)
+        logger.debug(" joined room %s.", room)
+
+        if negotiated:
+            try:
+                self.send_frame(app_framing.FRAME_JOIN, room, force=True)
+            except ConnectionError:
+                # Joined again once the connection is back.
+                pass
+
+    def leave(self, room):
+        ''' Stop taking part in a room, the main room can not be left. '''
+
+        if room == DEFAULT_ROOM or room not in self.rooms:
+            return
+
+        self.rooms.discard(room)
+        self.rosters.pop(room, None)
+        self.members.pop(room, None)
+
+        if self.is_connected() and self.rooms_supported():
+            try:
+                self.send_frame(app_framing.FRAME_LEAVE, room, force=True)
+            except ConnectionError:
+                pass
+
+        logger.debug(" left room %s.", room)
+
+    def members_supported(self):
+        ''' True if the server sends the members of the rooms. '''
+
+        return app_framing.FEATURE_MEMBERS in self.server_features
+
+    def rename(self, alias):
+        '''
+        Change the alias, the other users see the new one. Raises
+        ValueError for an alias that can not be listed and ConnectionError
+        if the server can not rename.
+        '''
+
+        if not alias or alias != alias.strip() or "\t" in alias or \
+                "\n" in alias:
+            raise ValueError(f"invalid alias {alias!r}")
+
+        if not self.members_supported():
+            raise ConnectionError("the server can not rename")
+
+        self.send_frame(app_framing.FRAME_ALIAS, alias, force=True)
+        self.alias = alias
+
+        logger.debug(" renamed to %s.", alias)
+
+    def files_supported(self):
+        ''' True if the server passes files on to the other users. '''
+
+        return app_framing.FEATURE_FILES in self.server_features
+
+    def send_file(self, path):
+        '''
+        Send a file to the other users in the background, returns the
+        FileSender (see app_file_transfer). Raises ConnectionError when
+        not connected or if the server does not pass files on.
+        '''
+
+        if not self.files_supported():
+            raise ConnectionError("the server does not accept files")
+
+        return self._start_sender(FileSender.from_path(self, path,
+                                                       self.on_transfer))
+
+    def send_large(self, text, name="message.txt"):
+        ''' Send a very large message as a file, see send_file(). '''
+
+        if not self.files_supported():
+            raise ConnectionError("the server does not accept files")
+
+        return self._start_sender(FileSender.from_text(self, text, name,
+                                                       self.on_transfer))
+
+    def _start_sender(self, sender):
+        if not self.is_connected():
+            sender.stream.close()
+            raise ConnectionError("not connected to the server")
+
+        sender.start()
+
+        return sender
+
+    def send_frame(self, kind, text, force=False, room=DEFAULT_ROOM):
+        ''' Send a message of the given frame type, see send(). '''
+
+        transport = self.transport
+
+        if not self.connected["conn"] or transport is None:
+            raise ConnectionError("not connected to the server")
+
+        # Messages of the other rooms go in a room frame.
+        if room != DEFAULT_ROOM:
+            if not self.rooms_supported():
+                raise ConnectionError("the server has no rooms")
+            payload = text if isinstance(text, bytes) \
+                else text.encode(app_framing.FORMAT)
+            kind, text = app_framing.FRAME_ROOM, \
+                app_framing.encode_room(room, kind, payload)
+
+        with app_profiling.span("send"):
+            data = self.codec.encode(kind, text)
+
+            if not transport.send(data, force):
+                return False
+
+        self.metrics.count("messages_out")
+        self.metrics.count("bytes_out", len(data))
+
+        return True
+
+    def pending(self):
+        ''' Return the number of messages waiting to be sent. '''
+
+        return self.transport.pending() if self.transport else 0
+
+    def switch_server(self, host, port):
+        ''' Replace the connection with one to another server. '''
+
+        self._drop_transport()
+
+        # The user has picked this server, no more choosing the fastest.
+        self.servers = None
+        self.connected["host"] = host
+        self.connected["port"] = port
+
+        logger.debug(" switching to %s:%s.", host, port)
+
+        self.start()
+
+    def close(self, leave=True):
+        '''
+        End the session. With leave the other users are told that the
+        alias has left the chat.
+        '''
+
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+
+        # Stop trying to reconnect.
+        self.reconnector.stop()
+
+        # Let the others know, this is flushed before the socket closes.
+        #   Not needed if the server has not asked for the alias yet.
+        if leave and self.connected["conn"] and \
+                self.codec.mode != app_framing.MODE_AUTO:
+            msg = f"\t{self.alias} has left the chat...\n"
+            if not self.send_frame(app_framing.FRAME_SYSTEM, msg, force=True):
+                logger.info(" sever is offline...")
+
+        self._drop_transport()
+        self.receiver.close()
+        self._status(STATUS_CLOSED)
+
+        # End the iterator of messages().
+        self._inbox.put(None)
+
+    def messages(self, timeout=None):
+        '''
+        Iterate over the received messages, for use without on_message.
+        Ends when the session is closed or nothing arrives within timeout.
+        '''
+
+        while True:
+            try:
+                message = self._inbox.get(timeout=timeout)
+            except queue.Empty:
+                return
+
+            if message is None:
+                return
+
+            yield message
+
+    def _connect(self, host, port, engine):
+        ''' Connect to the fastest of the servers, or to host:port. '''
+
+        servers = self.servers
+        if not servers or len(servers) < 2:
+            return app_transport.connect(host, port, engine)
+
+        # Try the servers that answered the probe, fastest first.
+        for server_host, server_port in \
+                app_server_connection.rank_servers(servers):
+            connected = app_transport.connect(server_host, server_port,
+                                              engine)
+            if connected["conn"]:
+                return connected
+
+        return app_transport.connect(host, port, engine)
+
+    def _drop_transport(self):
+        ''' Close the current connection without reporting it as lost. '''
+
+        self.connected["conn"] = False
+        self._stop_heartbeat()
+
+        transport, self.transport = self.transport, None
+        if transport:
+            transport.close()
+            logger.info(" disconnected from the server by the user.")
+
+    def _status(self, state, **info):
+        ''' Report a change of the connection state. '''
+
+        if self.on_status:
+            self.on_status(state, info)
+
+    def _connection_made(self, connected):
+        ''' Called by the reconnector once a connection has been made. '''
+
+        with self._lock:
+            if self._closed:
+                app_transport.discard(connected)
+                return
+
+            self.connected = connected
+
+            # Every server decides again if it supports frames.
+            self.codec = app_framing.FrameCodec()
+            self.server_features = set()
+            self._stop_heartbeat()
+
+            # Files interrupted by the lost connection will not continue.
+            self.receiver.close()
+
+            # Start receiving messages from the server.
+            # The transport reports its own loss, one that has been
+            #   replaced meanwhile is ignored.
+            transport = app_transport.create_transport(
+                            connected, self._receive,
+                            lambda reason: self._lost(reason, transport))
+            self.transport = transport
+            transport.start()
+
+        logger.debug(" %s transport has started.", connected["engine"])
+
+        # Time from start() until connected, including the retries.
+        if self._connect_started is not None:
+            self.metrics.observe("connect_ms", (time.monotonic() -
+                                                self._connect_started) * 1000)
+        self.metrics.count("connects")
+        if self._was_connected:
+            self.metrics.count("reconnects")
+        self._was_connected = True
+
+        self._status(STATUS_CONNECTED)
+
+    def _connection_failed(self, attempt, delay, connected):
+        ''' Called by the reconnector after a failed attempt. '''
+
+        self.connected["inet"] = connected["inet"]
+        self.metrics.count("connect_failures")
+        self._status(STATUS_RETRY, attempt=attempt, delay=delay)
+
+    def _lost(self, reason, transport):
+        ''' Called by a transport when its connection is lost. '''
+
+        with self._lock:
+            if transport is not self.transport:
+                return
+
+            self.connected["conn"] = False
+            self.transport = None
+
+        self._stop_heartbeat()
+        logger.error(" disconnected from the server! (%s)", reason)
+
+        self._status(STATUS_DISCONNECTED, reason=reason)
+
+        # Try to get the connection back, disconnected (red) is shown
+        #   until it is.
+        if self.auto_reconnect and not self._closed:
+            self._reconnect()
+
+    def _receive(self, data):
+        ''' Handle data received from the server. '''
+
+        self.metrics.count("bytes_in", len(data))
+
+        # Any data shows that the server is alive.
+        heartbeat = self._heartbeat
+        if heartbeat is not None:
+            heartbeat.seen()
+
+        try:
+            with app_profiling.span("receive"):
+                # Split the data into complete frames and handle each one.
+                with app_profiling.span("decode"):
+                    frames = self.codec.feed(data)
+
+                for frame in frames:
+                    self._handle_frame(frame)
+
+        except app_framing.FrameError as error:
+            # Drop the connection if the server sends invalid frames, it is
+            #   reported to _lost() which connects again.
+            logger.error(" invalid data from the server: %s", error)
+            self.metrics.count("decode_errors")
+
+            transport = self.transport
+            if transport is not None:
+                transport.abort(f"invalid data from the server: {error}")
+
+    def _answer_alias(self, frame):
+        ''' Send the alias and the features wanted from those offered. '''
+
+        offered = app_framing.parse_features(frame.payload) \
+            if self.codec.framed else set()
+        self.server_features = offered
+
+        self.send_frame(app_framing.FRAME_ALIAS, self.alias, force=True)
+
+        wanted = {app_framing.FEATURE_FILES} & offered
+        if self.compress:
+            wanted |= {app_framing.FEATURE_ZLIB} & offered
+        if self.heartbeat:
+            wanted |= {app_framing.FEATURE_PING} & offered
+        wanted |= {app_framing.FEATURE_ROOMS,
+                   app_framing.FEATURE_MEMBERS} & offered
+
+        if wanted:
+            self.send_frame(app_framing.FRAME_FEATURES,
+                            ",".join(sorted(wanted)), force=True)
+
+        if app_framing.FEATURE_ZLIB in wanted:
+            # Everything sent after the features frame may be compressed.
+            self.codec.compression = True
+            logger.debug(" compression has been negotiated.")
+
+        if app_framing.FEATURE_PING in wanted:
+            self._start_heartbeat()
+
+        # A server without members leaves none of the old server listed.
+        if app_framing.FEATURE_MEMBERS not in wanted:
+            members, self.members = self.members, {}
+            for room, roster in members.items():
+                self._report_members(roster.replace(()), room)
+
+        # Take part in the rooms again after a reconnect.
+        for room in sorted(self.rooms - {DEFAULT_ROOM}):
+            if app_framing.FEATURE_ROOMS in wanted:
+                self.send_frame(app_framing.FRAME_JOIN, room, force=True)
+            else:
+                logger.warning(" room %s not joined, the server has no "
+                               "rooms.", room)
+
+    def _start_heartbeat(self):
+        ''' Start pinging the server of the current connection. '''
+
+        self._stop_heartbeat()
+        self._heartbeat = app_heartbeat.Heartbeat(
+                    lambda payload: self._send_heartbeat(
+                                        app_framing.FRAME_PING, payload),
+                    self._silent,
+                    self._measured_rtt,
+                    interval=self.heartbeat_interval)
+        self._heartbeat.start()
+
+    def _stop_heartbeat(self):
+        heartbeat, self._heartbeat = self._heartbeat, None
+        if heartbeat is not None:
+            heartbeat.stop()
+
+    def _send_heartbeat(self, kind, payload):
+        ''' Send a ping or pong, even while the send queue is full. '''
+
+        try:
+            self.send_frame(kind, payload, force=True)
+        except ConnectionError:
+            pass
+
+    def _silent(self, reason):
+        ''' The server has not sent anything for too long. '''
+
+        transport = self.transport
+        if transport is not None:
+            # Reported to _lost(), which reconnects.
+            transport.abort(reason)
+
+    def _measured_rtt(self, rtt_ms):
+        self.rtt_ms = rtt_ms
+        self.metrics.observe("ping_ms", rtt_ms)
+
+        if self.on_rtt:
+            self.on_rtt(rtt_ms)
+
+    def _handle_frame(self, frame, room=DEFAULT_ROOM):
+        ''' Act on a complete frame received from the server. '''
+
+        if frame.kind == app_framing.FRAME_ROOM:
+            room, frame = app_framing.split_room(frame.payload)
+
+            # Only messages of the rooms may be wrapped, and a room left
+            #   may still have some on the way.
+            if frame.kind not in (app_framing.FRAME_CHAT,
+                                  app_framing.FRAME_SYSTEM,
+                                  app_framing.FRAME_ROSTER,
+                                  app_framing.FRAME_MEMBERS,
+                                  app_framing.FRAME_MEMBERS_DELTA) or \
+                    room not in self.rooms or room == DEFAULT_ROOM:
+                return
+
+        if frame.kind == app_framing.FRAME_ALIAS:
+            # If server asks for alias, send it (unless the session has
+            #   been closed in the meantime).
+            try:
+                self._answer_alias(frame)
+            except ConnectionError:
+                logger.debug(" alias not sent, no longer connected.")
+            return
+
+        if frame.kind in app_framing.FILE_FRAMES:
+            self.receiver.handle(frame)
+            return
+
+        if frame.kind == app_framing.FRAME_PONG:
+            heartbeat = self._heartbeat
+            if heartbeat is not None:
+                heartbeat.pong(frame.payload)
+            return
+
+        if frame.kind == app_framing.FRAME_PING:
+            # The server checks on the client, answer with the same payload.
+            self._send_heartbeat(app_framing.FRAME_PONG, frame.payload)
+            return
+
+        if frame.kind in (app_framing.FRAME_MEMBERS,
+                          app_framing.FRAME_MEMBERS_DELTA):
+            self._update_members(frame, room)
+            return
+
+        text = app_framing.frame_text(frame)
+
+        if frame.kind == app_framing.FRAME_ROSTER:
+            self.rosters[room] = text
+            if self.on_roster:
+                self.on_roster(text, room)
+
+        elif frame.kind in (app_framing.FRAME_CHAT, app_framing.FRAME_SYSTEM):
+            self.metrics.count("messages_in")
+
+            # The echo of a message sent by this client.
+            if frame.kind == app_framing.FRAME_CHAT and self._echoes:
+                with self._echoes_lock:
+                    sent = self._echoes.pop((room, text), None)
+                if sent is not None:
+                    self.metrics.observe("rtt_ms", (time.perf_counter() -
+                                                    sent) * 1000)
+
+            # Queued only, the history writes it in its own thread.
+            if self.history is not None:
+                self.history.add(room, frame.kind, text)
+
+            message = Message(frame.kind, text, room)
+            if self.on_message:
+                self.on_message(message)
+            else:
+                self._inbox.put(message)
+
+    def _update_members(self, frame, room):
+        ''' Apply the full list or the changes of the members of a room. '''
+
+        roster = self.members.get(room)
+        if roster is None:
+            roster = self.members[room] = app_roster.Roster()
+
+        if frame.kind == app_framing.FRAME_MEMBERS:
+            changes = roster.replace(app_roster.parse_full(frame.payload))
+        else:
+            changes = roster.apply(app_roster.parse_delta(frame.payload))
+
+        self.metrics.count("member_changes", len(changes))
+        self._report_members(changes, room)
+
+        # The number of users, as servers without members send it.
+        text = app_roster.count_text(len(roster))
+        if text != self.rosters.get(room):
+            self.rosters[room] = text
+            if self.on_roster:
+                self.on_roster(text, room)
+
+    def _report_members(self, changes, room):
+        if changes and self.on_members:
+            self.on_members(changes, room)
+
+
+if __name__ == "__main__":
+    import socket
+
+    # A server that asks for the alias, offers pings and never answers.
+    SERVER = socket.create_server(("127.0.0.1", 0))
+    CLIENTS = []
+
+    def serve():
+        ''' Accept the client and go silent. '''
+
+        while True:
+            conn, _ = SERVER.accept()
+            CLIENTS.append(conn)
+            conn.sendall(app_framing.encode_frame(
+                            app_framing.FRAME_ALIAS,
+                            app_framing.FEATURE_PING.encode()))
+
+    threading.Thread(target=serve, daemon=True).start()
+
+    # The colors the window shows, in the order they are shown.
+    COLORS = []
+    SECOND = threading.Event()
+
+    def status(state, _info):
+        ''' Record the color of the state. '''
+
+        COLORS.append((STATUS_COLORS[state], time.monotonic()))
+        if state == STATUS_CONNECTED and len(CLIENTS) > 1:
+            SECOND.set()
+
+    CORE = ClientCore("127.0.0.1", SERVER.getsockname()[1], "tommy",
+                      on_status=status)
+    CORE.heartbeat_interval = 0.2
+    CORE.start()
+
+    assert SECOND.wait(10), COLORS
+    CORE.close(leave=False)
+
+    # Red as soon as the heartbeat gives up, not yellow, until connected.
+    SHOWN = [color for color, _ in COLORS]
+    assert SHOWN[:4] == ["yellow", "green", "red", "green"], SHOWN
+    assert COLORS[2][1] - COLORS[1][1] < 0.2 * 3 + 1
+    logger.info("[APP_CLIENT_CORE_TEST]: %s", SHOWN)
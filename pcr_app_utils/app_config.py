@@ -0,0 +1,374 @@
+#!/bin/env python3
+# -*- mode: python; coding: utf-8 -*-
+
+# Script by Thomas Pirchmoser (tommy_software@mailfence.com) 2024
+
+# This script was created for personal/educational purposes only and is not to
+#   be used for commercial or profit purposes.
+
+'''
+app_config.py--module for "PrivateChatRoom-App" to keep the server profiles.
+
+               The profiles (a name with host and port) are kept in
+               .pcr_config.json, which is read once and cached. Changes are
+               written to a temporary file that replaces the old one, so
+               the file is never seen half written. The address in the old
+               .pcr_ip_port.txt is taken over as the 'default' profile.
+
+               A profile can ask for TLS, with the certificate checked
+               against a CA file or pinned to its sha256 fingerprint.
+
+               usage: python -m pcr_app_utils.app_config
+                          [list | add NAME HOST PORT | remove NAME | use NAME
+                           | tls NAME [--ca FILE] [--pin SHA256] [--off]
+                           | test]
+'''
+
+import argparse
+import json
+import os
+import tempfile
+import threading
+from collections import namedtuple
+from pcr_app_utils.app_logging import app_log
+
+logger = app_log(__name__)
+
+# File with the profiles.
+CONFIG_FILE = ".pcr_config.json"
+
+# File used by earlier versions, holding "host,port".
+LEGACY_FILE = ".pcr_ip_port.txt"
+
+# Server used when nothing has been configured.
+DEFAULT_PROFILE = "default"
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 5050
+
+# A named server.
+Profile = namedtuple("Profile", ["name", "host", "port"])
+
+
+def check_port(port):
+    ''' Return the port as an int, ValueError if it is not a valid port. '''
+
+    port = int(port)
+
+    if not 0 < port <= 65535:
+        raise ValueError(f"port {port} is not between 1 and 65535")
+
+    return port
+
+
+def read_legacy(path=LEGACY_FILE):
+    ''' Return (host, port) from the old file, None if there is none. '''
+
+    try:
+        with open(path, "r", encoding="utf-8") as infile:
+            host, port = infile.read().strip().split(",")[:2]
+            return host.strip(), check_port(port)
+
+    except (OSError, ValueError):
+        return None
+
+
+class ConfigStore():
+    ''' The server profiles, loaded on first use and kept in memory. '''
+
+    def __init__(self, path=CONFIG_FILE, legacy_path=LEGACY_FILE):
+        self.path = path
+        self.legacy_path = legacy_path
+        self._lock = threading.RLock()
+        self._data = None
+
+        # True if the file could not be read, it is never written then.
+        self.damaged = False
+
+    def _load(self):
+        ''' Return the cached settings, reading the file the first time. '''
+
+        if self._data is not None:
+            return self._data
+
+        data = None
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as infile:
+                data = json.load(infile)
+                profiles = data["profiles"]
+                for name, server in profiles.items():
+                    tls = server.get("tls")
+
+                    # Never plain text to a server meant for TLS: settings
+                    #   that are not {"ca": ..., "pin": ...} (e.g. true)
+                    #   check the certificate against the system CAs.
+                    if tls and not isinstance(tls, dict):
+                        logger.warning(" profile %s: invalid tls settings, "
+                                       "using the system CAs.", name)
+                        tls = {"ca": None, "pin": None}
+
+                    profiles[name] = {"host": str(server["host"]),
+                                      "port": check_port(server["port"])}
+                    if tls:
+                        profiles[name]["tls"] = {"ca": tls.get("ca"),
+                                                 "pin": tls.get("pin")}
+                if data.get("active") not in profiles:
+                    data["active"] = next(iter(profiles))
+
+        except FileNotFoundError:
+            pass
+
+        except (ValueError, KeyError, TypeError, AttributeError,
+                StopIteration) as error:
+            # The file is left alone, it may hold settings that can not be
+            #   guessed (e.g. TLS), so nothing is connected in plain text.
+            logger.error(" %s is damaged (%s), it is not changed and the "
+                         "default server is only connected with TLS.",
+                         self.path, error)
+            self.damaged = True
+            data = {"active": DEFAULT_PROFILE,
+                    "profiles": {DEFAULT_PROFILE: {
+                                    "host": DEFAULT_HOST,
+                                    "port": DEFAULT_PORT,
+                                    "tls": {"ca": None, "pin": None}}}}
+
+        if data is None:
+            # Take over the address of earlier versions, if there is one.
+            host, port = read_legacy(self.legacy_path) or \
+                (DEFAULT_HOST, DEFAULT_PORT)
+            data = {"active": DEFAULT_PROFILE,
+                    "profiles": {DEFAULT_PROFILE: {"host": host,
+                                                   "port": port}}}
+
+        self._data = data
+
+        return data
+
+    def save(self):
+        ''' Write the settings atomically. '''
+
+        with self._lock:
+            data = self._load()
+            if self.damaged:
+                logger.warning(" %s is damaged, the change is not saved.",
+                               self.path)
+                return
+
+            directory = os.path.dirname(os.path.abspath(self.path))
+
+            # Write a temporary file next to it, then swap it in.
+            handle, temp_path = tempfile.mkstemp(dir=directory,
+                                                 prefix=".pcr_config.",
+                                                 suffix=".tmp")
+            try:
+                with os.fdopen(handle, "w", encoding="utf-8") as outfile:
+                    json.dump(data, outfile, indent=2)
+                    outfile.flush()
+                    os.fsync(outfile.fileno())
+                os.replace(temp_path, self.path)
+
+            except OSError:
+                os.unlink(temp_path)
+                raise
+
+        logger.debug(" settings have been saved to %s.", self.path)
+
+    def profiles(self):
+        ''' Return all profiles, the active one first. '''
+
+        with self._lock:
+            data = self._load()
+            profiles = [Profile(name, server["host"], server["port"])
+                        for name, server in data["profiles"].items()]
+
+        return sorted(profiles, key=lambda profile:
+                      profile.name != data["active"])
+
+    def profile(self, name):
+        ''' Return the profile with the given name, KeyError if unknown. '''
+
+        with self._lock:
+            server = self._load()["profiles"][name]
+
+        return Profile(name, server["host"], server["port"])
+
+    def active(self):
+        ''' Return the profile in use. '''
+
+        with self._lock:
+            return self.profile(self._load()["active"])
+
+    def set_active(self, name):
+        ''' Make a profile the one in use. '''
+
+        with self._lock:
+            data = self._load()
+            if name not in data["profiles"]:
+                raise KeyError(name)
+
+            data["active"] = name
+            self.save()
+
+    def set_profile(self, name, host=None, port=None):
+        ''' Add a profile or change the host and/or port of one. '''
+
+        with self._lock:
+            profiles = self._load()["profiles"]
+            server = profiles.get(name, {"host": DEFAULT_HOST,
+                                         "port": DEFAULT_PORT})
+
+            if host is not None:
+                server = dict(server, host=host.strip())
+            if port is not None:
+                server = dict(server, port=check_port(port))
+
+            profiles[name] = server
+            self.save()
+
+        return self.profile(name)
+
+    def set_tls(self, name, ca=None, pin=None, enabled=True):
+        ''' Turn TLS on (with a CA file or pinned fingerprint) or off. '''
+
+        with self._lock:
+            profiles = self._load()["profiles"]
+            server = dict(profiles[name])
+
+            if enabled:
+                server["tls"] = {"ca": ca, "pin": pin}
+            else:
+                server.pop("tls", None)
+
+            profiles[name] = server
+            self.save()
+
+    def tls(self, host, port):
+        '''
+        Return the TLS settings of the profile for host and port, None if
+        it has none.
+        '''
+
+        with self._lock:
+            for server in self._load()["profiles"].values():
+                if server["host"] == host and server["port"] == port:
+                    return server.get("tls")
+
+        return None
+
+    def remove_profile(self, name):
+        ''' Remove a profile, the last one can not be removed. '''
+
+        with self._lock:
+            data = self._load()
+            if len(data["profiles"]) == 1:
+                raise ValueError("the last profile can not be removed")
+
+            del data["profiles"][name]
+            if data["active"] == name:
+                data["active"] = next(iter(data["profiles"]))
+
+            self.save()
+
+
+_STORE = {"store": None}
+_STORE_LOCK = threading.Lock()
+
+
+def get_store():
+    ''' Return the store of the app, created on first use. '''
+
+    with _STORE_LOCK:
+        if _STORE["store"] is None:
+            _STORE["store"] = ConfigStore()
+
+    return _STORE["store"]
+
+
+def self_test():
+    ''' Check the handling of invalid files on temporary files. '''
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, CONFIG_FILE)
+        legacy = os.path.join(directory, LEGACY_FILE)
+
+        # TLS typed as true by hand is kept, checked with the system CAs.
+        with open(path, "w", encoding="utf-8") as outfile:
+            json.dump({"profiles": {"home": {"host": "10.0.0.1", "port": 80,
+                                             "tls": True}}}, outfile)
+        store = ConfigStore(path, legacy)
+        assert store.active() == Profile("home", "10.0.0.1", 80)
+        assert store.tls("10.0.0.1", 80) == {"ca": None, "pin": None}
+        assert not store.damaged
+
+        # A file without a valid profile is not written over, the default
+        #   server is only connected with TLS.
+        for text in ('{"profiles": {}}', '{"profiles": {"a": 5}}', "{"):
+            with open(path, "w", encoding="utf-8") as outfile:
+                outfile.write(text)
+            store = ConfigStore(path, legacy)
+            assert store.tls(DEFAULT_HOST, DEFAULT_PORT) is not None, text
+            store.set_profile(DEFAULT_PROFILE, port=6060)
+            assert store.damaged and store.active().port == 6060
+            with open(path, encoding="utf-8") as infile:
+                assert infile.read() == text
+
+    logger.info("[APP_CONFIG_TEST]: invalid files are handled.")
+
+
+def main(argv=None):
+    ''' Show or change the profiles from the command line. '''
+
+    parser = argparse.ArgumentParser(prog="python -m pcr_app_utils.app_config",
+                                     description="PrivateChatRoom-App "
+                                                 "server profiles")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("list", help="show the profiles")
+    commands.add_parser("test", help="run the self-test")
+    add = commands.add_parser("add", help="add or change a profile")
+    add.add_argument("name")
+    add.add_argument("host")
+    add.add_argument("port", type=int)
+    remove = commands.add_parser("remove", help="remove a profile")
+    remove.add_argument("name")
+    use = commands.add_parser("use", help="make a profile the active one")
+    use.add_argument("name")
+    tls = commands.add_parser("tls", help="connect to a profile with TLS")
+    tls.add_argument("name")
+    tls.add_argument("--ca", help="CA file the certificate is checked with "
+                                  "(default: the system CAs)")
+    tls.add_argument("--pin", help="sha256 fingerprint of the certificate "
+                                   "instead of a CA")
+    tls.add_argument("--off", action="store_true", help="turn TLS off")
+    args = parser.parse_args(argv)
+
+    if args.command == "test":
+        self_test()
+        return
+
+    store = get_store()
+
+    try:
+        if args.command == "add":
+            store.set_profile(args.name, args.host, args.port)
+        elif args.command == "remove":
+            store.remove_profile(args.name)
+        elif args.command == "use":
+            store.set_active(args.name)
+        elif args.command == "tls":
+            store.set_tls(args.name, args.ca, args.pin, not args.off)
+
+    except KeyError as error:
+        parser.error(f"unknown profile {error}")
+
+    except ValueError as error:
+        parser.error(str(error))
+
+    active = store.active().name
+    for profile in store.profiles():
+        mark = "*" if profile.name == active else " "
+        tls = " tls" if store.tls(profile.host, profile.port) else ""
+        print(f"{mark} {profile.name:<15} {profile.host}:{profile.port}{tls}")
+
+
+if __name__ == "__main__":
+    main()
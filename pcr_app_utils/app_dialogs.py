@@ -7,39 +7,140 @@
 #   be used for commercial or profit purposes.
 
 '''
-app_dialogs.py--module for "PrivateChatRoom-App to create and hide a
-message box with an input field for user input.
+app_dialogs.py--module for "PrivateChatRoom-App" to own the one Tk root of
+               the app and to show the message boxes with an input field
+               (alias, ip address, port) as Toplevels on it.
+
+               Every Tk() is a Tcl interpreter of its own, so the root is
+               created once, on the main thread, and only when it is first
+               needed. tkinter is imported then as well, the command line
+               client and the other utilities never load it.
 '''
 
 import sys
-import tkinter
-from tkinter import simpledialog
 from pcr_app_utils.app_logging import app_log
 
 logger = app_log(__name__)
 
+# Colors and font of the input field of the message boxes.
+ENTRY_BG = "lightgreen"
+FONT = "Times"
+
+# The Tk root of the app and the message box waiting for an answer.
+_DIALOGS = {"root": None, "open": None}
+
+
+def root():
+    '''
+    Return the Tk root of the app, created (hidden) on the first call.
+    Must be called from the main thread.
+    '''
+
+    if _DIALOGS["root"] is None:
+        import tkinter  # pylint: disable=import-outside-toplevel
+
+        _DIALOGS["root"] = tkinter.Tk()
+        _DIALOGS["root"].withdraw()  # Hidden until it becomes the window.
+
+        logger.debug(" tk root has been created.")
+
+    return _DIALOGS["root"]
+
+
+def current():
+    ''' Return the message box waiting for an answer, None if none is. '''
+
+    return _DIALOGS["open"]
+
+
+def close_all():
+    ''' Cancel the open message box, e.g. when the app is closed. '''
+
+    if _DIALOGS["open"] is not None:
+        _DIALOGS["open"].cancel()
+
+
+class AskString():
+    ''' A message box with an input field, a Toplevel on the root. '''
+
+    def __init__(self, title, prompt):
+        import tkinter  # pylint: disable=import-outside-toplevel
 
-def dialog():
-    ''' Function to create a popup message box. '''
+        master = root()
+        self.answer = None
 
-    msg_win = tkinter.Tk()
-    msg_win.option_add('*Entry*background', 'lightgreen')
-    msg_win.option_add('*font', 'Times')
-    msg_win.withdraw()  # Hiding the window
+        self.win = tkinter.Toplevel(master)
+        self.win.title(title)
+        self.win.resizable(False, False)
 
-    return msg_win
+        # Stay on top of the main window, if it is shown yet.
+        if master.winfo_viewable():
+            self.win.transient(master)
+
+        tkinter.Label(self.win, text=prompt, font=FONT,
+                      justify="left").pack(padx=5, pady=5)
+
+        self.entry = tkinter.Entry(self.win, bg=ENTRY_BG, font=FONT)
+        self.entry.pack(padx=5, fill="x")
+
+        buttons = tkinter.Frame(self.win)
+        tkinter.Button(buttons, text="OK", width=10, font=FONT,
+                       command=self.ok).pack(side="left", padx=5, pady=5)
+        tkinter.Button(buttons, text="Cancel", width=10, font=FONT,
+                       command=self.cancel).pack(side="left", padx=5, pady=5)
+        buttons.pack()
+
+        self.win.bind("<Return>", self.ok)
+        self.win.bind("<Escape>", self.cancel)
+        self.win.protocol("WM_DELETE_WINDOW", self.cancel)
+
+    def ok(self, _event=None):
+        ''' Keep the text entered and close the message box. '''
+
+        self.answer = self.entry.get()
+        self.win.destroy()
+
+    def cancel(self, _event=None):
+        ''' Close the message box without an answer. '''
+
+        self.answer = None
+        self.win.destroy()
+
+    def show(self):
+        ''' Wait for the user, returns the text entered or None. '''
+
+        _DIALOGS["open"] = self
+
+        try:
+            self.entry.focus_set()
+            self.win.wait_visibility()
+            self.win.grab_set()
+            self.win.wait_window()
+        finally:
+            _DIALOGS["open"] = None
+
+        return self.answer
+
+
+def ask_string(title, prompt):
+    '''
+    Show a message box with an input field and return the text entered,
+    None if the user canceled or closed it.
+    '''
+
+    return AskString(title, prompt).show()
 
 
 if __name__ == "__main__":
-    win = dialog()
     TEXT = "Please enter an alias to test funcionality.\t\t"
-    test = simpledialog.askstring("Test-app_dialogs.py",
-                                  TEXT,
-                                  parent=win)
+    test = ask_string("Test-app_dialogs.py", TEXT)
 
     # If the user canceled or closed the window, log a message.
     if test is None:
         logger.info("[APP_DIALOGS_TEST]: user canceled test window.")
         sys.exit()
 
+    # A second message box reuses the same root.
+    ask_string("Test-app_dialogs.py", "Once more.\t\t")
+
     logger.info("[APP_DIALOGS_TEST]: test successfull.")
@@ -0,0 +1,456 @@
+#!/bin/env python3
+# -*- mode: python; coding: utf-8 -*-
+
+# Script by Thomas Pirchmoser (tommy_software@mailfence.com) 2024
+
+# This script was created for personal/educational purposes only and is not to
+#   be used for commercial or profit purposes.
+
+'''
+app_file_transfer.py--module for "PrivateChatRoom-App" to send files and
+               very large messages in chunks.
+
+               A transfer is a start frame (json with id, name, size and
+               sender), chunk frames (16 byte id + data) and an end frame
+               (json with id and sha256, or cancelled). The sender reads the
+               file in CHUNK_SIZE pieces and keeps at most SEND_WINDOW
+               messages waiting, so chat messages are sent in between the
+               chunks. The receiver writes every chunk straight to a
+               temporary file in the download directory, which is renamed
+               once complete. Memory use does not depend on the file size.
+
+               Files from the other users are only received if the user has
+               turned it on (--receive-files or PCR_RECEIVE_FILES=1), else
+               they are reported as refused and nothing is written.
+
+               Transfers are only made if the server offers the "files"
+               feature in its alias request.
+'''
+
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from pcr_app_utils import app_framing
+from pcr_app_utils.app_logging import app_log
+
+logger = app_log(__name__)
+
+# Bytes read from the file and sent in one chunk frame.
+CHUNK_SIZE = 32 * 1024
+
+# Most messages waiting to be sent while a file is sent, a chat message
+#   waits behind no more than these.
+SEND_WINDOW = 4
+
+# Messages of this many characters and more are sent as a file.
+LARGE_MESSAGE = 64 * 1024
+
+# Largest file accepted from other users.
+MAX_FILE_SIZE = 1024 * 1024 * 1024
+
+# Most files received at the same time.
+MAX_INCOMING = 8
+
+# Files of the other users are refused unless this is turned on.
+RECEIVE_FILES = os.environ.get("PCR_RECEIVE_FILES", "0") != "0"
+
+# Where received files are saved.
+DOWNLOAD_DIR = os.environ.get("PCR_DOWNLOAD_DIR",
+                              os.path.join(os.path.expanduser("~"),
+                                           "Downloads"))
+
+# Seconds between two progress reports of a transfer.
+PROGRESS_INTERVAL = 0.2
+
+# Directions and states of a transfer.
+SENDING = "sending"
+RECEIVING = "receiving"
+ACTIVE = "active"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+REFUSED = "refused"
+
+
+def safe_name(name):
+    ''' Return a file name without any directory parts. '''
+
+    name = os.path.basename(str(name).replace("\\", "/")).strip()
+
+    return name if name not in ("", ".", "..") else "attachment"
+
+
+def claim_path(directory, name):
+    '''
+    Create an empty file for name in directory, numbered if the name is
+    taken, and return its path. Creating it claims the name, no other
+    file can take it until it is replaced.
+    '''
+
+    base, ext = os.path.splitext(name)
+    path = os.path.join(directory, name)
+    number = 1
+
+    while True:
+        try:
+            with open(path, "x", encoding="utf-8"):
+                return path
+        except FileExistsError:
+            path = os.path.join(directory, f"{base} ({number}){ext}")
+            number += 1
+
+
+class Transfer():
+    ''' State of a file sent or received, reported to on_transfer. '''
+
+    def __init__(self, transfer_id, name, size, sender, direction):
+        self.id = transfer_id
+        self.name = name
+        self.size = size
+        self.sender = sender
+        self.direction = direction
+        self.done = 0
+        self.state = ACTIVE
+        self.path = None
+        self.error = None
+
+    @property
+    def progress(self):
+        ''' Fraction of the bytes transferred (0.0 - 1.0). '''
+
+        return self.done / self.size if self.size else 1.0
+
+    def __repr__(self):
+        return f"Transfer({self.direction} {self.name!r} " \
+               f"{self.done}/{self.size} {self.state})"
+
+
+class FileSender():
+    '''
+    Sends a file (or a binary stream of known size) through a ClientCore
+    in a background thread.
+    '''
+
+    def __init__(self, core, stream, name, size, on_transfer=None):
+        self.core = core
+        self.stream = stream
+        self.transfer = Transfer(uuid.uuid4().hex, safe_name(name), size,
+                                 core.alias, SENDING)
+        self.on_transfer = on_transfer
+        self._cancel = threading.Event()
+
+    @classmethod
+    def from_path(cls, core, path, on_transfer=None):
+        ''' Sender for a file on disk. '''
+
+        # pylint: disable=consider-using-with
+        stream = open(path, "rb")
+
+        return cls(core, stream, os.path.basename(path),
+                   os.fstat(stream.fileno()).st_size, on_transfer)
+
+    @classmethod
+    def from_text(cls, core, text, name="message.txt", on_transfer=None):
+        ''' Sender for a message too large to be sent as one frame. '''
+
+        data = text.encode(app_framing.FORMAT)
+
+        return cls(core, io.BytesIO(data), name, len(data), on_transfer)
+
+    def start(self):
+        ''' Start sending in a background thread. '''
+
+        sender_thread = threading.Thread(target=self._run, daemon=True)
+        sender_thread.start()
+
+        return self.transfer
+
+    def cancel(self):
+        ''' Stop sending, the receivers drop what they got. '''
+
+        self._cancel.set()
+
+    def _report(self):
+        if self.on_transfer:
+            self.on_transfer(self.transfer)
+
+    def _send(self, kind, payload):
+        ''' Send a frame, waiting while the window is full. '''
+
+        while not self._cancel.is_set():
+            if self.core.pending() < SEND_WINDOW and \
+                    self.core.send_frame(kind, payload):
+                return
+            time.sleep(0.005)
+
+        raise InterruptedError("cancelled")
+
+    def _run(self):
+        transfer = self.transfer
+        digest = hashlib.sha256()
+        chunk_id = uuid.UUID(transfer.id).bytes
+        reported = 0
+
+        logger.info(" sending %s (%s bytes).", transfer.name, transfer.size)
+
+        try:
+            with self.stream:
+                # The server sends the frames back, do not receive them.
+                self.core.receiver.outgoing.add(transfer.id)
+
+                self._send(app_framing.FRAME_FILE_START,
+                           json.dumps({"id": transfer.id,
+                                       "name": transfer.name,
+                                       "size": transfer.size,
+                                       "from": transfer.sender}))
+
+                while True:
+                    chunk = self.stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+
+                    digest.update(chunk)
+                    self._send(app_framing.FRAME_FILE_CHUNK, chunk_id + chunk)
+                    transfer.done += len(chunk)
+
+                    if time.monotonic() - reported > PROGRESS_INTERVAL:
+                        reported = time.monotonic()
+                        self._report()
+
+                self._send(app_framing.FRAME_FILE_END,
+                           json.dumps({"id": transfer.id,
+                                       "sha256": digest.hexdigest()}))
+                transfer.state = DONE
+
+        except InterruptedError:
+            transfer.state = CANCELLED
+            self._send_cancel()
+
+        except (OSError, ConnectionError) as error:
+            logger.error(" could not send %s: %s", transfer.name, error)
+            transfer.state = FAILED
+            transfer.error = str(error)
+            self._send_cancel()
+
+        logger.info(" sending %s: %s.", transfer.name, transfer.state)
+
+        self._report()
+
+    def _send_cancel(self):
+        ''' Tell the receivers to drop the transfer. '''
+
+        try:
+            self.core.send_frame(app_framing.FRAME_FILE_END,
+                                 json.dumps({"id": self.transfer.id,
+                                             "cancelled": True}),
+                                 force=True)
+        except ConnectionError:
+            # It will not come back to be removed from the outgoing ids.
+            self.core.receiver.outgoing.discard(self.transfer.id)
+
+
+class Incoming():
+    ''' A file being received, written to a temporary file. '''
+
+    def __init__(self, transfer, directory):
+        self.transfer = transfer
+        self.digest = hashlib.sha256()
+        self.reported = 0
+
+        # pylint: disable=consider-using-with
+        self.file = tempfile.NamedTemporaryFile(dir=directory,
+                                                prefix=".pcr_",
+                                                suffix=".part",
+                                                delete=False)
+
+    def discard(self):
+        ''' Close and remove the temporary file. '''
+
+        self.file.close()
+        try:
+            os.unlink(self.file.name)
+        except OSError:
+            pass
+
+
+class FileReceiver():
+    '''
+    Reassembles the files sent by the other users. handle() is called by
+    ClientCore with every file frame, on_transfer(transfer) reports the
+    progress and the result.
+    '''
+
+    def __init__(self, on_transfer=None, directory=None,
+                 accept=RECEIVE_FILES):
+        self.on_transfer = on_transfer
+        self.directory = directory or DOWNLOAD_DIR
+
+        # True if the user wants to receive files.
+        self.accept = accept
+        self.incoming = {}
+
+        # Ids of the transfers sent by this client.
+        self.outgoing = set()
+
+    def _report(self, transfer):
+        if self.on_transfer:
+            self.on_transfer(transfer)
+
+    def handle(self, frame):
+        ''' Act on a file frame received from the server. '''
+
+        try:
+            if frame.kind == app_framing.FRAME_FILE_START:
+                self._start(json.loads(frame.payload))
+            elif frame.kind == app_framing.FRAME_FILE_CHUNK:
+                self._chunk(frame.payload)
+            elif frame.kind == app_framing.FRAME_FILE_END:
+                self._end(json.loads(frame.payload))
+
+        except (ValueError, KeyError, TypeError) as error:
+            logger.error(" invalid file frame: %s", error)
+
+    def close(self):
+        ''' Drop the unfinished transfers. '''
+
+        for incoming in self.incoming.values():
+            incoming.discard()
+        self.incoming.clear()
+
+    def _start(self, info):
+        transfer = Transfer(str(info["id"]), safe_name(info["name"]),
+                            int(info["size"]), str(info.get("from", "?")),
+                            RECEIVING)
+
+        # An invalid id is refused before anything is written.
+        key = uuid.UUID(transfer.id).bytes
+
+        if transfer.id in self.outgoing:
+            return
+
+        # A second start of a transfer would leave the first file behind.
+        if key in self.incoming:
+            logger.warning(" %s is being received already.", transfer.name)
+            return
+
+        if not self.accept or not 0 <= transfer.size <= MAX_FILE_SIZE or \
+                len(self.incoming) >= MAX_INCOMING:
+            logger.warning(" refused %s (%s bytes) from %s.", transfer.name,
+                           transfer.size, transfer.sender)
+            transfer.state = REFUSED
+            self._report(transfer)
+            return
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            incoming = Incoming(transfer, self.directory)
+        except OSError as error:
+            logger.error(" can not receive %s: %s", transfer.name, error)
+            return
+
+        self.incoming[key] = incoming
+
+        logger.info(" receiving %s (%s bytes) from %s.", transfer.name,
+                    transfer.size, transfer.sender)
+        self._report(transfer)
+
+    def _chunk(self, payload):
+        incoming = self.incoming.get(payload[:16])
+        if incoming is None:
+            return
+
+        data = memoryview(payload)[16:]
+        transfer = incoming.transfer
+
+        # More data than announced.
+        if transfer.done + len(data) > transfer.size:
+            self._fail(payload[:16], "more data than announced")
+            return
+
+        try:
+            incoming.file.write(data)
+        except OSError as error:
+            self._fail(payload[:16], str(error))
+            return
+
+        incoming.digest.update(data)
+        transfer.done += len(data)
+
+        if time.monotonic() - incoming.reported > PROGRESS_INTERVAL:
+            incoming.reported = time.monotonic()
+            self._report(transfer)
+
+    def _end(self, info):
+        # The end of a file sent by this client has come back.
+        if str(info["id"]) in self.outgoing:
+            self.outgoing.discard(str(info["id"]))
+            return
+
+        key = uuid.UUID(str(info["id"])).bytes
+        incoming = self.incoming.get(key)
+        if incoming is None:
+            return
+
+        transfer = incoming.transfer
+
+        if info.get("cancelled"):
+            self.incoming.pop(key)
+            incoming.discard()
+            transfer.state = CANCELLED
+            self._report(transfer)
+            return
+
+        if transfer.done != transfer.size or \
+                incoming.digest.hexdigest() != info.get("sha256"):
+            self._fail(key, "the file is incomplete or damaged")
+            return
+
+        self.incoming.pop(key)
+        incoming.file.close()
+
+        # Give the complete file its name, in place of the empty file
+        #   claiming it.
+        try:
+            transfer.path = claim_path(self.directory, transfer.name)
+            os.replace(incoming.file.name, transfer.path)
+            transfer.state = DONE
+            logger.info(" received %s.", transfer.path)
+
+        except OSError as error:
+            incoming.discard()
+            if transfer.path is not None:
+                try:
+                    os.unlink(transfer.path)  # The empty file claiming it.
+                except OSError:
+                    pass
+                transfer.path = None
+            transfer.state = FAILED
+            transfer.error = str(error)
+            logger.error(" could not save %s: %s", transfer.name, error)
+
+        self._report(transfer)
+
+    def _fail(self, key, reason):
+        incoming = self.incoming.pop(key)
+        incoming.discard()
+
+        transfer = incoming.transfer
+        transfer.state = FAILED
+        transfer.error = reason
+
+        logger.error(" receiving %s failed: %s", transfer.name, reason)
+        self._report(transfer)
+
+
+def add_arguments(parser):
+    ''' Add the file transfer options to an argparse parser. '''
+
+    parser.add_argument("--receive-files", action="store_true",
+                        default=RECEIVE_FILES,
+                        help="save the files sent by the other users to "
+                             f"{DOWNLOAD_DIR}")
@@ -0,0 +1,438 @@
+#!/bin/env python3
+# -*- mode: python; coding: utf-8 -*-
+
+# Script by Thomas Pirchmoser (tommy_software@mailfence.com) 2024
+
+# This script was created for personal/educational purposes only and is not to
+#   be used for commercial or profit purposes.
+
+'''
+app_framing.py--module for "PrivateChatRoom-App" to frame the messages
+               exchanged with the 'PrivateChatRoom-Server'.
+
+               Every frame starts with a 6 byte header:
+                   version (1 byte), type (1 byte), payload length (4 bytes)
+               followed by the payload.
+
+               Servers that do not support frames send plain text, in which
+               case the codec falls back to the legacy format.
+
+               A server offering compression lists "zlib" in its alias
+               request. A client that wants it answers with a features frame
+               after its alias, from then on large payloads may be sent
+               zlib compressed in both directions, marked by the high bit
+               of the type byte. The "files" feature allows the file frames
+               of app_file_transfer, the "ping" feature the ping/pong frames
+               of app_heartbeat.
+
+               The "rooms" feature lets one connection take part in several
+               rooms: join/leave frames carry the name of a room, and the
+               chat, system and roster frames of any room but the main one
+               are wrapped in a room frame:
+                   type of the wrapped frame (1 byte), length of the room
+                   name (1 byte), room name, payload of the wrapped frame
+               Frames that are not wrapped belong to the main room, as with
+               servers that have no rooms.
+
+               With the "members" feature the server sends the members of a
+               room instead of the "N online..." roster text: the full list
+               once in a members frame, then only the changes in delta
+               frames (see app_roster). Both are wrapped like the roster
+               frames of the other rooms.
+'''
+
+import codecs
+import os
+import re
+import struct
+import zlib
+from collections import namedtuple
+from pcr_app_utils.app_logging import app_log
+
+logger = app_log(__name__)
+
+# Format in which we will encode/decode the data
+FORMAT = "utf-8"
+
+# Version of the framing protocol, it is always the first byte of a frame.
+PROTOCOL_VERSION = 1
+
+# Header layout: version, type, payload length (network byte order).
+HEADER = struct.Struct("!BBI")
+
+# Upper limit for the payload of a single frame.
+MAX_PAYLOAD = 1024 * 1024
+
+# Frame types.
+FRAME_CHAT = 1
+FRAME_ROSTER = 2
+FRAME_ALIAS = 3
+FRAME_SYSTEM = 4
+FRAME_FEATURES = 5
+FRAME_FILE_START = 6
+FRAME_FILE_CHUNK = 7
+FRAME_FILE_END = 8
+FRAME_PING = 9
+FRAME_PONG = 10
+FRAME_JOIN = 11
+FRAME_LEAVE = 12
+FRAME_ROOM = 13
+FRAME_MEMBERS = 14
+FRAME_MEMBERS_DELTA = 15
+
+FRAME_NAMES = {FRAME_CHAT: "chat",
+               FRAME_ROSTER: "roster",
+               FRAME_ALIAS: "alias",
+               FRAME_SYSTEM: "system",
+               FRAME_FEATURES: "features",
+               FRAME_FILE_START: "file start",
+               FRAME_FILE_CHUNK: "file chunk",
+               FRAME_FILE_END: "file end",
+               FRAME_PING: "ping",
+               FRAME_PONG: "pong",
+               FRAME_JOIN: "join",
+               FRAME_LEAVE: "leave",
+               FRAME_ROOM: "room",
+               FRAME_MEMBERS: "members",
+               FRAME_MEMBERS_DELTA: "members delta"}
+
+# The frames of a file transfer (app_file_transfer).
+FILE_FRAMES = (FRAME_FILE_START, FRAME_FILE_CHUNK, FRAME_FILE_END)
+
+# Bit set in the type byte of a frame with a zlib compressed payload.
+FLAG_COMPRESSED = 0x80
+
+# Features negotiated in the alias handshake.
+FEATURE_ZLIB = "zlib"
+FEATURE_FILES = "files"
+FEATURE_PING = "ping"
+FEATURE_ROOMS = "rooms"
+FEATURE_MEMBERS = "members"
+
+# Header of a room frame: type of the wrapped frame, length of the name.
+ROOM_HEADER = struct.Struct("!BB")
+
+# Longest room name in bytes.
+MAX_ROOM_NAME = 64
+
+# Roster text of a legacy server ("3 online..."), a chat line always has
+# the alias and a colon first. It is sent without a line break, so it may
+# come right before the next message.
+LEGACY_ROSTER = re.compile(r"\d+ [^:\n]*?online\.\.\.[ \t\r]*\n?")
+
+# Alias request of a legacy server, the roster text may follow it at once
+# (an alias starting with "ALIAS" is followed by more of it or a colon).
+LEGACY_ALIAS = re.compile(r"ALIAS(?=\d+ |[^\w:]|$)\n?")
+
+# Payloads from this size on are compressed once it has been negotiated.
+COMPRESS_THRESHOLD = 1024
+
+# zlib level, low levels cost little cpu and already shrink text a lot.
+COMPRESS_LEVEL = 6
+
+# Ask servers for compression, unless PCR_COMPRESSION=0.
+COMPRESSION = os.environ.get("PCR_COMPRESSION", "1") != "0"
+
+# Modes of the codec.
+MODE_AUTO = "auto"
+MODE_FRAMED = "framed"
+MODE_LEGACY = "legacy"
+
+# A complete message received from the server.
+Frame = namedtuple("Frame", ["kind", "payload"])
+
+
+class FrameError(ValueError):
+    ''' Raised when the received data is not a valid frame. '''
+
+
+def frame_text(frame):
+    '''
+    Return the payload of a frame as a string, invalid bytes are replaced
+    instead of raising in the receive thread.
+    '''
+
+    return frame.payload.decode(FORMAT, "replace")
+
+
+def encode_frame(kind, payload, compress=False):
+    '''
+    Build a frame of the given type from a bytes payload. With compress
+    the payload is sent compressed if that makes it smaller.
+    '''
+
+    if len(payload) > MAX_PAYLOAD:
+        raise FrameError(f"payload of {len(payload)} bytes is too large")
+
+    if compress:
+        packed = zlib.compress(payload, COMPRESS_LEVEL)
+        if len(packed) < len(payload):
+            payload = packed
+            kind |= FLAG_COMPRESSED
+
+    return HEADER.pack(PROTOCOL_VERSION, kind, len(payload)) + payload
+
+
+def decompress(payload):
+    ''' Return the original payload, FrameError if it is not valid. '''
+
+    decompressor = zlib.decompressobj()
+
+    try:
+        # Never unpack more than a frame may hold.
+        data = decompressor.decompress(payload, MAX_PAYLOAD)
+    except zlib.error as error:
+        raise FrameError(f"invalid compressed payload: {error}") from error
+
+    if decompressor.unconsumed_tail:
+        raise FrameError("compressed payload is too large")
+
+    return data
+
+
+def valid_room(room):
+    ''' True if the name can be used for a room. '''
+
+    return bool(room) and room == room.strip() and \
+        len(room.encode(FORMAT)) <= MAX_ROOM_NAME and room.isprintable()
+
+
+def encode_room(room, kind, payload):
+    ''' Return the payload of a room frame wrapping a frame of the room. '''
+
+    name = room.encode(FORMAT)
+
+    if not valid_room(room):
+        raise FrameError(f"invalid room name {room!r}")
+
+    return ROOM_HEADER.pack(kind, len(name)) + name + payload
+
+
+def split_room(payload):
+    ''' Return (room, wrapped Frame) of the payload of a room frame. '''
+
+    if len(payload) < ROOM_HEADER.size:
+        raise FrameError("room frame is too short")
+
+    kind, length = ROOM_HEADER.unpack_from(payload)
+    start = ROOM_HEADER.size + length
+
+    if not length or len(payload) < start:
+        raise FrameError("room frame without a room name")
+
+    room = payload[ROOM_HEADER.size:start].decode(FORMAT, "replace")
+
+    return room, Frame(kind, payload[start:])
+
+
+def parse_features(payload):
+    ''' Return the set of features listed in a payload ("zlib,..."). '''
+
+    return {feature.strip()
+            for feature in payload.decode(FORMAT, "replace").split(",")
+            if feature.strip()}
+
+
+def classify_legacy(message):
+    ''' Guess the type of a plain text message sent by a legacy server. '''
+
+    if message == "ALIAS":
+        return FRAME_ALIAS
+
+    if LEGACY_ROSTER.fullmatch(message):
+        return FRAME_ROSTER
+
+    return FRAME_CHAT
+
+
+class FrameCodec():
+    '''
+    Streaming encoder/decoder for the messages exchanged with the server.
+
+    Data received from the socket is passed to feed(), which returns the
+    complete frames found so far and keeps any partial frame for the
+    next call. In auto mode the first byte received decides whether the
+    server speaks the framed protocol or the legacy text format.
+
+    The data may be a memoryview of the receive buffer: the frames are cut
+    straight out of it and only a partial frame is copied. Legacy text goes
+    through an incremental decoder, a character split between two reads is
+    completed by the next one. The text of a read is cut into messages at
+    the line breaks and after "ALIAS" and the roster text, which have none.
+    '''
+
+    def __init__(self, mode=MODE_AUTO):
+        self.mode = mode
+        self._buffer = bytearray()
+        self._decoder = codecs.getincrementaldecoder(FORMAT)("replace")
+
+
+        # True once compression has been negotiated.
+        self.compression = False
+
+    @property
+    def framed(self):
+        ''' True if the server has been detected to support frames. '''
+
+        return self.mode == MODE_FRAMED
+
+    def encode(self, kind, text):
+        '''
+        Encode a message (str, or bytes for binary payloads) for sending
+        in the negotiated format.
+        '''
+
+        data = text if isinstance(text, bytes) else text.encode(FORMAT)
+
+        if self.framed:
+            return encode_frame(kind, data,
+                                compress=self.compression and
+                                len(data) >= COMPRESS_THRESHOLD)
+
+        return data
+
+    def feed(self, data):
+        ''' Add received data and return a list of the complete frames. '''
+
+        if not data:
+            return []
+
+        # Detect the format from the first byte the server sends.
+        if self.mode == MODE_AUTO:
+            if data[0] == PROTOCOL_VERSION:
+                self.mode = MODE_FRAMED
+            else:
+                self.mode = MODE_LEGACY
+
+            logger.debug(" server uses the %s message format.", self.mode)
+
+        if self.mode == MODE_LEGACY:
+            return self._split_legacy(self._decoder.decode(data))
+
+        # Without a partial frame waiting, the frames are read straight
+        #   from the data received.
+        if self._buffer:
+            self._buffer += data
+            source = self._buffer
+        else:
+            source = data
+
+        frames = []
+        offset = 0
+
+        with memoryview(source) as view:
+            # Cut as many complete frames as possible out of the data.
+            while len(view) - offset >= HEADER.size:
+                version, kind, length = HEADER.unpack_from(view, offset)
+
+                if version != PROTOCOL_VERSION:
+                    raise FrameError(f"unsupported protocol version "
+                                     f"{version}")
+
+                if length > MAX_PAYLOAD:
+                    raise FrameError(f"frame of {length} bytes is too large")
+
+                end = offset + HEADER.size + length
+
+                # Wait for the rest of the frame.
+                if len(view) < end:
+                    break
+
+                # The only copy of the payload.
+                payload = view[offset + HEADER.size:end].tobytes()
+
+                if kind & FLAG_COMPRESSED:
+                    kind &= ~FLAG_COMPRESSED
+                    payload = decompress(payload)
+
+                frames.append(Frame(kind, payload))
+                offset = end
+
+        # Keep a partial frame for the next call.
+        if source is self._buffer:
+            del self._buffer[:offset]
+        elif offset < len(source):
+            self._buffer += memoryview(source)[offset:]
+
+        return frames
+
+    @staticmethod
+    def _split_legacy(text):
+        '''
+        Return the legacy messages of the text of one read. The text after
+        the last line break is a message as well, like the notices of the
+        server that have none.
+        '''
+
+        frames = []
+        start = 0
+
+        while start < len(text):
+            # "ALIAS" and the roster text have no line break of their own.
+            match = LEGACY_ALIAS.match(text, start)
+            if match is not None:
+                frames.append(Frame(FRAME_ALIAS, b"ALIAS"))
+                start = match.end()
+                continue
+
+            match = LEGACY_ROSTER.match(text, start)
+            if match is not None:
+                frames.append(Frame(FRAME_ROSTER,
+                                    match.group().encode(FORMAT)))
+                start = match.end()
+                continue
+
+            end = text.find("\n", start) + 1 or len(text)
+            message = text[start:end]
+            frames.append(Frame(classify_legacy(message),
+                                message.encode(FORMAT)))
+            start = end
+
+        return frames
+
+if __name__ == "__main__":
+    codec = FrameCodec()
+    stream = encode_frame(FRAME_ALIAS, b"") + \
+        encode_frame(FRAME_ROSTER, b"2 online...") + \
+        encode_frame(FRAME_CHAT, "tommy: hello äöü\n".encode())
+
+    # Feed the stream one byte at a time to test the reassembly.
+    received = []
+    for index in range(len(stream)):
+        received.extend(codec.feed(stream[index:index + 1]))
+
+    for item in received:
+        logger.info("[APP_FRAMING_TEST]: %s %r",
+                    FRAME_NAMES[item.kind], frame_text(item))
+
+    # A large compressed payload comes out as it went in.
+    paste = ("Traceback (most recent call last):\n" * 200).encode()
+    packed = encode_frame(FRAME_CHAT, paste, compress=True)
+    assert len(packed) < len(paste)
+    assert codec.feed(packed) == [Frame(FRAME_CHAT, paste)]
+
+    # A message of another room comes out with its room.
+    wrapped = encode_room("ops", FRAME_CHAT, b"tommy: hi\n")
+    assert split_room(wrapped) == ("ops", Frame(FRAME_CHAT, b"tommy: hi\n"))
+
+    # A character split between two reads of a legacy server.
+    legacy = FrameCodec(MODE_LEGACY)
+    umlauts = "tommy: äöü 😀\n".encode()
+    texts = [frame_text(item) for index in range(len(umlauts))
+             for item in legacy.feed(memoryview(umlauts)[index:index + 1])]
+    assert "".join(texts) == "tommy: äöü 😀\n"
+
+    # Legacy messages read together are cut apart, a notice without a line
+    #   break is not held back.
+    chunk = "ALIAS3 online...tommy: hi\nanna: ho\n\tbob has joined..."
+    parts = [(item.kind, frame_text(item))
+             for item in legacy.feed(chunk.encode())]
+    assert parts == [(FRAME_ALIAS, "ALIAS"), (FRAME_ROSTER, "3 online..."),
+                     (FRAME_CHAT, "tommy: hi\n"), (FRAME_CHAT, "anna: ho\n"),
+                     (FRAME_CHAT, "\tbob has joined...")], parts
+    assert legacy.feed(b"ALIASBOT: hi") == [Frame(FRAME_CHAT, b"ALIASBOT: hi")]
+
+    # Only the roster text is a roster, not a chat line starting with a digit.
+    assert classify_legacy("3 online...") == FRAME_ROSTER
+    assert classify_legacy("2pac: 3 online...\n") == FRAME_CHAT
+    assert classify_legacy("1st: hello\n") == FRAME_CHAT
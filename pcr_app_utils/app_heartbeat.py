@@ -0,0 +1,168 @@
+#!/bin/env python3
+# -*- mode: python; coding: utf-8 -*-
+
+# Script by Thomas Pirchmoser (tommy_software@mailfence.com) 2024
+
+# This script was created for personal/educational purposes only and is not to
+#   be used for commercial or profit purposes.
+
+'''
+app_heartbeat.py--module for "PrivateChatRoom-App" to notice a silent server
+               within seconds.
+
+               Servers offering the "ping" feature answer a ping frame with a
+               pong frame carrying the same payload (the send time). Every
+               connection sends a ping each interval; if nothing at all has
+               been received for interval * misses seconds, the connection
+               is considered dead. The round-trip time of the pings is
+               reported as it is measured.
+
+               One background thread drives the heartbeats of all sessions
+               of the process. The timings can be set with the
+               PCR_HEARTBEAT_INTERVAL and PCR_HEARTBEAT_MISSES variables,
+               PCR_HEARTBEAT=0 turns the pings off.
+'''
+
+import os
+import struct
+import threading
+import time
+from pcr_app_utils.app_logging import app_log
+
+logger = app_log(__name__)
+
+# Send pings, unless PCR_HEARTBEAT=0.
+HEARTBEAT = os.environ.get("PCR_HEARTBEAT", "1") != "0"
+
+# Seconds between two pings.
+HEARTBEAT_INTERVAL = float(os.environ.get("PCR_HEARTBEAT_INTERVAL", "2"))
+
+# Intervals without any data before the connection is given up.
+HEARTBEAT_MISSES = int(os.environ.get("PCR_HEARTBEAT_MISSES", "3"))
+
+# Seconds between two checks of the heartbeats.
+TICK = 0.25
+
+# Payload of a ping: the send time in nanoseconds (perf_counter_ns).
+PING = struct.Struct("!Q")
+
+# Heartbeats running and the thread driving them.
+_BEATS = {"beats": set(), "thread": None}
+_LOCK = threading.Lock()
+
+
+def _run():
+    ''' Check all heartbeats every tick, ends when none are left. '''
+
+    while True:
+        time.sleep(TICK)
+
+        with _LOCK:
+            if not _BEATS["beats"]:
+                _BEATS["thread"] = None
+                return
+            beats = list(_BEATS["beats"])
+
+        now = time.monotonic()
+        for beat in beats:
+            try:
+                beat.tick(now)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception(" heartbeat failed.")
+
+
+class Heartbeat():
+    '''
+    The heartbeat of one connection.
+
+        send_ping(payload) -- sends a ping frame with the payload.
+        on_dead(reason)    -- nothing has been received for too long.
+        on_rtt(ms)         -- round-trip time of a ping.
+
+    seen() must be called whenever data is received, pong(payload) with the
+    payload of every pong frame.
+    '''
+
+    def __init__(self, send_ping, on_dead, on_rtt=None,
+                 interval=HEARTBEAT_INTERVAL, misses=HEARTBEAT_MISSES):
+        self.send_ping = send_ping
+        self.on_dead = on_dead
+        self.on_rtt = on_rtt
+        self.interval = interval
+        self.misses = misses
+        self.last_seen = time.monotonic()
+        self.last_ping = 0
+        self.rtt_ms = None
+
+    def start(self):
+        ''' Start sending pings. '''
+
+        self.last_seen = time.monotonic()
+
+        with _LOCK:
+            _BEATS["beats"].add(self)
+
+            if _BEATS["thread"] is None:
+                _BEATS["thread"] = threading.Thread(target=_run,
+                                                    name="pcr-heartbeat",
+                                                    daemon=True)
+                _BEATS["thread"].start()
+
+    def stop(self):
+        ''' Stop sending pings. '''
+
+        with _LOCK:
+            _BEATS["beats"].discard(self)
+
+    def seen(self):
+        ''' Data has been received, the server is alive. '''
+
+        self.last_seen = time.monotonic()
+
+    def pong(self, payload):
+        ''' Measure the round-trip time of an answered ping. '''
+
+        if len(payload) < PING.size:
+            return
+
+        sent, = PING.unpack_from(payload)
+        self.rtt_ms = (time.perf_counter_ns() - sent) / 1e6
+
+        if self.on_rtt:
+            self.on_rtt(self.rtt_ms)
+
+    def tick(self, now):
+        ''' Send a ping if it is time, give up if the server is silent. '''
+
+        silent = now - self.last_seen
+
+        if silent > self.interval * self.misses:
+            self.stop()
+            logger.warning(" nothing received for %.1f seconds.", silent)
+            self.on_dead(f"no answer for {silent:.0f} seconds")
+            return
+
+        if now - self.last_ping >= self.interval:
+            self.last_ping = now
+            self.send_ping(PING.pack(time.perf_counter_ns()))
+
+
+if __name__ == "__main__":
+    RESULT = {"pings": 0, "dead": None}
+
+    def answer(payload):
+        ''' Answers the first two pings only, then goes silent. '''
+
+        RESULT["pings"] += 1
+        if RESULT["pings"] <= 2:
+            BEAT.seen()
+            BEAT.pong(payload)
+
+    BEAT = Heartbeat(answer, lambda reason: RESULT.update(dead=reason),
+                     interval=0.2, misses=3)
+    BEAT.start()
+    time.sleep(1.5)
+
+    assert BEAT.rtt_ms is not None and BEAT.rtt_ms < 50
+    assert RESULT["dead"] is not None
+    logger.info("[APP_HEARTBEAT_TEST]: %s", RESULT)
@@ -0,0 +1,363 @@
+#!/bin/env python3
+# -*- mode: python; coding: utf-8 -*-
+
+# Script by Thomas Pirchmoser (tommy_software@mailfence.com) 2024
+
+# This script was created for personal/educational purposes only and is not to
+#   be used for commercial or profit purposes.
+
+'''
+app_history.py--module for "PrivateChatRoom-App" to keep the messages
+               across restarts (opt-in, --history or PCR_HISTORY=1).
+
+               The messages are stored in a local sqlite database. The
+               receive thread only queues them, a writer thread inserts them
+               in batches. Pages of older messages are read with keyset
+               paging on the (room, time, id) index, so only what is shown
+               is loaded. Messages older than max_age_days, beyond
+               max_messages or beyond max_bytes are pruned in the background.
+'''
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from pcr_app_utils import app_framing
+from pcr_app_utils.app_logging import app_log
+
+logger = app_log(__name__)
+
+# Database file.
+HISTORY_FILE = os.environ.get("PCR_HISTORY_FILE", ".pcr_history.sqlite3")
+
+# Keep the history, off unless PCR_HISTORY=1 or --history.
+HISTORY = os.environ.get("PCR_HISTORY", "0") != "0"
+
+# Retention: days, number of messages and size of the database.
+MAX_AGE_DAYS = 90
+MAX_MESSAGES = 200000
+MAX_BYTES = 50 * 1024 * 1024
+
+# Most messages inserted in one transaction.
+BATCH_SIZE = 500
+
+# Seconds the writer waits for more messages before it commits.
+FLUSH_INTERVAL = 0.25
+
+# Seconds between two runs of the retention policy.
+PRUNE_INTERVAL = 3600
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS messages ("
+    " id INTEGER PRIMARY KEY,"
+    " room TEXT NOT NULL,"
+    " time REAL NOT NULL,"
+    " sender TEXT NOT NULL,"
+    " kind INTEGER NOT NULL,"
+    " text TEXT NOT NULL)",
+    # Paging through a room.
+    "CREATE INDEX IF NOT EXISTS messages_room_time"
+    " ON messages (room, time, id)",
+    # Pruning by age.
+    "CREATE INDEX IF NOT EXISTS messages_time ON messages (time)",
+    # Looking up the messages of a user.
+    "CREATE INDEX IF NOT EXISTS messages_sender"
+    " ON messages (sender, time)",
+)
+
+
+def sender_of(kind, text):
+    ''' Return the alias that wrote a chat message ("alias: msg"). '''
+
+    if kind == app_framing.FRAME_CHAT and ": " in text:
+        return text.split(": ", 1)[0]
+
+    return ""
+
+
+class HistoryStore():
+    ''' The message history, written in the background. '''
+
+    def __init__(self, path=HISTORY_FILE, max_age_days=MAX_AGE_DAYS,
+                 max_messages=MAX_MESSAGES, max_bytes=MAX_BYTES):
+        self.path = path
+        self.max_age_days = max_age_days
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self._queue = queue.SimpleQueue()
+        self._reader = None
+        self._reader_lock = threading.Lock()
+
+        # Set once the writer thread has ended, nothing is queued then.
+        self._stopped = False
+
+        # Create the tables before anyone reads.
+        conn = self._connect()
+        try:
+            # Only takes effect for a new database, lets pruning shrink it.
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            for statement in SCHEMA:
+                conn.execute(statement)
+            conn.commit()
+        finally:
+            conn.close()
+
+        self._writer = threading.Thread(target=self._write_loop,
+                                        name="pcr-history", daemon=True)
+        self._writer.start()
+
+        logger.debug(" history is kept in %s.", path)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    def add(self, room, kind, text, when=None):
+        ''' Queue a message for writing, can be called from any thread. '''
+
+        if self._stopped:
+            return
+
+        self._queue.put((room, when or time.time(), sender_of(kind, text),
+                         kind, text))
+
+    def flush(self, timeout=5):
+        ''' Wait until the queued messages have been written. '''
+
+        done = threading.Event()
+        self._queue.put(done)
+
+        return done.wait(timeout)
+
+    def close(self, timeout=5):
+        ''' Write the queued messages and close the database. '''
+
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(timeout)
+
+        with self._reader_lock:
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+
+    def older(self, room, before=None, limit=200, until=None):
+        '''
+        Return up to limit messages of a room as (key, text), oldest first,
+        that come before the key (time, id) of a message. Without a key,
+        the newest messages written before 'until' (a time) are returned.
+        '''
+
+        if before is None:
+            sql = "SELECT time, id, text FROM messages" \
+                  " WHERE room = ? AND time < ?" \
+                  " ORDER BY time DESC, id DESC LIMIT ?"
+            args = (room, until if until is not None else time.time(), limit)
+        else:
+            sql = "SELECT time, id, text FROM messages" \
+                  " WHERE room = ? AND (time < ? OR (time = ? AND id < ?))" \
+                  " ORDER BY time DESC, id DESC LIMIT ?"
+            args = (room, before[0], before[0], before[1], limit)
+
+        with self._reader_lock:
+            if self._reader is None:
+                self._reader = self._connect()
+            rows = self._reader.execute(sql, args).fetchall()
+
+        return [((when, row_id), text) for when, row_id, text
+                in reversed(rows)]
+
+    def count(self):
+        ''' Return the number of messages stored. '''
+
+        with self._reader_lock:
+            if self._reader is None:
+                self._reader = self._connect()
+            return self._reader.execute(
+                        "SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    def _write_loop(self):
+        ''' Writer thread: insert the queued messages in batches. '''
+
+        conn = None
+        last_prune = 0
+
+        try:
+            conn = self._connect()
+
+            while True:
+                batch = []
+                waiting = []
+                stop = False
+
+                # Block for the first message, then collect what follows.
+                item = self._queue.get()
+                deadline = time.monotonic() + FLUSH_INTERVAL
+
+                while True:
+                    if item is None:
+                        stop = True
+                    elif isinstance(item, threading.Event):
+                        waiting.append(item)
+                    else:
+                        batch.append(item)
+
+                    if stop or waiting or len(batch) >= BATCH_SIZE:
+                        break
+
+                    try:
+                        item = self._queue.get(
+                                timeout=max(0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+
+                if batch:
+                    self._insert(conn, batch)
+
+                for event in waiting:
+                    event.set()
+
+                if stop:
+                    break
+
+                if time.monotonic() - last_prune > PRUNE_INTERVAL:
+                    last_prune = time.monotonic()
+
+                    # A failed prune is tried again next time.
+                    try:
+                        self.prune(conn)
+                    except sqlite3.Error as error:
+                        logger.error(" history could not be pruned: %s",
+                                     error)
+
+        except sqlite3.Error as error:
+            logger.error(" history can not be written: %s", error)
+
+        finally:
+            self._stopped = True
+            if conn is not None:
+                conn.close()
+
+    @staticmethod
+    def _insert(conn, batch):
+        try:
+            with conn:
+                conn.executemany("INSERT INTO messages"
+                                 " (room, time, sender, kind, text)"
+                                 " VALUES (?, ?, ?, ?, ?)", batch)
+        except sqlite3.Error as error:
+            logger.error(" %s messages not saved: %s", len(batch), error)
+
+    def prune(self, conn):
+        ''' Apply the retention policy, returns the messages deleted. '''
+
+        deleted = 0
+
+        with conn:
+            # Too old.
+            cutoff = time.time() - self.max_age_days * 86400
+            deleted += conn.execute("DELETE FROM messages WHERE time < ?",
+                                    (cutoff,)).rowcount
+
+            # Too many, keep the newest.
+            deleted += conn.execute(
+                        "DELETE FROM messages WHERE id <= (SELECT id FROM"
+                        " messages ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                        (self.max_messages,)).rowcount
+
+            # Too large, drop the oldest tenth until it fits.
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            while True:
+                used = conn.execute("PRAGMA page_count").fetchone()[0] - \
+                    conn.execute("PRAGMA freelist_count").fetchone()[0]
+                count = conn.execute("SELECT COUNT(*) FROM messages"
+                                     ).fetchone()[0]
+                if used * page_size <= self.max_bytes or not count:
+                    break
+                deleted += conn.execute(
+                        "DELETE FROM messages WHERE id <= (SELECT id FROM"
+                        " messages ORDER BY id LIMIT 1 OFFSET ?)",
+                        (count // 10,)).rowcount
+
+        if deleted:
+            # Give the free pages back to the file system.
+            conn.execute("PRAGMA incremental_vacuum")
+            logger.info(" %s old messages pruned from the history.", deleted)
+
+        return deleted
+
+
+class HistoryPager():
+    '''
+    Older messages of one room for the Scrollback. The messages of the
+    running session are in the scrollback itself, so without a key only
+    messages from before 'since' are returned.
+    '''
+
+    def __init__(self, store, room, since):
+        self.store = store
+        self.room = room
+        self.since = since
+
+    def older(self, before, limit):
+        ''' Return (key, text) of up to limit messages, oldest first. '''
+
+        return self.store.older(self.room, before, limit, until=self.since)
+
+
+def add_arguments(parser):
+    ''' Add the history options to an argparse parser. '''
+
+    parser.add_argument("--history", action="store_true", default=HISTORY,
+                        help="keep the messages across restarts")
+    parser.add_argument("--history-file", default=HISTORY_FILE,
+                        help="database file (default: %(default)s)")
+    parser.add_argument("--history-days", type=float, default=MAX_AGE_DAYS,
+                        help="days the messages are kept "
+                             "(default: %(default)s)")
+    parser.add_argument("--history-max-messages", type=int,
+                        default=MAX_MESSAGES,
+                        help="most messages kept (default: %(default)s)")
+
+
+def from_args(args):
+    ''' Return the HistoryStore selected by the options, None if off. '''
+
+    if not args.history:
+        return None
+
+    try:
+        return HistoryStore(args.history_file, args.history_days,
+                            args.history_max_messages)
+    except sqlite3.Error as error:
+        logger.error(" history is not available: %s", error)
+        return None
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = HistoryStore(os.path.join(directory, "test.sqlite3"),
+                             max_messages=50)
+        now = time.time()
+        for number in range(120):
+            store.add("main", app_framing.FRAME_CHAT, f"tommy: {number}\n",
+                      when=now + number)
+        store.flush()
+
+        page = store.older("main", limit=10, until=now + 1000)
+        assert [text for _, text in page][-1] == "tommy: 119\n"
+        previous = store.older("main", before=page[0][0], limit=10)
+        assert previous[-1][1] == "tommy: 109\n"
+
+        conn = store._connect()  # pylint: disable=protected-access
+        store.prune(conn)
+        conn.close()
+        assert store.count() == 50
+
+        store.close()
+        logger.info("[APP_HISTORY_TEST]: history works.")
@@ -8,41 +8,213 @@
 
 '''
 app_logging.py--set up the logging for client.py.
+
+               All loggers share one QueueHandler, the records are written
+               to the rotating log file by a QueueListener thread so the GUI
+               and network threads never wait for the disk.
+
+               The level, file, rotation and format are set with configure()
+               (or the PCR_LOG_LEVEL, PCR_LOG_FILE, PCR_LOG_MAX_BYTES,
+               PCR_LOG_BACKUPS and PCR_LOG_JSON variables). Call shutdown()
+               before os._exit(), it writes the records still queued.
 '''
 
+import atexit
+import json
 import logging
+import os
+import queue
+import threading
 from logging import handlers
 
+# Defaults, can be overridden with the environment variables.
+LOG_LEVEL = os.environ.get("PCR_LOG_LEVEL", "DEBUG").upper()
+LOG_FILE = os.environ.get("PCR_LOG_FILE", ".client.log")
+LOG_MAX_BYTES = int(os.environ.get("PCR_LOG_MAX_BYTES", "20000"))
+LOG_BACKUPS = int(os.environ.get("PCR_LOG_BACKUPS", "2"))
+LOG_JSON = os.environ.get("PCR_LOG_JSON", "") not in ("", "0")
 
-def app_log(__name__):
-    ''' Set-up the logging object. '''
+# The one pipeline of the process, created on first use.
+_PIPELINE = {"settings": {"level": LOG_LEVEL,
+                          "path": LOG_FILE,
+                          "max_bytes": LOG_MAX_BYTES,
+                          "backups": LOG_BACKUPS,
+                          "json_lines": LOG_JSON},
+             "queue_handler": None,
+             "file_handler": None,
+             "listener": None,
+             "loggers": set()}
+_LOCK = threading.RLock()
 
-    # Get current logger instance with name of the module.
-    logger = logging.getLogger(__name__)
 
-    # Set log level to debug - higher than info.
-    logger.setLevel(logging.DEBUG)
+class JsonFormatter(logging.Formatter):
+    ''' Formats a record as one json object per line. '''
 
-    # Create a formatter object with specified format for the logs.
-    formatter = logging.Formatter(
-                            '%(asctime)s:%(levelname)s:%(name)s:%(message)s',
-                            "%Y-%m-%d %H:%M:%S")
+    def format(self, record):
+        entry = {"time": self.formatTime(record, self.datefmt),
+                 "level": record.levelname,
+                 "name": record.name,
+                 "thread": record.threadName,
+                 "message": record.getMessage().strip()}
+
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
 
-    # Create file handler to handle log files rotation and backup.
-    file_handler = handlers.RotatingFileHandler('.client.log',
-                                                maxBytes=20000,
-                                                backupCount=2)
+        return json.dumps(entry)
+
+
+def _file_handler(settings):
+    ''' Create the handler writing to the log file. '''
+
+    file_handler = handlers.RotatingFileHandler(settings["path"],
+                                                maxBytes=settings["max_bytes"],
+                                                backupCount=settings["backups"],
+                                                encoding="utf-8",
+                                                delay=True)
+
+    # Create a formatter object with specified format for the logs.
+    if settings["json_lines"]:
+        formatter = JsonFormatter(datefmt="%Y-%m-%d %H:%M:%S")
+    else:
+        formatter = logging.Formatter(
+                        '%(asctime)s:%(levelname)s:%(name)s:%(message)s',
+                        "%Y-%m-%d %H:%M:%S")
 
-    # Set formatter for the file handler object.
     file_handler.setFormatter(formatter)
 
-    # Add file handler to logger instance.
-    logger.addHandler(file_handler)
+    return file_handler
+
+
+def configure(level=None, path=None, max_bytes=None, backups=None,
+              json_lines=None):
+    '''
+    Set up the logging pipeline, or change its settings. Arguments left
+    at None keep their current value. Can be called any number of times,
+    there is always exactly one handler.
+    '''
+
+    with _LOCK:
+        settings = _PIPELINE["settings"]
+
+        for key, value in (("level", level), ("path", path),
+                           ("max_bytes", max_bytes), ("backups", backups),
+                           ("json_lines", json_lines)):
+            if value is not None:
+                settings[key] = value.upper() if key == "level" else value
+
+        # Stop the running listener, it writes what is queued so far.
+        if _PIPELINE["listener"] is not None:
+            _PIPELINE["listener"].stop()
+            _PIPELINE["file_handler"].close()
+
+        if _PIPELINE["queue_handler"] is None:
+            _PIPELINE["queue_handler"] = handlers.QueueHandler(
+                                                        queue.SimpleQueue())
+
+            # Write the queued records when the interpreter exits normally.
+            atexit.register(shutdown)
+
+        _PIPELINE["file_handler"] = _file_handler(settings)
+        _PIPELINE["listener"] = handlers.QueueListener(
+                                            _PIPELINE["queue_handler"].queue,
+                                            _PIPELINE["file_handler"])
+        _PIPELINE["listener"].start()
+
+        # Apply the level to the loggers created so far.
+        for name in _PIPELINE["loggers"]:
+            logging.getLogger(name).setLevel(settings["level"])
+
+
+def app_log(__name__):
+    ''' Set-up the logging object. '''
+
+    with _LOCK:
+        if _PIPELINE["listener"] is None:
+            configure()
+
+        # Get current logger instance with name of the module.
+        logger = logging.getLogger(__name__)
+        logger.setLevel(_PIPELINE["settings"]["level"])
+
+        # Add the shared handler, only once per logger.
+        if _PIPELINE["queue_handler"] not in logger.handlers:
+            logger.addHandler(_PIPELINE["queue_handler"])
+
+        _PIPELINE["loggers"].add(__name__)
 
     return logger
 
 
+def queue_handler():
+    ''' Return the handler all loggers share, e.g. to time it. '''
+
+    with _LOCK:
+        if _PIPELINE["queue_handler"] is None:
+            configure()
+
+        return _PIPELINE["queue_handler"]
+
+
+def flush():
+    ''' Wait until the queued records have been written. '''
+
+    with _LOCK:
+        listener = _PIPELINE["listener"]
+        if listener is None:
+            return
+
+        # Stopping the listener drains the queue, then start it again.
+        listener.stop()
+        _PIPELINE["file_handler"].flush()
+        listener.start()
+
+
+def shutdown():
+    '''
+    Write the queued records and close the log file. Must be called before
+    os._exit(), which skips the atexit hooks.
+    '''
+
+    with _LOCK:
+        listener, _PIPELINE["listener"] = _PIPELINE["listener"], None
+        if listener is None:
+            return
+
+        listener.stop()
+        _PIPELINE["file_handler"].close()
+
+
+def add_arguments(parser):
+    ''' Add the logging options to an argparse parser. '''
+
+    parser.add_argument("--log-level",
+                        choices=("DEBUG", "INFO", "WARNING", "ERROR"),
+                        type=str.upper,
+                        help=f"log level (default: {LOG_LEVEL})")
+    parser.add_argument("--log-file",
+                        help=f"log file (default: {LOG_FILE})")
+    parser.add_argument("--log-max-bytes", type=int,
+                        help="size at which the log file is rotated "
+                             f"(default: {LOG_MAX_BYTES})")
+    parser.add_argument("--log-json", action="store_true", default=None,
+                        help="write the log as json lines")
+
+
+def configure_from_args(args):
+    ''' Apply the options of add_arguments(). '''
+
+    configure(level=args.log_level, path=args.log_file,
+              max_bytes=args.log_max_bytes, json_lines=args.log_json)
+
+
 # Calling the function and logging a message.
 if __name__ == "__main__":
     log = app_log(__name__)
     log.info("[TEST] logging is set up.")
+
+    # Repeated set-up does not add handlers.
+    app_log(__name__)
+    configure()
+    assert len(log.handlers) == 1
+
+    shutdown()
@@ -0,0 +1,341 @@
+#!/bin/env python3
+# -*- mode: python; coding: utf-8 -*-
+
+# Script by Thomas Pirchmoser (tommy_software@mailfence.com) 2024
+
+# This script was created for personal/educational purposes only and is not to
+#   be used for commercial or profit purposes.
+
+'''
+app_metrics.py--module for "PrivateChatRoom-App" with counters, gauges and
+               histograms about the network and the GUI.
+
+               Metrics recorded by the app:
+                   counters   -- bytes_in, bytes_out, messages_in,
+                                 messages_out, decode_errors, connects,
+                                 reconnects, connect_failures
+                   gauges     -- ui_queue_depth, send_queue_depth
+                   histograms -- rtt_ms (send until the server echoes the
+                                 message back), connect_ms, render_ms (time
+                                 per update of the widgets), search_ms,
+                                 ping_ms (heartbeat round-trip time)
+
+               Snapshots can be written periodically as json lines
+               (MetricsRecorder) and served on a local-only HTTP port or
+               Unix socket (serve), see add_arguments() for the options.
+'''
+
+import json
+import os
+import socketserver
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pcr_app_utils.app_logging import app_log
+
+logger = app_log(__name__)
+
+# Number of recent values a histogram keeps for the percentiles.
+SAMPLES = 1000
+
+# Seconds between two records written by the MetricsRecorder.
+RECORD_INTERVAL = 10
+
+# Recorder and servers started by start().
+_RUNNING = {"recorder": None, "servers": []}
+
+
+class Histogram():
+    ''' Count, sum and maximum of all values, percentiles of recent ones. '''
+
+    def __init__(self, samples=SAMPLES):
+        self.count = 0
+        self.total = 0.0
+        self.max = None
+        self.recent = deque(maxlen=samples)
+
+    def observe(self, value):
+        ''' Add a value. '''
+
+        self.count += 1
+        self.total += value
+        self.recent.append(value)
+
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def snapshot(self):
+        ''' Return the summary as a dictionary. '''
+
+        values = sorted(self.recent)
+
+        def percentile(pct):
+            if not values:
+                return None
+            return round(values[min(len(values) - 1,
+                                    int(pct / 100 * len(values)))], 3)
+
+        return {"count": self.count,
+                "mean": round(self.total / self.count, 3)
+                        if self.count else None,
+                "p50": percentile(50),
+                "p95": percentile(95),
+                "p99": percentile(99),
+                "max": round(self.max, 3) if self.max is not None else None}
+
+
+class Metrics():
+    ''' Thread-safe collection of named counters, gauges and histograms. '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def count(self, name, amount=1):
+        ''' Add amount to a counter. '''
+
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def gauge(self, name, value):
+        ''' Set a gauge to its current value. '''
+
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, name, value):
+        ''' Add a value to a histogram. '''
+
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(value)
+
+    @contextmanager
+    def timer(self, name):
+        ''' Observe the milliseconds spent in the with block. '''
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - start) * 1000)
+
+    def snapshot(self):
+        ''' Return the current values as a dictionary (json compatible). '''
+
+        with self._lock:
+            return {"time": round(time.time(), 3),
+                    "uptime": round(time.monotonic() - self.started, 3),
+                    "counters": dict(self.counters),
+                    "gauges": dict(self.gauges),
+                    "histograms": {name: histogram.snapshot()
+                                   for name, histogram
+                                   in self.histograms.items()}}
+
+    def reset(self):
+        ''' Forget all values. '''
+
+        with self._lock:
+            self.started = time.monotonic()
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+
+# The metrics of the app.
+REGISTRY = Metrics()
+
+
+def rates(previous, current):
+    ''' Return the counters per second between two snapshots. '''
+
+    seconds = current["uptime"] - previous["uptime"]
+    if seconds <= 0:
+        return {}
+
+    return {name: round((value - previous["counters"].get(name, 0))
+                        / seconds, 1)
+            for name, value in current["counters"].items()}
+
+
+class MetricsRecorder():
+    ''' Appends a snapshot as a json line to a file every interval. '''
+
+    def __init__(self, path, interval=RECORD_INTERVAL, registry=REGISTRY):
+        self.path = path
+        self.interval = interval
+        self.registry = registry
+        self._stop = threading.Event()
+        self._previous = None
+
+    def start(self):
+        ''' Start writing records in a background thread. '''
+
+        recorder_thread = threading.Thread(target=self._run, daemon=True)
+        recorder_thread.start()
+
+        logger.debug(" metrics are recorded to %s.", self.path)
+
+    def stop(self):
+        ''' Stop the recorder after writing a last record. '''
+
+        if not self._stop.is_set():
+            self._stop.set()
+            self.record()
+
+    def record(self):
+        ''' Write one record, with the rates since the previous one. '''
+
+        snapshot = self.registry.snapshot()
+
+        if self._previous is not None:
+            snapshot["rates"] = rates(self._previous, snapshot)
+        self._previous = snapshot
+
+        try:
+            with open(self.path, "a", encoding="utf-8") as outfile:
+                outfile.write(json.dumps(snapshot) + "\n")
+        except OSError as error:
+            logger.error(" could not write the metrics: %s", error)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.record()
+
+
+class _HttpHandler(BaseHTTPRequestHandler):
+    ''' Answers GET /metrics with a snapshot. '''
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+
+        body = json.dumps(self.server.registry.snapshot()).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        ''' Keep the requests out of stderr. '''
+
+
+class _UnixHandler(socketserver.StreamRequestHandler):
+    ''' Writes a snapshot to every client and closes the connection. '''
+
+    def handle(self):
+        self.wfile.write(json.dumps(self.server.registry.snapshot()).encode()
+                         + b"\n")
+
+
+def serve(port=None, path=None, registry=REGISTRY):
+    '''
+    Serve snapshots on 127.0.0.1:port (HTTP, GET /metrics) or on the Unix
+    socket at path. Returns the server, which runs in a daemon thread and
+    is stopped with shutdown().
+    '''
+
+    if path is not None:
+        # Remove the socket left behind by an earlier run.
+        if os.path.exists(path):
+            os.unlink(path)
+        server = socketserver.ThreadingUnixStreamServer(path, _UnixHandler)
+        where = path
+    else:
+        # Only reachable from this machine.
+        server = ThreadingHTTPServer(("127.0.0.1", port or 0), _HttpHandler)
+        where = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+
+    server.daemon_threads = True
+    server.registry = registry
+
+    server_thread = threading.Thread(target=server.serve_forever,
+                                     daemon=True)
+    server_thread.start()
+
+    logger.info(" metrics are served on %s", where)
+
+    return server
+
+
+def add_arguments(parser):
+    ''' Add the metrics options to an argparse parser. '''
+
+    parser.add_argument("--metrics-file",
+                        help="append a json record of the metrics to this "
+                             "file every few seconds")
+    parser.add_argument("--metrics-interval", type=float,
+                        default=RECORD_INTERVAL,
+                        help="seconds between two records "
+                             "(default: %(default)s)")
+    parser.add_argument("--metrics-port", type=int,
+                        help="serve the metrics on http://127.0.0.1:PORT")
+    parser.add_argument("--metrics-socket",
+                        help="serve the metrics on this Unix socket")
+
+
+def start(args, registry=REGISTRY):
+    '''
+    Start the recorder and the endpoints selected by the options of
+    add_arguments(), they run until stop() is called.
+    '''
+
+    if args.metrics_file:
+        _RUNNING["recorder"] = MetricsRecorder(args.metrics_file,
+                                               args.metrics_interval,
+                                               registry)
+        _RUNNING["recorder"].start()
+
+    if args.metrics_port is not None:
+        _RUNNING["servers"].append(serve(port=args.metrics_port,
+                                         registry=registry))
+
+    if args.metrics_socket:
+        _RUNNING["servers"].append(serve(path=args.metrics_socket,
+                                         registry=registry))
+
+
+def stop():
+    ''' Write the last record and stop the endpoints. '''
+
+    recorder, _RUNNING["recorder"] = _RUNNING["recorder"], None
+    if recorder is not None:
+        recorder.stop()
+
+    while _RUNNING["servers"]:
+        server = _RUNNING["servers"].pop()
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    metrics = Metrics()
+    for number in range(100):
+        metrics.count("messages_in")
+        metrics.observe("rtt_ms", number)
+    with metrics.timer("render_ms"):
+        time.sleep(0.01)
+    metrics.gauge("ui_queue_depth", 3)
+
+    result = metrics.snapshot()
+    assert result["counters"]["messages_in"] == 100
+    assert result["histograms"]["rtt_ms"]["p50"] == 50
+    assert result["histograms"]["render_ms"]["max"] >= 10
+
+    http_server = serve(registry=metrics)
+    from urllib.request import urlopen
+    with urlopen(f"http://127.0.0.1:{http_server.server_address[1]}"
+                 "/metrics") as response:
+        assert json.load(response)["gauges"]["ui_queue_depth"] == 3
+    http_server.shutdown()
+
+    logger.info("[APP_METRICS_TEST]: %s", json.dumps(result))
@@ -0,0 +1,282 @@
+#!/bin/env python3
+# -*- mode: python; coding: utf-8 -*-
+
+# Script by Thomas Pirchmoser (tommy_software@mailfence.com) 2024
+
+# This script was created for personal/educational purposes only and is not to
+#   be used for commercial or profit purposes.
+
+'''
+app_profiling.py--module for "PrivateChatRoom-App" to find out where the time
+               and the memory of the app go.
+
+               Off unless turned on with --profile [DIR] or PCR_PROFILE=DIR
+               (PCR_PROFILE=1 for the default directory). Then it
+                   - runs cProfile on the main thread and on every thread
+                     started afterwards (receive, writer, reactor, ...),
+                   - traces the memory allocations with tracemalloc,
+                   - times the spans of the receive ("receive", "decode"),
+                     send ("send"), widget update ("render", "ui_calls")
+                     and logging ("log") paths.
+
+               stop() writes the results to the directory, it is called at
+               exit and must be called before os._exit():
+                   <thread>.pstats -- cProfile stats of each thread,
+                   all.pstats      -- the threads combined (read them with
+                                      python -m pstats FILE),
+                   allocations.txt -- the top allocation sites,
+                   spans.json      -- count, mean, p50/p95/p99 and max ms
+                                      of every span.
+
+               While it is off, span() returns one shared context that does
+               nothing.
+'''
+
+import atexit
+import contextlib
+import cProfile
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import tracemalloc
+from pcr_app_utils import app_logging
+from pcr_app_utils.app_metrics import Metrics
+from pcr_app_utils.app_logging import app_log
+
+logger = app_log(__name__)
+
+# Directory of the results if none is given.
+PROFILE_DIR = ".pcr_profile"
+
+# Turned on by the PCR_PROFILE variable ("1" or a directory).
+PROFILE = os.environ.get("PCR_PROFILE", "")
+
+# Frames kept of every allocation traced.
+TRACE_FRAMES = 10
+
+# Allocation sites written to allocations.txt.
+TOP_ALLOCATIONS = 30
+
+# Span returned while profiling is off.
+_NO_SPAN = contextlib.nullcontext()
+
+# State of the profiling, spans is None while it is off.
+_PROFILING = {"directory": None,
+              "spans": None,
+              "profiles": [],
+              "log_handler": None}
+_LOCK = threading.Lock()
+
+
+def span(name):
+    ''' Return a context that times its with block as the span name. '''
+
+    spans = _PROFILING["spans"]
+    if spans is None:
+        return _NO_SPAN
+
+    return spans.timer(name)
+
+
+def is_on():
+    ''' True while profiling. '''
+
+    return _PROFILING["spans"] is not None
+
+
+def _profile_thread():
+    ''' Start a profiler for the calling thread. '''
+
+    profile = cProfile.Profile()
+    profile.enable()
+
+    with _LOCK:
+        _PROFILING["profiles"].append((threading.current_thread().name,
+                                       profile))
+
+
+def _thread_started(_frame, _event, _arg):
+    ''' First profile event of a new thread, it gets a profiler instead. '''
+
+    sys.setprofile(None)
+    _profile_thread()
+
+
+def _timed(func, name):
+    ''' Return func timed as the span name. '''
+
+    def timed(*args):
+        with span(name):
+            return func(*args)
+
+    return timed
+
+
+def start(directory=PROFILE_DIR):
+    ''' Start profiling, the results are written to directory by stop(). '''
+
+    with _LOCK:
+        if _PROFILING["spans"] is not None:
+            return
+        _PROFILING["directory"] = directory
+        _PROFILING["spans"] = Metrics()
+
+    os.makedirs(directory, exist_ok=True)
+    tracemalloc.start(TRACE_FRAMES)
+
+    _profile_thread()
+
+    # Before Python 3.12 every thread needs a profiler of its own, from
+    #   then on the one of the main thread sees all of them.
+    if sys.version_info < (3, 12):
+        threading.setprofile(_thread_started)
+
+    # Time the formatting and queueing of the log records.
+    handler = app_logging.queue_handler()
+    handler.emit = _timed(handler.emit, "log")
+    _PROFILING["log_handler"] = handler
+
+    atexit.register(stop)
+
+    logger.info(" profiling, the results go to %s.", directory)
+
+
+def stop():
+    ''' Stop profiling and write the results, does nothing if it is off. '''
+
+    with _LOCK:
+        spans, _PROFILING["spans"] = _PROFILING["spans"], None
+        profiles, _PROFILING["profiles"] = _PROFILING["profiles"], []
+
+    if spans is None:
+        return
+
+    threading.setprofile(None)
+
+    handler, _PROFILING["log_handler"] = _PROFILING["log_handler"], None
+    if handler is not None:
+        del handler.emit  # Back to the method of the class.
+
+    directory = _PROFILING["directory"]
+
+    try:
+        # The allocations first, before the stats add their own.
+        _write_allocations(directory)
+        _write_profiles(directory, profiles)
+
+        with open(os.path.join(directory, "spans.json"), "w",
+                  encoding="utf-8") as outfile:
+            json.dump(spans.snapshot()["histograms"], outfile, indent=2)
+
+    except OSError as error:
+        logger.error(" could not write the profile: %s", error)
+        return
+
+    logger.info(" profile has been written to %s.", directory)
+
+
+def _write_profiles(directory, profiles):
+    ''' Write the stats of every thread and of all threads combined. '''
+
+    combined = None
+
+    for name, profile in profiles:
+        profile.disable()
+        profile.create_stats()
+
+        # Threads that did not run any Python code.
+        if not profile.stats:
+            continue
+
+        stats = pstats.Stats(profile)
+        stats.dump_stats(os.path.join(
+                directory, re.sub(r"[^\w.-]+", "_", name) + ".pstats"))
+
+        if combined is None:
+            combined = pstats.Stats(profile)
+        else:
+            combined.add(stats)
+
+    if combined is not None:
+        combined.dump_stats(os.path.join(directory, "all.pstats"))
+
+
+def _write_allocations(directory):
+    ''' Write the sites that allocated the most memory still in use. '''
+
+    snapshot = tracemalloc.take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    snapshot = snapshot.filter_traces((
+                    tracemalloc.Filter(False, tracemalloc.__file__),
+                    tracemalloc.Filter(False, cProfile.__file__),
+                    tracemalloc.Filter(False, "<frozen importlib._*>"),
+                    tracemalloc.Filter(False, "<unknown>")))
+
+    with open(os.path.join(directory, "allocations.txt"), "w",
+              encoding="utf-8") as outfile:
+        outfile.write(f"traced: {current / 1024:.1f} KiB in use, "
+                      f"{peak / 1024:.1f} KiB peak\n\n")
+
+        for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+            outfile.write(f"{stat}\n")
+
+
+def add_arguments(parser):
+    ''' Add the profiling option to an argparse parser. '''
+
+    default = None
+    if PROFILE not in ("", "0"):
+        default = PROFILE_DIR if PROFILE == "1" else PROFILE
+
+    parser.add_argument("--profile", nargs="?", const=PROFILE_DIR,
+                        default=default, metavar="DIR",
+                        help="profile the app and write the results to DIR "
+                             f"on exit (default: {PROFILE_DIR})")
+
+
+def start_from_args(args):
+    ''' Start profiling if the option of add_arguments() is set. '''
+
+    if args.profile:
+        start(args.profile)
+
+
+if __name__ == "__main__":
+    import tempfile
+    import time
+
+    # Off, the spans cost next to nothing.
+    assert span("receive") is _NO_SPAN
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        start(temp_dir)
+
+        def work():
+            ''' Something to profile in another thread. '''
+
+            with span("receive"):
+                _ = [str(number) for number in range(10000)]
+            logger.debug(" work done.")
+
+        worker = threading.Thread(target=work, name="worker")
+        worker.start()
+        worker.join()
+        with span("render"):
+            time.sleep(0.01)
+        stop()
+
+        written = sorted(os.listdir(temp_dir))
+        assert {"all.pstats", "worker.pstats", "allocations.txt",
+                "spans.json"} <= set(written), written
+
+        with open(os.path.join(temp_dir, "spans.json"),
+                  encoding="utf-8") as infile:
+            assert set(json.load(infile)) >= {"receive", "render", "log"}
+
+    assert not is_on() and span("send") is _NO_SPAN
+    logger.info("[APP_PROFILING_TEST]: %s", written)
@@ -0,0 +1,356 @@
+#!/bin/env python3
+# -*- mode: python; coding: utf-8 -*-
+
+# Script by Thomas Pirchmoser (tommy_software@mailfence.com) 2024
+
+# This script was created for personal/educational purposes only and is not to
+#   be used for commercial or profit purposes.
+
+'''
+app_reactor.py--module for "PrivateChatRoom-App" to service the connections
+               of any number of sessions from one thread.
+
+               The reactor waits on all sockets at once with the selectors
+               module, reads and writes them non-blocking and calls the
+               callbacks of their SelectorTransport. However many sessions a
+               process runs (e.g. hundreds of monitoring bots), it only has
+               the one I/O thread, and one receive buffer shared by all of
+               them (only that thread reads). The methods of
+               SelectorTransport may be called from any thread, they hand
+               the work to the reactor thread and wake it up.
+
+               Used as the "selector" engine of app_transport.
+'''
+
+import selectors
+import socket
+import ssl
+import threading
+from collections import deque
+from pcr_app_utils import app_tls
+from pcr_app_utils.app_transport import CLOSE_TIMEOUT, READ_SIZE
+from pcr_app_utils.app_transport import OutboundQueue
+from pcr_app_utils.app_logging import app_log
+
+logger = app_log(__name__)
+
+# Errors of a non-blocking socket that only mean "not now".
+WOULD_BLOCK = (BlockingIOError, InterruptedError, ssl.SSLWantReadError,
+               ssl.SSLWantWriteError)
+
+_REACTOR = {"reactor": None}
+_REACTOR_LOCK = threading.Lock()
+
+
+def get_reactor():
+    ''' Return the shared reactor, starting its thread on first use. '''
+
+    with _REACTOR_LOCK:
+        if _REACTOR["reactor"] is None:
+            _REACTOR["reactor"] = Reactor()
+            _REACTOR["reactor"].start()
+
+            logger.debug(" reactor has started.")
+
+        return _REACTOR["reactor"]
+
+
+class Reactor():
+    ''' One thread servicing the sockets of many SelectorTransports. '''
+
+    def __init__(self, read_size=READ_SIZE):
+        self.selector = selectors.DefaultSelector()
+
+        # Every read of every socket goes into this buffer.
+        self.buffer = bytearray(read_size)
+        self.view = memoryview(self.buffer)
+
+        # Functions other threads want to run on the reactor thread.
+        self._calls = deque()
+        self._calls_lock = threading.Lock()
+        self._woken = False
+
+        # Writing a byte wakes the thread up from select().
+        self._wake_read, self._wake_write = socket.socketpair()
+        self._wake_read.setblocking(False)
+        self._wake_write.setblocking(False)
+        self.selector.register(self._wake_read, selectors.EVENT_READ)
+
+        self.thread = None
+
+    def start(self):
+        ''' Start the reactor thread. '''
+
+        self.thread = threading.Thread(target=self._run, name="pcr-reactor",
+                                       daemon=True)
+        self.thread.start()
+
+    def in_thread(self):
+        ''' True if called from the reactor thread. '''
+
+        return threading.current_thread() is self.thread
+
+    def sessions(self):
+        ''' Return the number of sockets serviced. '''
+
+        return len(self.selector.get_map()) - 1
+
+    def call(self, func, *args):
+        ''' Run func(*args) on the reactor thread, can be called anywhere. '''
+
+        with self._calls_lock:
+            self._calls.append((func, args))
+            if self._woken:
+                return
+            self._woken = True
+
+        try:
+            self._wake_write.send(b"\0")
+        except BlockingIOError:
+            pass  # A wake-up is pending anyway.
+
+    def _run_calls(self):
+        with self._calls_lock:
+            calls, self._calls = self._calls, deque()
+            self._woken = False
+
+        try:
+            while True:
+                self._wake_read.recv(4096)
+        except BlockingIOError:
+            pass
+
+        for func, args in calls:
+            try:
+                func(*args)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception(" reactor call %s failed.", func)
+
+    def _run(self):
+        ''' Wait for the sockets and hand their events to the transports. '''
+
+        while True:
+            for key, events in self.selector.select():
+                if key.data is None:
+                    self._run_calls()
+                    continue
+
+                transport = key.data
+
+                # One session failing must not stop the others.
+                try:
+                    if events & selectors.EVENT_READ:
+                        transport.readable()
+                    if events & selectors.EVENT_WRITE:
+                        transport.writable()
+                except Exception as error:  # pylint: disable=broad-except
+                    logger.exception(" session failed: %s", error)
+                    transport.fail(str(error))
+
+
+class SelectorTransport():
+    '''
+    A non-blocking socket serviced by the shared reactor. Same interface
+    as app_transport.ThreadedTransport: on_data(data) gets a memoryview
+    that is only valid during the call.
+    '''
+
+    def __init__(self, connected, on_data, on_closed, reactor=None):
+        self.sock = connected["sock"]
+        self.on_data = on_data
+        self.on_closed = on_closed
+        self.reactor = reactor or get_reactor()
+        self.outbound = OutboundQueue()
+        self._closed = False
+        self._closing = False
+        self._abort_reason = None
+        self._done = threading.Event()
+
+        # Part of a batch the socket did not take yet.
+        self._writing = None
+
+        # Events the socket is registered for, 0 until started.
+        self._events = 0
+
+        # True while a flush is waiting to run on the reactor thread.
+        self._flush_lock = threading.Lock()
+        self._flush_scheduled = False
+
+        # TLS 1.3 delivers the session ticket after the handshake.
+        self._tls_server = None
+        if isinstance(self.sock, ssl.SSLSocket):
+            self._tls_server = (connected["host"], connected["port"])
+
+        self.sock.setblocking(False)
+
+    def start(self):
+        ''' Start servicing the socket. '''
+
+        self.reactor.call(self._register)
+
+    def send(self, data, force=False):
+        '''
+        Queue data to be sent to the server. Returns False if too many
+        messages are waiting already (unless force is set).
+        '''
+
+        if not self.outbound.put(data, force):
+            return False
+
+        with self._flush_lock:
+            if self._flush_scheduled:
+                return True
+            self._flush_scheduled = True
+
+        self.reactor.call(self.writable)
+
+        return True
+
+    def pending(self):
+        ''' Return the number of messages waiting to be sent. '''
+
+        return len(self.outbound) + (self._writing is not None)
+
+    def close(self):
+        '''
+        Send the waiting messages and close the connection, waits up to
+        CLOSE_TIMEOUT for them unless called from the reactor thread.
+        '''
+
+        if self._closed:
+            return
+
+        self._closed = True
+        self.outbound.close()
+        self.reactor.call(self._close_when_flushed)
+
+        if not self.reactor.in_thread() and \
+                not self._done.wait(CLOSE_TIMEOUT):
+            self.reactor.call(self._finish)
+
+    def abort(self, reason):
+        '''
+        Drop a connection that has gone silent without sending the waiting
+        messages, it is reported with on_closed(reason).
+        '''
+
+        self._abort_reason = reason
+        self.outbound.close()
+        self.reactor.call(self.fail, reason)
+
+    def readable(self):
+        ''' Reactor thread: pass the data received on. '''
+
+        reactor = self.reactor
+
+        while self._events:
+            try:
+                size = self.sock.recv_into(reactor.buffer)
+            except WOULD_BLOCK:
+                return
+            except OSError as error:
+                self.fail(str(error))
+                return
+
+            # An empty read means the server closed the connection.
+            if not size:
+                self.fail("closed by the server")
+                return
+
+            if self._tls_server is not None:
+                app_tls.remember(*self._tls_server, self.sock)
+                self._tls_server = None
+
+            self.on_data(reactor.view[:size])
+
+            # Decrypted data waiting in the TLS layer does not wake up
+            #   select(), plain sockets are read again on the next event.
+            if not isinstance(self.sock, ssl.SSLSocket) or \
+                    not self.sock.pending():
+                return
+
+    def writable(self):
+        ''' Reactor thread: write as much of the waiting data as it takes. '''
+
+        with self._flush_lock:
+            self._flush_scheduled = False
+
+        if not self._events:
+            return
+
+        while True:
+            if self._writing is None:
+                batch = self.outbound.take_batch()
+                if batch is None:
+                    break
+                self._writing = memoryview(batch)
+
+            try:
+                sent = self.sock.send(self._writing)
+            except WOULD_BLOCK:
+                self._want(selectors.EVENT_READ | selectors.EVENT_WRITE)
+                return
+            except OSError as error:
+                logger.error(" could not send to the server: %s", error)
+                self.fail(str(error))
+                return
+
+            self._writing = self._writing[sent:] or None
+
+        # Everything has been written.
+        self._want(selectors.EVENT_READ)
+
+        if self._closing:
+            self._finish()
+
+    def fail(self, reason):
+        ''' Reactor thread: the connection is lost, report it. '''
+
+        if not self._events:
+            return
+
+        self._finish()
+
+        # Only report connections that were not closed by the app.
+        if not self._closed:
+            self._closed = True
+            self.on_closed(self._abort_reason or reason)
+
+    def _register(self):
+        ''' Reactor thread: read the socket, write what has been queued. '''
+
+        self._want(selectors.EVENT_READ)
+        self.writable()
+
+    def _close_when_flushed(self):
+        self._closing = True
+
+        if self._events:
+            self.writable()
+        else:
+            self._finish()  # Closed before it was started.
+
+    def _want(self, events):
+        ''' Reactor thread: (re)register the socket for the events. '''
+
+        if events == self._events or self._done.is_set():
+            return
+
+        if self._events:
+            self.reactor.selector.modify(self.sock, events, self)
+        else:
+            self.reactor.selector.register(self.sock, events, self)
+
+        self._events = events
+
+    def _finish(self):
+        ''' Reactor thread: stop servicing the socket and close it. '''
+
+        if self._events:
+            self.reactor.selector.unregister(self.sock)
+            self._events = 0
+
+        if not self._done.is_set():
+            self._done.set()
+            self.sock.close()
+            logger.debug(" socket has been closed.")
@@ -0,0 +1,117 @@
+#!/bin/env python3
+# -*- mode: python; coding: utf-8 -*-
+
+# Script by Thomas Pirchmoser (tommy_software@mailfence.com) 2024
+
+# This script was created for personal/educational purposes only and is not to
+#   be used for commercial or profit purposes.
+
+'''
+app_reconnect.py--module for "PrivateChatRoom-App" to (re)connect to the
+               'PrivateChatRoom-Server' in the background.
+
+               Failed attempts are retried after an exponentially growing,
+               randomized delay, so many clients losing the server at the
+               same time do not all come back at the same moment.
+'''
+
+import random
+import threading
+from pcr_app_utils import app_transport
+from pcr_app_utils.app_logging import app_log
+
+logger = app_log(__name__)
+
+# Seconds to wait before the first retry.
+BASE_DELAY = 1
+
+# Longest wait between two attempts in seconds.
+MAX_DELAY = 60
+
+
+def backoff(attempt, base=BASE_DELAY, cap=MAX_DELAY):
+    '''
+    Return the seconds to wait before the given retry (1, 2, ...).
+    Half of the delay is fixed, the other half is random.
+    '''
+
+    delay = min(cap, base * 2 ** (attempt - 1))
+
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class Reconnector():
+    '''
+    Connects in a background thread until it succeeds.
+
+    on_connected(connected) is called with the result of
+    app_transport.connect() once a connection is made, on_retry(attempt,
+    delay, connected) after every failed attempt. Both are called from the
+    background thread.
+    '''
+
+    def __init__(self, on_connected, on_retry, connect=app_transport.connect):
+        self.on_connected = on_connected
+        self.on_retry = on_retry
+        self.connect = connect
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._wake = threading.Event()
+
+    def start(self, host, port, engine):
+        ''' Start connecting, an earlier run of attempts is abandoned. '''
+
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+
+            # Wake up a previous run so it can notice it is stale.
+            self._wake.set()
+            self._wake = threading.Event()
+            wake = self._wake
+
+        reconnect_thread = threading.Thread(target=self._run,
+                                            args=(generation, wake,
+                                                  host, port, engine),
+                                            daemon=True)
+        reconnect_thread.start()
+
+    def stop(self):
+        ''' Abandon the running attempts. '''
+
+        with self._lock:
+            self._generation += 1
+            self._wake.set()
+
+    def _current(self, generation):
+        ''' True if the run has not been abandoned. '''
+
+        with self._lock:
+            return generation == self._generation
+
+    def _run(self, generation, wake, host, port, engine):
+        ''' Try to connect until it succeeds or the run is abandoned. '''
+
+        attempt = 0
+
+        while self._current(generation):
+            connected = self.connect(host, port, engine)
+
+            if not self._current(generation):
+                app_transport.discard(connected)
+                return
+
+            if connected["conn"]:
+                logger.info(" connected after %s retries.", attempt)
+                self.on_connected(connected)
+                return
+
+            attempt += 1
+            delay = backoff(attempt)
+
+            logger.info(" retry %s in %.1f seconds.", attempt, delay)
+            self.on_retry(attempt, delay, connected)
+
+            # Wait, unless the run is abandoned in the meantime.
+            if wake.wait(delay):
+                return
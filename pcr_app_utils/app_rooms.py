@@ -0,0 +1,235 @@
+#!/bin/env python3
+# -*- mode: python; coding: utf-8 -*-
+
+# Script by Thomas Pirchmoser (tommy_software@mailfence.com) 2024
+
+# This script was created for personal/educational purposes only and is not to
+#   be used for commercial or profit purposes.
+
+'''
+app_rooms.py--module for "PrivateChatRoom-App" to keep the rooms of a
+               window apart.
+
+               Every room has its own scrollback (ring of message records),
+               search index, roster, members and unread counter. The members
+               are kept in alphabetical order and every change says where
+               in the member list to insert or delete an alias, so the list
+               shown is updated in place. Only the room shown
+               in the window renders into the chat display; the messages of
+               the other rooms are only recorded and counted until their tab
+               is selected.
+'''
+
+import argparse
+import bisect
+from pcr_app_utils import app_framing
+from pcr_app_utils import app_roster
+from pcr_app_utils.app_search import SearchIndex
+from pcr_app_utils.app_logging import app_log
+
+logger = app_log(__name__)
+
+# Edits of the member list returned by Room.apply_members().
+EDIT_INSERT = "insert"
+EDIT_DELETE = "delete"
+
+
+class Room():
+    ''' The messages and the state of one room. '''
+
+    def __init__(self, name, scrollback):
+        self.name = name
+        self.scrollback = scrollback
+        self.search_index = SearchIndex()
+
+        # Latest roster text, None until the server sent one.
+        self.roster = None
+
+        # Aliases of the members in alphabetical order, empty with servers
+        #   that only send the roster text.
+        self.members = []
+
+        # Messages received while the room was not shown.
+        self.unread = 0
+
+    def label(self):
+        ''' Return the text of the tab, with the unread messages. '''
+
+        return f"{self.name} ({self.unread})" if self.unread else self.name
+
+    def apply_members(self, changes):
+        '''
+        Apply changes of the members (app_roster.MemberChange), returns the
+        edits of the member list as (EDIT_INSERT/EDIT_DELETE, index, alias).
+        '''
+
+        edits = []
+
+        for change in changes:
+            if change.kind in (app_roster.LEAVE, app_roster.RENAME):
+                index = bisect.bisect_left(self.members, change.alias)
+                if index < len(self.members) and \
+                        self.members[index] == change.alias:
+                    del self.members[index]
+                    edits.append((EDIT_DELETE, index, change.alias))
+
+            if change.kind in (app_roster.JOIN, app_roster.RENAME):
+                alias = change.new or change.alias
+                index = bisect.bisect_left(self.members, alias)
+                if index == len(self.members) or \
+                        self.members[index] != alias:
+                    self.members.insert(index, alias)
+                    edits.append((EDIT_INSERT, index, alias))
+
+        return edits
+
+
+class Rooms():
+    '''
+    The rooms of a window, in the order they were opened. The first room
+    opened is shown until show() selects another one.
+
+        make_scrollback(name) -- returns the scrollback of a new room.
+    '''
+
+    def __init__(self, make_scrollback):
+        self.make_scrollback = make_scrollback
+        self.rooms = {}
+        self.visible = None
+
+    def __contains__(self, name):
+        return name in self.rooms
+
+    def __iter__(self):
+        return iter(self.rooms.values())
+
+    def get(self, name):
+        ''' Return a room, None if it is not open. '''
+
+        return self.rooms.get(name)
+
+    def current(self):
+        ''' Return the room that is shown. '''
+
+        return self.rooms[self.visible]
+
+    def open(self, name):
+        ''' Return a room, opening it first if needed. '''
+
+        room = self.rooms.get(name)
+
+        if room is None:
+            room = self.rooms[name] = Room(name, self.make_scrollback(name))
+            if self.visible is None:
+                self.visible = name
+
+            logger.debug(" room %s has been opened.", name)
+
+        return room
+
+    def close(self, name):
+        ''' Forget a room, the first one is shown if it was the visible. '''
+
+        self.rooms.pop(name, None)
+
+        if name == self.visible:
+            self.visible = None
+            if self.rooms:
+                self.show(next(iter(self.rooms)))
+
+    def add(self, name, text):
+        '''
+        Record a message of a room, returns (room, record) or (None, None)
+        if the room is not open. The record is only shown if the room is.
+        '''
+
+        room = self.rooms.get(name)
+        if room is None:
+            return None, None
+
+        shown = name == self.visible
+        record = room.scrollback.add(text, shown=shown)
+        room.search_index.add(record.seq, text)
+
+        if not shown:
+            room.unread += 1
+
+        return room, record
+
+    def show(self, name):
+        ''' Render a room into the widget instead of the one shown. '''
+
+        room = self.rooms[name]
+        room.unread = 0
+
+        if name != self.visible:
+            self.visible = name
+            room.scrollback.show()
+
+        return room
+
+
+def room_name(text):
+    ''' argparse type of a room name. '''
+
+    if not app_framing.valid_room(text):
+        raise argparse.ArgumentTypeError(f"invalid room name {text!r}")
+
+    return text
+
+
+def add_arguments(parser):
+    ''' Add the room option to an argparse parser. '''
+
+    parser.add_argument("--room", action="append", default=[],
+                        type=room_name, metavar="NAME", dest="rooms",
+                        help="also join this room (can be repeated)")
+
+
+if __name__ == "__main__":
+
+    class _Records():
+        ''' Scrollback without a widget. '''
+
+        def __init__(self):
+            self.shown = []
+            self.seq = 0
+
+        def add(self, text, shown=True):
+            ''' Count the message, keep it if shown. '''
+
+            self.seq += 1
+            if shown:
+                self.shown.append(text)
+            return type("Record", (), {"seq": self.seq})
+
+        def show(self):
+            ''' Nothing to render. '''
+
+    rooms = Rooms(lambda name: _Records())
+    rooms.open("main")
+    rooms.open("ops")
+
+    for number in range(10):
+        rooms.add("main", f"tommy: main {number}\n")
+        rooms.add("ops", f"tommy: ops {number}\n")
+
+    assert rooms.add("gone", "tommy: lost\n") == (None, None)
+    assert rooms.get("ops").label() == "ops (10)"
+    assert len(rooms.get("main").scrollback.shown) == 10
+    assert rooms.get("ops").search_index.search("ops 3")
+
+    # The member list is edited in place, in alphabetical order.
+    ops = rooms.get("ops")
+    ops.apply_members([app_roster.MemberChange(app_roster.JOIN, "tommy"),
+                       app_roster.MemberChange(app_roster.JOIN, "anna")])
+    edits = ops.apply_members([app_roster.MemberChange(app_roster.RENAME,
+                                                       "tommy", "bob")])
+    assert edits == [(EDIT_DELETE, 1, "tommy"), (EDIT_INSERT, 1, "bob")]
+    assert ops.members == ["anna", "bob"]
+
+    rooms.show("ops")
+    assert rooms.get("ops").label() == "ops" and rooms.visible == "ops"
+    rooms.close("ops")
+    assert rooms.visible == "main"
+    logger.info("[APP_ROOMS_TEST]: rooms work.")
@@ -0,0 +1,174 @@
+#!/bin/env python3
+# -*- mode: python; coding: utf-8 -*-
+
+# Script by Thomas Pirchmoser (tommy_software@mailfence.com) 2024
+
+# This script was created for personal/educational purposes only and is not to
+#   be used for commercial or profit purposes.
+
+'''
+app_roster.py--module for "PrivateChatRoom-App" with the members of a room.
+
+               Servers offering the "members" feature send the full list of
+               members once, when the client joins (a room), and from then
+               on only the changes:
+                   members frame -- the aliases, one per line.
+                   delta frame   -- one change per line: "+alias" joined,
+                                    "-alias" left, "~old<tab>new" renamed.
+               Aliases can not contain line breaks or tabs.
+
+               A Roster keeps the members in a set and turns both frames into
+               the list of changes they make, so the work done with them
+               depends on the number of changes, not on the size of the room.
+'''
+
+from collections import namedtuple
+from pcr_app_utils.app_logging import app_log
+
+logger = app_log(__name__)
+
+# Encoding of the payloads.
+FORMAT = "utf-8"
+
+# Kinds of changes.
+JOIN = "join"
+LEAVE = "leave"
+RENAME = "rename"
+
+# Prefix of each kind of change in a delta frame.
+PREFIXES = {JOIN: "+", LEAVE: "-", RENAME: "~"}
+KINDS = {prefix: kind for kind, prefix in PREFIXES.items()}
+
+# A change of the members, new is the new alias of a rename.
+MemberChange = namedtuple("MemberChange", ["kind", "alias", "new"],
+                          defaults=(None,))
+
+
+def count_text(count):
+    ''' Return the roster text of the servers without members. '''
+
+    return f"{count} online..."
+
+
+def encode_full(aliases):
+    ''' Return the payload of a members frame. '''
+
+    return "\n".join(aliases).encode(FORMAT)
+
+
+def parse_full(payload):
+    ''' Return the set of aliases of a members frame. '''
+
+    return {alias for alias in payload.decode(FORMAT, "replace").split("\n")
+            if alias}
+
+
+def encode_delta(changes):
+    ''' Return the payload of a delta frame. '''
+
+    lines = []
+
+    for change in changes:
+        line = PREFIXES[change.kind] + change.alias
+        if change.kind == RENAME:
+            line += "\t" + change.new
+        lines.append(line)
+
+    return "\n".join(lines).encode(FORMAT)
+
+
+def parse_delta(payload):
+    ''' Return the list of changes of a delta frame, unknown lines skipped. '''
+
+    changes = []
+
+    for line in payload.decode(FORMAT, "replace").split("\n"):
+        kind = KINDS.get(line[:1])
+        if kind is None or len(line) < 2:
+            continue
+
+        if kind == RENAME:
+            old, _, new = line[1:].partition("\t")
+            if old and new:
+                changes.append(MemberChange(RENAME, old, new))
+        else:
+            changes.append(MemberChange(kind, line[1:]))
+
+    return changes
+
+
+class Roster():
+    ''' The members of a room. '''
+
+    def __init__(self):
+        self.members = set()
+
+    def __len__(self):
+        return len(self.members)
+
+    def __contains__(self, alias):
+        return alias in self.members
+
+    def replace(self, aliases):
+        '''
+        Take a full list of members, returns the changes it makes (e.g.
+        after a reconnect only the users that came or went meanwhile).
+        '''
+
+        aliases = set(aliases)
+        changes = [MemberChange(LEAVE, alias)
+                   for alias in sorted(self.members - aliases)]
+        changes += [MemberChange(JOIN, alias)
+                    for alias in sorted(aliases - self.members)]
+
+        self.members = aliases
+
+        return changes
+
+    def apply(self, changes):
+        '''
+        Take a list of changes, returns those that changed something
+        (a join of a member or a leave of a stranger are dropped).
+        '''
+
+        applied = []
+
+        for change in changes:
+            if change.kind == JOIN:
+                if change.alias in self.members:
+                    continue
+                self.members.add(change.alias)
+
+            elif change.kind == LEAVE:
+                if change.alias not in self.members:
+                    continue
+                self.members.discard(change.alias)
+
+            elif change.kind == RENAME:
+                if change.alias not in self.members or \
+                        change.new in self.members:
+                    continue
+                self.members.discard(change.alias)
+                self.members.add(change.new)
+
+            applied.append(change)
+
+        return applied
+
+
+if __name__ == "__main__":
+    roster = Roster()
+    first = roster.replace(parse_full(encode_full(["tommy", "anna", "bob"])))
+    assert [change.alias for change in first] == ["anna", "bob", "tommy"]
+
+    delta = encode_delta([MemberChange(JOIN, "eve"),
+                          MemberChange(LEAVE, "bob"),
+                          MemberChange(RENAME, "anna", "anne"),
+                          MemberChange(JOIN, "tommy")])
+    applied = roster.apply(parse_delta(delta))
+    assert len(applied) == 3 and roster.members == {"tommy", "anne", "eve"}
+
+    # A reconnect only reports what changed meanwhile.
+    again = roster.replace({"tommy", "anne", "eve", "zoe"})
+    assert again == [MemberChange(JOIN, "zoe")]
+    logger.info("[APP_ROSTER_TEST]: %s members.", len(roster))
@@ -0,0 +1,315 @@
+#!/bin/env python3
+# -*- mode: python; coding: utf-8 -*-
+
+# Script by Thomas Pirchmoser (tommy_software@mailfence.com) 2024
+
+# This script was created for personal/educational purposes only and is not to
+#   be used for commercial or profit purposes.
+
+'''
+app_scrollback.py--module for "PrivateChatRoom-App" to limit the number of
+               lines kept in the chat display.
+
+               Every message is stored as a small record in a ring buffer.
+               Once the text widget holds too many lines, the oldest ones are
+               deleted in one batch. Lines deleted from the widget can be
+               shown again from the ring buffer on request, or whenever the
+               user scrolls to the top (load_on_scroll).
+
+               With a history (app_history.HistoryPager), the messages of
+               earlier sessions are read a page at a time once the ring
+               buffer has nothing older.
+
+               Several scrollbacks (one per room) can share a widget, the
+               one that is shown renders into it (show), the others only
+               keep their records.
+'''
+
+import time
+from collections import deque, namedtuple
+from pcr_app_utils.app_logging import app_log
+
+logger = app_log(__name__)
+
+# Number of lines kept in the text widget.
+MAX_LINES = 2000
+
+# Number of lines above MAX_LINES before the widget is trimmed.
+TRIM_BATCH = 200
+
+# Number of messages kept in memory.
+RING_SIZE = 20000
+
+# Number of lines shown again per 'load older' request.
+PAGE_LINES = 200
+
+# A message in the scrollback.
+Record = namedtuple("Record", ["seq", "time", "text"])
+
+
+def line_count(text):
+    ''' Return the number of lines a text takes up in the widget. '''
+
+    return text.count("\n")
+
+
+class Scrollback():
+    ''' Ring buffer of messages backing a (disabled) Tk text widget. '''
+
+    def __init__(self, widget, max_lines=MAX_LINES, ring_size=RING_SIZE,
+                 trim_batch=TRIM_BATCH, history=None):
+        self.widget = widget
+        self.max_lines = max_lines
+        self.trim_batch = trim_batch
+        self.history = history
+        self.ring = deque(maxlen=ring_size)
+        self._next_seq = 0
+
+        # Messages currently in the widget, oldest first: (seq, lines, key).
+        #   Messages from the history have no seq but their history key.
+        self._shown = deque()
+
+        # True once the history has nothing older than the shown messages.
+        self._history_done = False
+
+        # True while a page is loaded because the user scrolled to the top.
+        self._loading = False
+
+        # Lines in the widget that do not belong to a message
+        #   (e.g. the connection status).
+        self._preamble = self.widget_lines()
+
+    def widget_lines(self):
+        ''' Return the number of complete lines in the widget. '''
+
+        return int(self.widget.index("end-1c").split(".")[0]) - 1
+
+    def add(self, text, shown=True):
+        '''
+        Store a message, shown tells whether it is being written to the
+        widget as well.
+        '''
+
+        record = Record(self._next_seq, time.time(), text)
+        self._next_seq += 1
+
+        self.ring.append(record)
+        if shown:
+            self._shown.append((record.seq, line_count(text), None))
+
+        return record
+
+    def show(self, max_lines=PAGE_LINES):
+        '''
+        Replace the content of the widget with the newest page of this
+        scrollback, when the widget switches to it.
+        '''
+
+        self._shown.clear()
+        self._preamble = 0
+        self._history_done = False
+
+        self.widget.config(state="normal")
+        self.widget.delete("1.0", "end")
+        self.widget.config(state="disabled")
+
+        self.load_older(max_lines)
+        self.widget.yview("end")
+
+        # Older pages are now loaded from this scrollback.
+        self.load_on_scroll()
+
+    def at_bottom(self):
+        ''' True if the widget is scrolled down to the newest message. '''
+
+        return self.widget.yview()[1] >= 1.0
+
+    def trim(self):
+        '''
+        Delete the oldest lines from the widget once it holds more than
+        max_lines + trim_batch lines. Nothing is deleted while the user
+        scrolls through older messages.
+        '''
+
+        lines = self.widget_lines()
+
+        if lines <= self.max_lines + self.trim_batch or not self.at_bottom():
+            return
+
+        excess = lines - self.max_lines
+        cut = min(self._preamble, excess)
+        self._preamble -= cut
+
+        # Only remove whole messages.
+        while self._shown and cut + self._shown[0][1] <= excess:
+            cut += self._shown.popleft()[1]
+
+        if not cut:
+            return
+
+        # The history may have messages between the shown ones again.
+        self._history_done = False
+
+        self.widget.config(state="normal")
+        self.widget.delete("1.0", f"{cut + 1}.0")
+        self.widget.config(state="disabled")
+
+        logger.debug(" %s lines trimmed from the chat display.", cut)
+
+    def older(self, max_lines=PAGE_LINES):
+        ''' Return the records that precede the oldest shown message. '''
+
+        if not self.ring:
+            return []
+
+        first = self._shown[0][0] if self._shown else self._next_seq
+
+        # Older than everything in the ring.
+        if first is None:
+            return []
+
+        end = max(0, first - self.ring[0].seq)
+
+        records = []
+        lines = 0
+
+        # Walk back through the ring until the page is full.
+        for index in range(end - 1, -1, -1):
+            record = self.ring[index]
+            records.append(record)
+            lines += line_count(record.text)
+
+            if lines >= max_lines:
+                break
+
+        records.reverse()
+        return records
+
+    def record(self, seq):
+        ''' Return the record of a message, None if it left the ring. '''
+
+        if not self.ring or not self.ring[0].seq <= seq <= self.ring[-1].seq:
+            return None
+
+        return self.ring[seq - self.ring[0].seq]
+
+    def lines_of(self, seq):
+        '''
+        Return (first line, number of lines) of a message in the widget,
+        None if it is not shown.
+        '''
+
+        line = 1 + self._preamble
+
+        for shown_seq, lines, _ in self._shown:
+            if shown_seq == seq:
+                return line, lines
+            line += lines
+
+        return None
+
+    def reveal(self, seq):
+        '''
+        Return (first line, number of lines) of a message, showing it again
+        (and the ones after it) if it has been trimmed. None if it is no
+        longer in the ring.
+        '''
+
+        position = self.lines_of(seq)
+
+        if position is None and self.record(seq) is not None and \
+                self._shown and self._shown[0][0] is not None:
+            # All lines from the message up to the oldest shown one.
+            lines = sum(line_count(self.ring[index].text) for index in
+                        range(seq - self.ring[0].seq,
+                              self._shown[0][0] - self.ring[0].seq))
+            self.load_older(max_lines=lines, keep_position=True)
+            position = self.lines_of(seq)
+
+        return position
+
+    def older_history(self, max_lines=PAGE_LINES):
+        '''
+        Return (key, text) of the history messages that precede the oldest
+        shown message, oldest first.
+        '''
+
+        if self.history is None or self._history_done:
+            return []
+
+        # Key of the oldest shown history message, None for the newest
+        #   messages of the earlier sessions.
+        before = self._shown[0][2] if self._shown else None
+        rows = self.history.older(before, max_lines)
+
+        if not rows:
+            self._history_done = True
+
+        return rows
+
+    def load_older(self, max_lines=PAGE_LINES, keep_position=False):
+        '''
+        Show a page of messages that have been trimmed from the widget
+        again, from the history once the ring has none. Returns the number
+        of messages restored. With keep_position the view stays on the
+        line that was at the top, otherwise it goes to the first one.
+        '''
+
+        entries = [(record.seq, record.text, None)
+                   for record in self.older(max_lines)]
+
+        if not entries:
+            entries = [(None, text, key)
+                       for key, text in self.older_history(max_lines)]
+
+        if not entries:
+            return 0
+
+        # Lines without a message are no longer at the top, trim them
+        #   like a message.
+        if self._preamble:
+            self._shown.appendleft((None, self._preamble, None))
+            self._preamble = 0
+
+        self.widget.config(state="normal")
+        self.widget.insert("1.0", "".join(text for _, text, _ in entries))
+        self.widget.config(state="disabled")
+
+        # The restored messages are shown again, before the others.
+        self._shown.extendleft((seq, line_count(text), key)
+                               for seq, text, key in reversed(entries))
+
+        if keep_position:
+            lines = sum(line_count(text) for _, text, _ in entries)
+            self.widget.yview(f"{lines + 1}.0")
+        else:
+            self.widget.yview("1.0")
+
+        logger.debug(" %s older messages restored.", len(entries))
+
+        return len(entries)
+
+    def load_on_scroll(self):
+        '''
+        Load the next older page whenever the user scrolls to the top of the
+        widget, which must be a ScrolledText.
+        '''
+
+        scrollbar_set = self.widget.vbar.set
+
+        def scrolled(first, last):
+            scrollbar_set(first, last)
+
+            # At the top of a widget that is fuller than the view.
+            if float(first) <= 0.0 and float(last) < 1.0 and \
+                    not self._loading:
+                self._loading = True
+                self.widget.after_idle(self._load_at_top)
+
+        self.widget.config(yscrollcommand=scrolled)
+
+    def _load_at_top(self):
+        try:
+            self.load_older(keep_position=True)
+        finally:
+            self._loading = False
@@ -0,0 +1,191 @@
+#!/bin/env python3
+# -*- mode: python; coding: utf-8 -*-
+
+# Script by Thomas Pirchmoser (tommy_software@mailfence.com) 2024
+
+# This script was created for personal/educational purposes only and is not to
+#   be used for commercial or profit purposes.
+
+'''
+app_search.py--module for "PrivateChatRoom-App" to find messages of the
+               running session.
+
+               Every message is added to an inverted index (word -> the
+               sequence numbers of the messages containing it) as it
+               arrives, so a search only looks at the messages that match
+               instead of the whole chat display.
+
+               Query syntax:
+                   hello world   -- messages with both words
+                   hel*          -- words starting with "hel"
+                   from:tommy    -- messages written by tommy
+'''
+
+import re
+from bisect import bisect_left, insort
+from pcr_app_utils.app_logging import app_log
+
+logger = app_log(__name__)
+
+# Number of messages kept in the index, the newest ones.
+INDEX_SIZE = 20000
+
+# Most results returned by a search.
+MAX_RESULTS = 200
+
+# What counts as a word.
+WORD = re.compile(r"\w+")
+
+
+def sender_of(text):
+    ''' Return the alias of a chat message ("alias: msg"), None if none. '''
+
+    first_line = text.split("\n", 1)[0]
+
+    # Notices of the app and the server are indented or have no alias.
+    if ": " not in first_line or first_line[:1].isspace():
+        return None
+
+    return first_line.split(": ", 1)[0]
+
+
+def parse_query(query):
+    ''' Return (words, prefixes, sender) of a query. '''
+
+    words = []
+    prefixes = []
+    sender = None
+
+    for part in query.split():
+        if part.lower().startswith("from:"):
+            sender = part[5:].lower() or None
+            continue
+
+        terms = WORD.findall(part.lower())
+        if not terms:
+            continue
+
+        # Only the last word of "foo-bar*" is a prefix.
+        if part.endswith("*"):
+            prefixes.append(terms.pop())
+        words.extend(terms)
+
+    return words, prefixes, sender
+
+
+class SearchIndex():
+    ''' Inverted index over the words and senders of the messages. '''
+
+    def __init__(self, size=INDEX_SIZE):
+        self.size = size
+
+        # Word -> sequence numbers of the messages, in ascending order.
+        self.postings = {}
+
+        # Sender (lower case) -> sequence numbers of the messages.
+        self.senders = {}
+
+        # All indexed words, sorted for the prefix lookups.
+        self.vocabulary = []
+
+        # Oldest sequence number still in the index.
+        self.first = 0
+
+        # Value of first at the last compaction.
+        self._compacted = 0
+
+    def add(self, seq, text):
+        ''' Index a message, seq must be larger than that of the previous. '''
+
+        sender = sender_of(text)
+        body = text.split(": ", 1)[1] if sender is not None else text
+
+        for word in set(WORD.findall(body.lower())):
+            seqs = self.postings.get(word)
+            if seqs is None:
+                seqs = self.postings[word] = []
+                insort(self.vocabulary, word)
+            seqs.append(seq)
+
+        if sender is not None:
+            self.senders.setdefault(sender.lower(), []).append(seq)
+
+        self.first = max(self.first, seq - self.size + 1)
+
+        # Drop the forgotten messages once they make up half the index.
+        if self.first - self._compacted >= self.size // 2:
+            self.compact()
+
+    def compact(self):
+        ''' Remove the messages older than first from the postings. '''
+
+        for table in (self.postings, self.senders):
+            for key in list(table):
+                seqs = table[key]
+                del seqs[:bisect_left(seqs, self.first)]
+                if not seqs:
+                    del table[key]
+
+        self.vocabulary = sorted(self.postings)
+        self._compacted = self.first
+
+    def _matching(self, word, prefix):
+        ''' Return the set of messages with the word, or a word it starts. '''
+
+        if not prefix:
+            return set(self.postings.get(word, ()))
+
+        found = set()
+        index = bisect_left(self.vocabulary, word)
+
+        while index < len(self.vocabulary) and \
+                self.vocabulary[index].startswith(word):
+            found.update(self.postings[self.vocabulary[index]])
+            index += 1
+
+        return found
+
+    def search(self, query, limit=MAX_RESULTS):
+        ''' Return the sequence numbers of the matches, newest first. '''
+
+        words, prefixes, sender = parse_query(query)
+
+        if not words and not prefixes and sender is None:
+            return []
+
+        # Start with the rarest term, every other one can only shrink it.
+        candidates = [self._matching(word, False) for word in words]
+        candidates += [self._matching(prefix, True) for prefix in prefixes]
+        if sender is not None:
+            candidates.append(set(self.senders.get(sender, ())))
+        candidates.sort(key=len)
+
+        found = candidates[0]
+        for other in candidates[1:]:
+            if not found:
+                break
+            found &= other
+
+        return sorted((seq for seq in found if seq >= self.first),
+                      reverse=True)[:limit]
+
+
+if __name__ == "__main__":
+    import time
+
+    index = SearchIndex()
+    for number in range(50000):
+        index.add(number, f"user{number % 7}: message number {number} "
+                          f"about topic{number % 100}\n")
+    index.add(50000, "\t\ttommy has joined the chat\n")
+
+    start = time.perf_counter()
+    result = index.search("topic4* from:user3")
+    took = (time.perf_counter() - start) * 1000
+
+    assert result and all(number % 7 == 3 for number in result)
+    assert index.search("tommy") == [50000]
+    assert index.search("number 49999") == [49999]
+    assert index.search("number 10") == []
+    logger.info("[APP_SEARCH_TEST]: %s results in %.1f ms.", len(result),
+                took)
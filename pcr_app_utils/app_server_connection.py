@@ -10,42 +10,217 @@
 app_server_connection.py--a module to connect 'PrivateChatroom' to the
                'PrivateChatRoom-Server'.
                It also provides functions to alter the IPv4 address
-               and port to be used.
+               and port to be used, and to find the fastest of several
+               servers.
 '''
 
-from tkinter import simpledialog
+import ipaddress
+import queue
 import socket
-from pcr_app_utils.app_dialogs import dialog
+import threading
+import time
+from pcr_app_utils import app_config
+from pcr_app_utils import app_tls
 from pcr_app_utils.app_logging import app_log
 
 logger = app_log(__name__)
 
+# Seconds to wait for the connection to be established.
+CONNECT_TIMEOUT = 2
 
-def connect_to_server(host, port):
-    ''' Function to connect to the server. '''
+# Seconds before the next address is tried while earlier attempts are
+#   still running (happy eyeballs, RFC 8305).
+ATTEMPT_DELAY = 0.25
+
+# TCP keepalive: seconds of silence before the first probe, seconds
+#   between the probes and unanswered probes until the os drops the
+#   connection (about 11 seconds instead of the 2 hours default).
+KEEPALIVE_IDLE = 5
+KEEPALIVE_INTERVAL = 2
+KEEPALIVE_COUNT = 3
+
+# Milliseconds sent data may stay unacknowledged before the os drops the
+#   connection (Linux only).
+USER_TIMEOUT = 10000
+
+
+def interleave(infos):
+    ''' Order the addresses alternating between IPv6 and IPv4. '''
+
+    ipv6 = [info for info in infos if info[0] == socket.AF_INET6]
+    other = [info for info in infos if info[0] != socket.AF_INET6]
+
+    ordered = []
+    for index in range(max(len(ipv6), len(other))):
+        ordered.extend(ipv6[index:index + 1])
+        ordered.extend(other[index:index + 1])
+
+    return ordered
 
-    try:
-        # Creating socket.
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+
+def open_connection(host, port, timeout=CONNECT_TIMEOUT,
+                    delay=ATTEMPT_DELAY):
+    '''
+    Connect to every address the host name resolves to, starting a new
+    attempt every 'delay' seconds while the earlier ones are still running.
+    Returns the first socket that connects, the others are closed.
+    '''
+
+    infos = interleave(socket.getaddrinfo(host, port,
+                                          type=socket.SOCK_STREAM))
+    results = queue.SimpleQueue()
+    lock = threading.Lock()
+    state = {"winner": None}
+
+    def attempt(info):
+        family, sock_type, proto, _, address = info
+        sock = socket.socket(family, sock_type, proto)
 
         # Set a time limit for the connection to establish.
-        sock.settimeout(2)
+        sock.settimeout(timeout)
+
+        try:
+            sock.connect(address)
+        except OSError as error:
+            sock.close()
+            results.put(error)
+            return
+
+        with lock:
+            won = state["winner"] is None
+            if won:
+                state["winner"] = sock
+
+        # Another address was faster.
+        if not won:
+            sock.close()
+
+        results.put(None)
+
+    errors = []
+    deadline = time.monotonic() + timeout
+
+    for started, info in enumerate(infos, start=1):
+        threading.Thread(target=attempt, args=(info,), daemon=True).start()
+
+        # Give this attempt a head start before starting the next one.
+        wait_until = time.monotonic() + delay
+        while len(errors) < started and state["winner"] is None:
+            remaining = wait_until - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                error = results.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if error is not None:
+                errors.append(error)
+
+        if state["winner"] is not None:
+            break
+
+    # Wait for the attempts still running.
+    while state["winner"] is None and len(errors) < len(infos):
+        remaining = deadline + delay * len(infos) - time.monotonic()
+        if remaining <= 0:
+            errors.append(TimeoutError("timed out"))
+            break
+        try:
+            error = results.get(timeout=remaining)
+        except queue.Empty:
+            continue
+        if error is not None:
+            errors.append(error)
+
+    with lock:
+        # Attempts finishing from now on close their socket.
+        winner = state["winner"]
+        state["winner"] = winner or False
+
+    if winner:
+        return winner
+
+    # A refused connection means the network works but the server is down.
+    for error in errors:
+        if isinstance(error, ConnectionRefusedError):
+            raise error
+
+    raise errors[-1] if errors else OSError(f"no address for {host}")
+
+
+def tune_keepalive(sock, idle=KEEPALIVE_IDLE, interval=KEEPALIVE_INTERVAL,
+                   count=KEEPALIVE_COUNT, user_timeout=USER_TIMEOUT):
+    '''
+    Turn on TCP keepalive with short timings, so the os notices a dead
+    server or a dropped NAT mapping within seconds. Options the platform
+    does not have are skipped.
+    '''
+
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+    # Linux, and macOS (TCP_KEEPALIVE is its name for the idle time).
+    options = ((getattr(socket, "TCP_KEEPIDLE",
+                        getattr(socket, "TCP_KEEPALIVE", None)), idle),
+               (getattr(socket, "TCP_KEEPINTVL", None), interval),
+               (getattr(socket, "TCP_KEEPCNT", None), count),
+               (getattr(socket, "TCP_USER_TIMEOUT", None), user_timeout))
+
+    for option, value in options:
+        if option is None:
+            continue
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, option, value)
+        except OSError as error:
+            logger.debug(" keepalive option %s not set: %s", option, error)
 
+    # Windows sets the timings (in milliseconds) with an ioctl.
+    if hasattr(socket, "SIO_KEEPALIVE_VALS"):
+        sock.ioctl(socket.SIO_KEEPALIVE_VALS,
+                   (1, idle * 1000, interval * 1000))
+
+
+def connect_to_server(host, port):
+    ''' Function to connect to the server. '''
+
+    try:
         # Connecting to the server and log attempt.
         logger.info(" trying to connect to the server...")
-        sock.connect((host, port))
+        sock = open_connection(host, port)
+
+        # Without a time limit, only keepalive detects a silent server.
+        tune_keepalive(sock)
+
+        # Encrypt the connection if the server profile asks for it.
+        tls = app_tls.settings_for(host, port)
+        if tls is not None:
+            try:
+                sock = app_tls.wrap(sock, host, port, tls)
+
+            except OSError as error:
+                # The server does not speak TLS, its certificate is not
+                #   trusted or it did not finish the handshake (timed out,
+                #   closed), it has been reached though.
+                logger.warning(" could not connect to the server!")
+                logger.error(" TLS with the server failed: %s", error)
+                return {"conn": False,
+                        "sock": None,
+                        "host": host,
+                        "port": port,
+                        "inet": True}
 
         # When connectionn is established, cancel time limit.
         sock.settimeout(None)
 
         # Log successfull connection.
-        logger.info(" connected to %s:%s", host, port)
+        logger.info(" connected to %s:%s (%s)", host, port,
+                    sock.getpeername()[0])
 
         return {"conn": True,
                 "sock": sock,
                 "host": host,
                 "port": port,
-                "inet": True}
+                "inet": True,
+                "tls": tls is not None}
 
     except ConnectionRefusedError:
         # Error message if server is not running.
@@ -60,7 +235,6 @@ def connect_to_server(host, port):
 
     except OSError:
         # Error message if there is no internet connection.
-        host, port = get_ip_port()
         logger.warning(" could not connect to the server!")
         error_msg = "are you connected to the internet?"
         logger.error(" %s", error_msg)
@@ -71,83 +245,137 @@ def connect_to_server(host, port):
                 "inet": False}
 
 
-def get_ip_port():
+def probe(host, port, timeout=CONNECT_TIMEOUT):
     '''
-    Function that returns the IPv4 address and the port.
-    If the .pcr_ip_port.txt does not exist, a new file is created
-      with default values.
+    Return the seconds it takes to connect to the server, None if it does
+    not answer. The connection is closed right away.
     '''
 
+    started = time.perf_counter()
+
+    try:
+        sock = open_connection(host, port, timeout)
+    except OSError:
+        return None
+
+    latency = time.perf_counter() - started
+    sock.close()
+
+    return latency
+
+
+def rank_servers(servers, timeout=CONNECT_TIMEOUT):
+    '''
+    Probe all (host, port) servers at the same time and return the ones
+    that answered, fastest first.
+    '''
+
+    results = {}
+
+    def attempt(server):
+        results[server] = probe(*server, timeout=timeout)
+
+    probe_threads = [threading.Thread(target=attempt, args=(server,),
+                                      daemon=True)
+                     for server in servers]
+    for probe_thread in probe_threads:
+        probe_thread.start()
+    for probe_thread in probe_threads:
+        probe_thread.join(timeout + 1)
+
+    # Servers with the same latency keep the order of the profiles.
+    ranked = sorted((server for server in servers
+                     if results.get(server) is not None),
+                    key=lambda server: results[server])
+
+    for host, port in ranked:
+        logger.debug(" %s:%s answered in %.1f ms.", host, port,
+                     results[(host, port)] * 1000)
+
+    return ranked
+
+
+def valid_host(host):
+    ''' True if host is an ip address (v4 or v6) or a valid host name. '''
+
     try:
-        with open(".pcr_ip_port.txt", "r", encoding="utf-8") as infile:
-            for line in infile:
-                values = line.split(",")
-                ip_addr = values[0]
-                port = values[1]
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        pass
 
-                return ip_addr, port
+    labels = host.rstrip(".").split(".")
 
-    except FileNotFoundError:
-        with open(".pcr_ip_port.txt", "w", encoding="utf-8") as outfile:
-            ip_addr = "127.0.0.1"
-            port = 5050
-            values = f"{ip_addr},{port}"
+    # A host name consists of letters, digits and hyphens between dots.
+    return len(host) <= 253 and all(
+        label and len(label) <= 63 and not label.startswith("-")
+        and not label.endswith("-")
+        and all(char.isalnum() or char == "-" for char in label)
+        for label in labels) and not labels[-1].isdigit()
 
-            outfile.write(values)
 
-            return ip_addr, port
+def get_ip_port():
+    '''
+    Function that returns the address (str) and the port (int) of the
+    active server profile (see app_config).
+    '''
+
+    profile = app_config.get_store().active()
+
+    return profile.host, profile.port
+
+
+def get_servers():
+    ''' Return (host, port) of every server profile, the active one first. '''
+
+    return [(profile.host, profile.port)
+            for profile in app_config.get_store().profiles()]
 
 
 def set_ip():
     ''' Methode to create a window to set the ipv4_address. '''
 
-    msg_win = dialog()
+    # Only the GUI asks, the other users of the module never load tkinter.
+    # pylint: disable-next=import-outside-toplevel
+    from pcr_app_utils import app_dialogs
 
-    win_text = "\tPlease enter the ipv4 address\t\t"
+    win_text = "\tPlease enter the ip address or host name\t\t"
 
     while True:
         # Getting user's name
-        ipv4 = simpledialog.askstring("PrivateChatRoom",
-                                      win_text,
-                                      parent=msg_win)
+        ipv4 = app_dialogs.ask_string("PrivateChatRoom", win_text)
 
         # If the user canceled or closed the window, return the previous ip.
         if ipv4 is None:
             return get_ip_port()
 
-        try:
-            # Verify that the ip entered is a valid ipv4 address.
-            if socket.inet_aton(ipv4):
-                break
-        except OSError:
-            win_text = "\tPlease enter a valid ipv4 address\t\t"
+        # Verify that the address entered is an ip address or host name.
+        ipv4 = ipv4.strip()
+        if valid_host(ipv4):
+            break
+
+        win_text = "\tPlease enter a valid ip address or host name\t\t"
 
-    with open(".pcr_ip_port.txt", "r", encoding="utf-8") as infile:
-        for line in infile:
-            values = line.split(",")
-            port = values[1]
+    # Change the active profile and save it.
+    store = app_config.get_store()
+    profile = store.set_profile(store.active().name, host=ipv4)
 
-    with open(".pcr_ip_port.txt", "w", encoding="utf-8") as outfile:
-        ip_addr = ipv4
-        values = f"{ip_addr},{port}"
-        outfile.write(values)
-        logger.info(" ipv4 address has been changed to %s",
-                    ip_addr)
+    logger.info(" ipv4 address has been changed to %s",
+                profile.host)
 
-    return ip_addr, port
+    return profile.host, profile.port
 
 
 def set_port():
     ''' Methode to create a window to set the port number. '''
 
-    msg_win = dialog()
+    # pylint: disable-next=import-outside-toplevel
+    from pcr_app_utils import app_dialogs
 
     win_text = "\tPlease enter the port number\t\t"
 
     while True:
-        port = simpledialog.askstring("PrivateChatRoom",
-                                      win_text,
-                                      parent=msg_win)
+        port = app_dialogs.ask_string("PrivateChatRoom", win_text)
 
         # If the user canceled or closed the window, return the previous port.
         if port is None:
@@ -159,23 +387,19 @@ def set_port():
             continue
 
         # If the user entered a port that is too high, let them know.
-        if int(port) > 65535:
+        if not 0 < int(port) <= 65535:
             win_text = "Max port number is 65535\t\t"
         else:
             break
 
-    with open(".pcr_ip_port.txt", "r", encoding="utf-8") as infile:
-        for line in infile:
-            values = line.split(",")
-            ip_addr = values[0]
+    # Change the active profile and save it.
+    store = app_config.get_store()
+    profile = store.set_profile(store.active().name, port=int(port))
 
-    with open(".pcr_ip_port.txt", "w", encoding="utf-8") as outfile:
-        values = f"{ip_addr},{port}"
-        outfile.write(values)
-        logger.info(" port number has been changed to %s.",
-                    port)
+    logger.info(" port number has been changed to %s.",
+                profile.port)
 
-    return ip_addr, port
+    return profile.host, profile.port
 
 
 def main():
@@ -183,7 +407,7 @@ def main():
 
     ip_addr, port = get_ip_port()
     logger.info("[TEST]: ip-address: %s and port: %s", ip_addr, port)
-    connection = connect_to_server(ip_addr, int(port))
+    connection = connect_to_server(ip_addr, port)
     logger.info("[TEST]: testing socket %s", connection)
 
 
@@ -0,0 +1,182 @@
+#!/bin/env python3
+# -*- mode: python; coding: utf-8 -*-
+
+# Script by Thomas Pirchmoser (tommy_software@mailfence.com) 2024
+
+# This script was created for personal/educational purposes only and is not to
+#   be used for commercial or profit purposes.
+
+'''
+app_tls.py--module for "PrivateChatRoom-App" to encrypt the connection to the
+               'PrivateChatRoom-Server' with TLS (optional).
+
+               TLS is turned on per server profile (see app_config: tls NAME)
+               or for all servers with PCR_TLS=1. The certificate of the
+               server is checked against the system CAs, a CA file, or
+               pinned to the sha256 fingerprint of the certificate itself.
+
+               The TLS session of every server is kept, so a reconnect
+               resumes it instead of a full handshake. Resumption needs the
+               threaded engine, asyncio does not take a session.
+'''
+
+import hashlib
+import os
+import ssl
+import threading
+from pcr_app_utils import app_config
+from pcr_app_utils.app_logging import app_log
+
+logger = app_log(__name__)
+
+# TLS for all servers, unless their profile says otherwise.
+TLS = os.environ.get("PCR_TLS", "0") != "0"
+
+# CA file and certificate fingerprint used with PCR_TLS=1.
+TLS_CA = os.environ.get("PCR_TLS_CA") or None
+TLS_PIN = os.environ.get("PCR_TLS_PIN") or None
+
+# Seconds to wait for the TLS handshake.
+HANDSHAKE_TIMEOUT = 5
+
+# Contexts by (ca, pin) and sessions by (host, port), a session can only be
+#   resumed with the context that made it.
+_CACHE = {"contexts": {}, "sessions": {}}
+_LOCK = threading.Lock()
+
+
+def fingerprint(der):
+    ''' Return the sha256 fingerprint of a certificate (DER) as hex. '''
+
+    return hashlib.sha256(der).hexdigest()
+
+
+def normalize_pin(pin):
+    ''' Return a fingerprint without colons, in lower case. '''
+
+    return pin.replace(":", "").strip().lower() if pin else None
+
+
+def settings_for(host, port):
+    '''
+    Return the TLS settings ({"ca": path, "pin": fingerprint}) for a
+    server, None for a plain connection.
+    '''
+
+    settings = app_config.get_store().tls(host, port)
+
+    if settings is None and TLS:
+        settings = {"ca": TLS_CA, "pin": TLS_PIN}
+
+    return settings
+
+
+def context(settings):
+    ''' Return the (cached) client context for the settings. '''
+
+    key = (settings.get("ca"), normalize_pin(settings.get("pin")))
+
+    with _LOCK:
+        ctx = _CACHE["contexts"].get(key)
+        if ctx is not None:
+            return ctx
+
+        if key[1]:
+            # Pinned: the certificate is compared after the handshake.
+            ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+            ctx.check_hostname = False
+            ctx.verify_mode = ssl.CERT_NONE
+        else:
+            ctx = ssl.create_default_context(cafile=key[0])
+
+        ctx.minimum_version = ssl.TLSVersion.TLSv1_2
+        _CACHE["contexts"][key] = ctx
+
+    return ctx
+
+
+def check_pin(settings, der):
+    ''' Raise ssl.SSLError if the certificate is not the pinned one. '''
+
+    pin = normalize_pin(settings.get("pin"))
+
+    if pin and (der is None or fingerprint(der) != pin):
+        raise ssl.SSLError("the certificate of the server does not match "
+                           "the pinned fingerprint")
+
+
+def remember(host, port, tls_sock):
+    '''
+    Keep the session of a connection for the next connect. TLS 1.3 sends
+    the ticket after the handshake, call this again once data arrived.
+    '''
+
+    session = tls_sock.session
+
+    if session is not None and session.has_ticket:
+        with _LOCK:
+            _CACHE["sessions"][(host, port)] = session
+
+
+def forget(host, port):
+    ''' Drop the session of a server, the next connect is a full one. '''
+
+    with _LOCK:
+        _CACHE["sessions"].pop((host, port), None)
+
+
+def wrap(sock, host, port, settings):
+    '''
+    Run the TLS handshake on a connected socket, resuming the session of
+    the server if there is one. Returns the TLS socket, raises
+    ssl.SSLError (an OSError) if the server can not be trusted.
+    '''
+
+    with _LOCK:
+        session = _CACHE["sessions"].get((host, port))
+
+    tls_sock = context(settings).wrap_socket(sock,
+                                             server_hostname=host,
+                                             session=session,
+                                             do_handshake_on_connect=False)
+
+    try:
+        tls_sock.settimeout(HANDSHAKE_TIMEOUT)
+        tls_sock.do_handshake()
+        check_pin(settings, tls_sock.getpeercert(binary_form=True))
+
+    except (OSError, ValueError):
+        tls_sock.close()
+        forget(host, port)
+        raise
+
+    logger.info(" %s with %s:%s (%s).", tls_sock.version(), host, port,
+                "resumed" if tls_sock.session_reused else "full handshake")
+
+    remember(host, port, tls_sock)
+
+    return tls_sock
+
+
+if __name__ == "__main__":
+    # Runs two handshakes against a TLS stand-in, the second one resumed.
+    import argparse
+    import socket
+
+    PARSER = argparse.ArgumentParser(
+                description="handshake with a TLS server, twice")
+    PARSER.add_argument("host")
+    PARSER.add_argument("port", type=int)
+    PARSER.add_argument("pin", nargs="?", default=None,
+                        help="sha256 fingerprint of the certificate")
+    ARGS = PARSER.parse_args()
+
+    SETTINGS = {"ca": None, "pin": ARGS.pin}
+
+    for _ in range(2):
+        with socket.create_connection((ARGS.host, ARGS.port)) as raw:
+            with wrap(raw, ARGS.host, ARGS.port, SETTINGS) as conn:
+                conn.recv(1024)
+                remember(ARGS.host, ARGS.port, conn)
+                logger.info("[APP_TLS_TEST]: %s resumed: %s", conn.version(),
+                            conn.session_reused)
@@ -0,0 +1,382 @@
+#!/bin/env python3
+# -*- mode: python; coding: utf-8 -*-
+
+# Script by Thomas Pirchmoser (tommy_software@mailfence.com) 2024
+
+# This script was created for personal/educational purposes only and is not to
+#   be used for commercial or profit purposes.
+
+'''
+app_transport.py--module for "PrivateChatRoom-App" to move the data between
+               the app and the 'PrivateChatRoom-Server'.
+
+               Three engines are available:
+                   threaded -- a blocking socket with its own receive and
+                               writer threads.
+                   asyncio  -- asyncio streams on one shared event loop
+                               (see app_async_transport.py).
+                   selector -- non-blocking sockets serviced by one shared
+                               selectors thread (see app_reactor.py), for
+                               processes running many sessions.
+
+               Both hand the received data to on_data(data) and report a lost
+               connection with on_closed(reason), from their own thread.
+               The threaded engine reads into one preallocated buffer with
+               recv_into() and passes a memoryview of it, which is only
+               valid during the call (copy what has to be kept).
+               TLS sockets (app_tls) are used non-blocking under a lock by
+               the threaded engine, they can not be read and written at the
+               same time.
+               Outgoing messages are queued; send() returns False instead of
+               blocking when too many are waiting.
+'''
+
+import os
+import select
+import socket
+import ssl
+import threading
+from collections import deque
+from pcr_app_utils import app_server_connection
+from pcr_app_utils import app_tls
+from pcr_app_utils.app_logging import app_log
+
+logger = app_log(__name__)
+
+ENGINE_THREADED = "threaded"
+ENGINE_ASYNCIO = "asyncio"
+ENGINE_SELECTOR = "selector"
+ENGINES = (ENGINE_THREADED, ENGINE_ASYNCIO, ENGINE_SELECTOR)
+
+# Engine used if none is given, can be set with the PCR_ENGINE variable.
+DEFAULT_ENGINE = os.environ.get("PCR_ENGINE", ENGINE_THREADED)
+
+# Most bytes read from the socket at once, can be set with the
+#   PCR_READ_SIZE variable.
+READ_SIZE = int(os.environ.get("PCR_READ_SIZE", "16384"))
+
+# Most messages waiting to be sent before send() refuses new ones.
+MAX_PENDING = 256
+
+# Most bytes written to the socket in one call.
+BATCH_BYTES = 64 * 1024
+
+# Seconds to wait for the pending messages to be sent when closing.
+CLOSE_TIMEOUT = 2
+
+
+def connect(host, port, engine=DEFAULT_ENGINE):
+    '''
+    Connect to the server with the given engine.
+    Returns the same dictionary as app_server_connection.connect_to_server
+    with the name of the engine added.
+    '''
+
+    if engine == ENGINE_ASYNCIO:
+        # Imported here, so the threaded engine does not load asyncio.
+        from pcr_app_utils import app_async_transport
+        connected = app_async_transport.connect_to_server(host, port)
+    else:
+        connected = app_server_connection.connect_to_server(host, port)
+
+    connected["engine"] = engine
+
+    return connected
+
+
+def create_transport(connected, on_data, on_closed):
+    ''' Return the transport for a connection made by connect(). '''
+
+    if connected["engine"] == ENGINE_ASYNCIO:
+        from pcr_app_utils import app_async_transport
+        return app_async_transport.AsyncTransport(connected,
+                                                  on_data,
+                                                  on_closed)
+
+    if connected["engine"] == ENGINE_SELECTOR:
+        from pcr_app_utils import app_reactor
+        return app_reactor.SelectorTransport(connected, on_data, on_closed)
+
+    return ThreadedTransport(connected, on_data, on_closed)
+
+
+def discard(connected):
+    ''' Close a connection made by connect() that is not going to be used. '''
+
+    if not connected["conn"]:
+        return
+
+    if connected["engine"] == ENGINE_ASYNCIO:
+        from pcr_app_utils import app_async_transport
+        app_async_transport.discard(connected)
+    else:
+        connected["sock"].close()
+
+    connected["conn"] = False
+    logger.debug(" unused connection has been closed.")
+
+
+class OutboundQueue():
+    '''
+    Bounded queue of the messages waiting to be sent.
+    put() never blocks, it returns False when the queue is full so the
+    caller can tell the user instead of freezing.
+    '''
+
+    def __init__(self, max_pending=MAX_PENDING):
+        self.max_pending = max_pending
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, data, force=False):
+        ''' Add a message, returns False if the queue is full or closed. '''
+
+        with self._cond:
+            if self._closed:
+                return False
+
+            if len(self._items) >= self.max_pending and not force:
+                return False
+
+            self._items.append(data)
+            self._cond.notify()
+
+        return True
+
+    def get_batch(self, max_bytes=BATCH_BYTES):
+        '''
+        Wait for messages and return the waiting ones joined into one
+        write of up to max_bytes. Returns None once the queue is closed and
+        empty.
+        '''
+
+        with self._cond:
+            while not self._items and not self._closed:
+                self._cond.wait()
+
+            return self._take(max_bytes)
+
+    def take_batch(self, max_bytes=BATCH_BYTES):
+        ''' Like get_batch(), but returns None right away if none wait. '''
+
+        with self._cond:
+            return self._take(max_bytes)
+
+    def _take(self, max_bytes):
+        if not self._items:
+            return None
+
+        batch = [self._items.popleft()]
+        size = len(batch[0])
+
+        # Add the messages sent back-to-back to the same write.
+        while self._items and size + len(self._items[0]) <= max_bytes:
+            size += len(self._items[0])
+            batch.append(self._items.popleft())
+
+        return b"".join(batch)
+
+    def close(self):
+        ''' Accept no more messages, the waiting ones are still handed out. '''
+
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class ThreadedTransport():
+    ''' A blocking socket serviced by a receive and a writer thread. '''
+
+    def __init__(self, connected, on_data, on_closed, read_size=READ_SIZE):
+        self.sock = connected["sock"]
+        self.on_data = on_data
+        self.on_closed = on_closed
+        self.read_size = read_size
+        self.outbound = OutboundQueue()
+
+        # Every read goes into the same buffer, no new bytes per read.
+        self._buffer = bytearray(read_size)
+        self._view = memoryview(self._buffer)
+
+        self._writer_thread = None
+        self._closed = False
+        self._abort_reason = None
+
+        # Taken for every read/write of a TLS socket, None for plain TCP.
+        self._tls_lock = None
+        if isinstance(self.sock, ssl.SSLSocket):
+            self._tls_lock = threading.Lock()
+            self._tls_server = (connected["host"], connected["port"])
+            self.sock.setblocking(False)
+
+    def start(self):
+        ''' Start the threads receiving and sending the messages. '''
+
+        receive_thread = threading.Thread(target=self._receive, daemon=True)
+        receive_thread.start()
+
+        self._writer_thread = threading.Thread(target=self._write,
+                                               daemon=True)
+        self._writer_thread.start()
+
+    def send(self, data, force=False):
+        '''
+        Queue data to be sent to the server. Returns False if too many
+        messages are waiting already (unless force is set).
+        '''
+
+        return self.outbound.put(data, force)
+
+    def pending(self):
+        ''' Return the number of messages waiting to be sent. '''
+
+        return len(self.outbound)
+
+    def close(self):
+        '''
+        Send the waiting messages and close the connection, the threads
+        end by themselves.
+        '''
+
+        if self._closed:
+            return
+
+        # Let the writer flush what is queued, then stop it.
+        self.outbound.close()
+        if self._writer_thread is not None:
+            self._writer_thread.join(CLOSE_TIMEOUT)
+
+        self._closed = True
+        self._shutdown()
+
+        self.sock.close()
+        logger.debug(" socket has been closed.")
+
+    def abort(self, reason):
+        '''
+        Drop a connection that has gone silent without sending the waiting
+        messages, it is reported with on_closed(reason).
+        '''
+
+        self._abort_reason = reason
+        self.outbound.close()
+        self._shutdown()
+
+    def _shutdown(self):
+        ''' Wake up the receive thread waiting for data. '''
+
+        try:
+            if self._tls_lock is not None:
+                with self._tls_lock:
+                    self.sock.shutdown(socket.SHUT_RDWR)
+            else:
+                self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _recv(self):
+        '''
+        Read the next data into the buffer, returns the number of bytes,
+        0 once the server closed.
+        '''
+
+        if self._tls_lock is None:
+            return self.sock.recv_into(self._buffer)
+
+        while True:
+            with self._tls_lock:
+                try:
+                    size = self.sock.recv_into(self._buffer)
+                except (ssl.SSLWantReadError, ssl.SSLWantWriteError):
+                    size = None
+
+            if size is not None:
+                break
+
+            # Wait for the rest of the record without holding the lock.
+            try:
+                select.select([self.sock], [], [])
+            except ValueError as error:
+                raise OSError("the socket has been closed") from error
+
+        # TLS 1.3 delivers the session ticket after the handshake.
+        if self._tls_server is not None:
+            app_tls.remember(*self._tls_server, self.sock)
+            self._tls_server = None
+
+        return size
+
+    def _sendall(self, data):
+        ''' Send all of the data. '''
+
+        if self._tls_lock is None:
+            # sendall() takes care of partial writes.
+            self.sock.sendall(data)
+            return
+
+        view = memoryview(data)
+
+        while view:
+            with self._tls_lock:
+                try:
+                    view = view[self.sock.send(view):]
+                    continue
+                except (ssl.SSLWantReadError, ssl.SSLWantWriteError):
+                    pass
+
+            # Wait until the socket takes more, without holding the lock.
+            try:
+                select.select([], [self.sock], [], 0.05)
+            except ValueError as error:
+                raise OSError("the socket has been closed") from error
+
+    def _write(self):
+        ''' Send the queued messages until the queue is closed. '''
+
+        while True:
+            batch = self.outbound.get_batch()
+
+            if batch is None:
+                break
+
+            try:
+                self._sendall(batch)
+            except OSError as error:
+                logger.error(" could not send to the server: %s", error)
+                self.outbound.close()
+                break
+
+    def _receive(self):
+        ''' Receive data from the server until the connection is closed. '''
+
+        reason = "closed by the server"
+
+        while not self._closed:
+            try:
+                # Receiving data from the server.
+                size = self._recv()
+
+            except ConnectionAbortedError:
+                reason = "connection has been aborted"
+                break
+
+            except OSError as error:
+                reason = str(error)
+                break
+
+            # An empty read means the server closed the connection.
+            if not size:
+                break
+
+            self.on_data(self._view[:size])
+
+        # Only report connections that were not closed by the app.
+        if not self._closed:
+            self._closed = True
+            self.outbound.close()
+            self.sock.close()
+            self.on_closed(self._abort_reason or reason)
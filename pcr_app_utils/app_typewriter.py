@@ -0,0 +1,152 @@
+#!/bin/env python3
+# -*- mode: python; coding: utf-8 -*-
+
+# Script by Thomas Pirchmoser (tommy_software@mailfence.com) 2024
+
+# This script was created for personal/educational purposes only and is not to
+#   be used for commercial or profit purposes.
+
+'''
+app_typewriter.py--module for "PrivateChatRoom-App" to display the messages
+               in a text widget as if typed in real time.
+
+               The letters are added by callbacks scheduled with 'after' on
+               the Tk event loop, so the animation never blocks the threads
+               receiving the messages. When messages pile up, the animation
+               speeds up and eventually shows everything at once.
+'''
+
+from collections import deque
+from pcr_app_utils.app_logging import app_log
+
+logger = app_log(__name__)
+
+# Milliseconds between two steps of the animation.
+TICK = 70
+
+# For every this many letters waiting behind the current message,
+#   one more letter is typed per step.
+SPEEDUP_CHARS = 20
+
+# Number of waiting letters at which everything is shown at once.
+INSTANT_CHARS = 500
+
+
+class Typewriter():
+    ''' Types text into a (disabled) Tk text widget letter by letter. '''
+
+    def __init__(self, widget, enabled=True):
+        self.widget = widget
+        self.enabled = enabled
+        self._pending = deque()
+        self._pending_chars = 0
+        self._current = ""
+        self._pos = 0
+        self._job = None
+
+    def write(self, text):
+        ''' Queue text to be typed into the widget. '''
+
+        self.write_many([text])
+
+    def write_many(self, texts):
+        ''' Queue several messages to be typed one after the other. '''
+
+        texts = [text for text in texts if text]
+
+        if not texts:
+            return
+
+        # Without the animation the text is shown right away.
+        if not self.enabled:
+            self._insert("".join(texts))
+            return
+
+        self._pending.extend(texts)
+        self._pending_chars += sum(len(text) for text in texts)
+
+        # Start the animation if it is not running yet.
+        if self._job is None:
+            self._job = self.widget.after(TICK, self._tick)
+
+    def set_enabled(self, enabled):
+        ''' Turn the animation on or off. '''
+
+        self.enabled = enabled
+
+        # Show whatever is still waiting when the animation is turned off.
+        if not enabled:
+            self.flush()
+
+        logger.debug(" typewriter effect enabled: %s", enabled)
+
+    def backlog(self):
+        ''' Return the number of letters not shown yet. '''
+
+        return self._pending_chars + len(self._current) - self._pos
+
+    def flush(self):
+        ''' Show all the waiting text at once and stop the animation. '''
+
+        text = self._current[self._pos:] + "".join(self._pending)
+
+        self.clear()
+        self._insert(text)
+
+    def clear(self):
+        ''' Drop the waiting text, e.g. when the widget shows another room. '''
+
+        if self._job is not None:
+            self.widget.after_cancel(self._job)
+            self._job = None
+
+        self._pending.clear()
+        self._pending_chars = 0
+        self._current = ""
+        self._pos = 0
+
+    def _tick(self):
+        ''' Type the next letters, called by the Tk event loop. '''
+
+        self._job = None
+
+        # Too much waiting, catch up in one go.
+        if self._pending_chars >= INSTANT_CHARS:
+            self.flush()
+            return
+
+        # Take the next message when the current one is done.
+        if self._pos >= len(self._current):
+            if not self._pending:
+                return
+
+            self._current = self._pending.popleft()
+            self._pending_chars -= len(self._current)
+            self._pos = 0
+
+        # Type faster while other messages are waiting.
+        step = 1 + self._pending_chars // SPEEDUP_CHARS
+
+        self._insert(self._current[self._pos:self._pos + step])
+        self._pos += step
+
+        if self._pos < len(self._current) or self._pending:
+            self._job = self.widget.after(TICK, self._tick)
+
+    def _insert(self, text):
+        ''' Add text to the end of the widget and scroll down. '''
+
+        if not text:
+            return
+
+        # Only follow new messages if the user is not reading older ones.
+        at_bottom = self.widget.yview()[1] >= 1.0
+
+        self.widget.config(state="normal")
+        self.widget.insert("end", text)
+
+        # Auto scroll down to see new messages.
+        if at_bottom:
+            self.widget.yview("end")
+
+        self.widget.config(state="disabled")
@@ -0,0 +1,98 @@
+#!/bin/env python3
+# -*- mode: python; coding: utf-8 -*-
+
+# Script by Thomas Pirchmoser (tommy_software@mailfence.com) 2024
+
+# This script was created for personal/educational purposes only and is not to
+#   be used for commercial or profit purposes.
+
+'''
+app_ui_queue.py--module for "PrivateChatRoom-App" to pass updates from the
+               network threads to the GUI.
+
+               Tkinter widgets may only be touched by the thread running the
+               mainloop, so the other threads post events to a queue which
+               the GUI drains periodically with 'after'.
+'''
+
+import queue
+from collections import namedtuple
+from pcr_app_utils.app_logging import app_log
+
+logger = app_log(__name__)
+
+# Event types.
+EVENT_CHAT = "chat"
+EVENT_ROSTER = "roster"
+EVENT_CALL = "call"
+
+# Most events handled in one drain, so the GUI stays responsive.
+DRAIN_LIMIT = 1000
+
+# Result of a drain: the chat lines in order as (room, text), the latest
+#   roster text of the rooms whose roster changed ({room: text}) and the
+#   other events in order.
+Batch = namedtuple("Batch", ["chat", "roster", "other"])
+
+
+class UiQueue():
+    ''' Thread-safe queue of events for the GUI. '''
+
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+
+    def post(self, kind, value):
+        '''
+        Add an event, can be called from any thread. The value of chat and
+        roster events is (room, text).
+        '''
+
+        self._queue.put((kind, value))
+
+    def call(self, func, *args):
+        ''' Have a function run on the GUI thread during the next drain. '''
+
+        self._queue.put((EVENT_CALL, (func, args)))
+
+    def depth(self):
+        ''' Return the number of events waiting. '''
+
+        return self._queue.qsize()
+
+    def drain(self, limit=DRAIN_LIMIT):
+        '''
+        Take the waiting events out of the queue.
+        Chat lines are collected in order and the roster updates are
+        collapsed to the most recent one of every room.
+        '''
+
+        chat = []
+        roster = {}
+        other = []
+
+        for _ in range(limit):
+            try:
+                kind, value = self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+            if kind == EVENT_CHAT:
+                chat.append(value)
+            elif kind == EVENT_ROSTER:
+                room, text = value
+                roster[room] = text
+            else:
+                other.append((kind, value))
+
+        return Batch(chat, roster, other)
+
+
+if __name__ == "__main__":
+    ui_queue = UiQueue()
+    for number in range(5):
+        ui_queue.post(EVENT_ROSTER, ("main", f"{number} online..."))
+        ui_queue.post(EVENT_CHAT, ("main", f"test: message {number}\n"))
+
+    batch = ui_queue.drain()
+    logger.info("[APP_UI_QUEUE_TEST]: %s chat lines, roster %r",
+                len(batch.chat), batch.roster)